@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+from threading import Lock, Thread
+
+from django.conf import settings # type:ignore
+from django.db import DatabaseError, IntegrityError, connections, transaction # type:ignore
+from django.db.models import F # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+
+logger = logging.getLogger(__name__)
+
+USAGE_FIELDS = ('requests', 'wall_ms', 'db_ms', 'rows', 'bytes_sent')
+
+
+def request_business_id(request):
+    """
+    The business a request worked on: the one BusinessMixin resolved and
+    checked the user owns. Requests that only named a business in their
+    URL are not charged to it.
+    """
+    business = getattr(request, 'business', None)
+    return business.id if business is not None else None
+
+
+class TenantMeter:
+    """
+    Per-process usage totals of each business, added to the hourly
+    TenantUsage rollup at most every TENANT_USAGE_FLUSH_INTERVAL seconds.
+
+    Requests only hand the totals to a thread of their own to write
+    (flush_in_background), and gunicorn's worker_exit hook writes what is
+    left when a worker exits (gunicorn.conf.py).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def record(self, business_id, wall_ms, db_ms, rows, bytes_sent):
+        with self._lock:
+            if os.getpid() != self.pid:
+                self._reset()
+            totals = self.pending.setdefault(business_id, [0, 0.0, 0.0, 0, 0])
+            for i, amount in enumerate((1, wall_ms, db_ms, rows, bytes_sent)):
+                totals[i] += amount
+
+    def _take(self, force):
+        """The pending totals if they are due, which starts a new interval."""
+        with self._lock:
+            if os.getpid() != self.pid:
+                self._reset()
+            if not force and time.monotonic() - self.flushed_at < settings.TENANT_USAGE_FLUSH_INTERVAL:
+                return None
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        return pending
+
+    def flush(self, force=False):
+        pending = self._take(force)
+        if pending:
+            self._write(pending)
+
+    def flush_in_background(self):
+        pending = self._take(force=False)
+        if pending:
+            Thread(target=self._write_in_thread, args=(pending,), daemon=True).start()
+
+    def _write_in_thread(self, pending):
+        try:
+            self._write(pending)
+        finally:
+            connections.close_all()
+
+    def _write(self, pending):
+        period = now().replace(minute=0, second=0, microsecond=0)
+        try:
+            # Skip businesses deleted since, their rows would fail the foreign key
+            existing = set(api_models.Business.objects.filter(id__in=pending).values_list('id', flat=True))
+            with transaction.atomic():
+                for business_id in existing:
+                    add_usage(business_id, period, dict(zip(USAGE_FIELDS, pending[business_id])))
+        except DatabaseError:
+            logger.exception("Dropped usage of %d businesses", len(pending))
+
+
+meter = TenantMeter()
+
+
+def add_usage(business_id, period, amounts):
+    rollup = api_models.TenantUsage.objects.filter(business_id=business_id, period=period)
+    increments = {field: F(field) + amount for field, amount in amounts.items()}
+    if rollup.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            api_models.TenantUsage.objects.create(business_id=business_id, period=period, **amounts)
+    except IntegrityError:
+        # Another worker created the row first
+        rollup.update(**increments)
+
+def record_request(request, wall_ms, db_ms, rows, bytes_sent):
+    business_id = request_business_id(request)
+    if business_id is not None:
+        meter.record(business_id, wall_ms, db_ms, rows, bytes_sent)
+    meter.flush_in_background()
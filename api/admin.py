@@ -1,4 +1,7 @@
+from datetime import timedelta # type:ignore
 from django.contrib import admin # type:ignore
+from django.db.models import F, Q, Sum # type:ignore
+from django.utils.timezone import now # type:ignore
 from . import models as api_models
 
 class InvoiceItemAdminModel(admin.TabularInline):
@@ -7,6 +10,72 @@ class InvoiceItemAdminModel(admin.TabularInline):
 class InvoiceAdminModel(admin.ModelAdmin):
     inlines = [InvoiceItemAdminModel]
 
+class RequestProfileAdminModel(admin.ModelAdmin):
+    list_display = ['date_created', 'method', 'path', 'business', 'status_code', 'duration_ms', 'query_count', 'stats']
+    list_filter = ['method', 'status_code']
+    search_fields = ['path', 'route']
+    readonly_fields = ['user', 'business', 'method', 'path', 'route', 'status_code', 'duration_ms', 'query_count', 'queries', 'stats', 'date_created']
+
+class TenantCostWindowFilter(admin.SimpleListFilter):
+    """Totals the TenantUsage rollup of each business over the chosen window."""
+    title = "usage window"
+    parameter_name = "days"
+    default_days = 7
+
+    def lookups(self, request, model_admin):
+        return [("1", "Last 24 hours"), ("7", "Last 7 days"), ("30", "Last 30 days")]
+
+    def queryset(self, request, queryset):
+        days = int(self.value()) if self.value() in ("1", "7", "30") else self.default_days
+        window = Q(usage__period__gte=now() - timedelta(days=days))
+        return queryset.annotate(**{
+            f"total_{field}": Sum(f"usage__{field}", filter=window) for field in ('requests', 'wall_ms', 'db_ms', 'rows', 'bytes_sent')
+        })
+
+class TenantCostAdminModel(admin.ModelAdmin):
+    """Businesses ranked by the database time their requests cost."""
+    list_display = ['name', 'owner', 'requests', 'wall_seconds', 'db_seconds', 'rows', 'megabytes_sent']
+    list_filter = [TenantCostWindowFilter]
+    search_fields = ['name', 'slug']
+    list_select_related = ['owner']
+
+    def get_ordering(self, request):
+        return [F('total_db_ms').desc(nulls_last=True)]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(ordering='total_requests')
+    def requests(self, obj):
+        return obj.total_requests or 0
+
+    @admin.display(ordering='total_wall_ms')
+    def wall_seconds(self, obj):
+        return round((obj.total_wall_ms or 0) / 1000, 1)
+
+    @admin.display(ordering='total_db_ms')
+    def db_seconds(self, obj):
+        return round((obj.total_db_ms or 0) / 1000, 1)
+
+    @admin.display(ordering='total_rows')
+    def rows(self, obj):
+        return obj.total_rows or 0
+
+    @admin.display(ordering='total_bytes_sent')
+    def megabytes_sent(self, obj):
+        return round((obj.total_bytes_sent or 0) / 1024 / 1024, 2)
+
+class SlowQueryAdminModel(admin.ModelAdmin):
+    list_display = ['fingerprint', 'view', 'count', 'max_ms', 'total_ms', 'last_seen']
+    search_fields = ['fingerprint', 'view']
+    readonly_fields = ['fingerprint_hash', 'fingerprint', 'sql', 'params', 'view', 'plan', 'count', 'total_ms', 'max_ms', 'first_seen', 'last_seen']
+
 admin.site.register(api_models.LoginToken)
 admin.site.register(api_models.Business,)
 admin.site.register(api_models.Category,)
@@ -16,3 +85,8 @@ admin.site.register(api_models.Product)
 admin.site.register(api_models.Receipt)
 admin.site.register(api_models.Notification)
 admin.site.register(api_models.InvoiceAccessToken)
+admin.site.register(api_models.PlanUsage)
+admin.site.register(api_models.RequestProfile, RequestProfileAdminModel)
+admin.site.register(api_models.TenantUsage)
+admin.site.register(api_models.TenantCost, TenantCostAdminModel)
+admin.site.register(api_models.SlowQuery, SlowQueryAdminModel)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from api import checks, signals  # noqa: F401
+        from api.shards import reserve_id_range
+        from api.slowlog import install
+
+        connection_created.connect(install, dispatch_uid='api_slow_query_log')
+        post_migrate.connect(reserve_id_range, sender=self, dispatch_uid='api_shard_id_range')
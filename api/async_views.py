@@ -0,0 +1,163 @@
+"""
+Async versions of the read-heavy dashboard endpoints.
+
+Under an ASGI worker these run on the event loop instead of a thread per
+request. They answer like their DRF counterparts in api/views.py and
+take the same `Authorization: Token <key>` header.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async # type:ignore
+from django.db.models import Count, Q, Sum # type:ignore
+from django.db.models.functions import ExtractMonth # type:ignore
+from django.http import HttpResponse # type:ignore
+from rest_framework import status # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from api import models as api_models
+from api import serializer as api_serializer
+from api.mixins import aresolve_business
+from api.overview import bump_overview
+from api.renderers import renderer_for
+from api.shards import alocate
+from api.views import INVOICE_LIST_FIELDS, OWNER_PREFETCH, invoice_list_queryset, refresh_invoices, refreshed_updates
+
+
+def api_response(request, data, status_code=status.HTTP_200_OK):
+    """`data` rendered like DRF would for the Accept header of `request`."""
+    renderer = renderer_for(request)
+    return HttpResponse(renderer.render(data), status=status_code, content_type=renderer.media_type)
+
+async def aauthenticate(request):
+    """The user of a valid `Token <key>` Authorization header, or None."""
+    # Already authenticated by a batch (api.batch), like DRF's forced authentication
+    user = getattr(request, '_force_auth_user', None)
+    if user is not None:
+        return user
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=header[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+def async_api_view(view):
+    """
+    GET-only, token authenticated async view. Unknown businesses and
+    businesses of other users answer 404 like BusinessMixin does.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return api_response(request, {"detail": f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED)
+        user = await aauthenticate(request)
+        if user is None:
+            return api_response(request, {"detail": "Authentication credentials were not provided."}, status.HTTP_401_UNAUTHORIZED)
+        request.user = user
+        try:
+            return await view(request, *args, **kwargs)
+        except api_models.Business.DoesNotExist:
+            return api_response(request, {"detail": "Business not found"}, status.HTTP_404_NOT_FOUND)
+    return wrapper
+
+
+@async_api_view
+async def invoice_list(request, business_id):
+    business = await aresolve_business(request, business_id)
+    # Iterating a queryset asynchronously also runs its prefetches
+    queryset = api_serializer.InvoiceSerializer.narrow_queryset(invoice_list_queryset(business), request, keep=INVOICE_LIST_FIELDS)
+    invoices = [invoice async for invoice in queryset]
+    changed = refresh_invoices(invoices)
+    if changed:
+        for rows, values in refreshed_updates(changed):
+            await rows.aupdate(**values)
+        await sync_to_async(bump_overview)(business.owner_id)
+    return api_response(request, api_serializer.InvoiceSerializer(invoices, many=True, context={'request': request}).data)
+
+@async_api_view
+async def invoice_detail(request, Uid):
+    invoices = (
+        api_models.Invoice.objects
+        .select_related('customer', 'signature', 'recurring_parent')
+        .prefetch_related('business', *OWNER_PREFETCH)
+    )
+    try:
+        invoice = await alocate(invoices, Uid=Uid)
+        await aresolve_business(request, invoice.business_id)
+    except (api_models.Invoice.DoesNotExist, api_models.Business.DoesNotExist):
+        # Invoices of other users are not found either, like InvoiceView
+        return api_response(request, {"error": "Invoice not found"}, status.HTTP_404_NOT_FOUND)
+
+    total = await invoice.invoice_item_set.aaggregate(total=Sum('quantity') * Sum('product__price'))
+    invoice.items_total = total['total']
+    changed = refresh_invoices([invoice])
+    if changed:
+        for rows, values in refreshed_updates(changed):
+            await rows.aupdate(**values)
+        await sync_to_async(bump_overview)(invoice.owner_id)
+    return api_response(request, api_serializer.InvoiceSerializer(invoice, context={'request': request}).data)
+
+@async_api_view
+async def product_list(request, business_id):
+    business = await aresolve_business(request, business_id)
+    queryset = api_serializer.ProductSerializer.narrow_queryset(business.product_set.select_related('category'), request)
+    products = [product async for product in queryset.aiterator()]
+    return api_response(request, api_serializer.ProductSerializer(products, many=True, context={'request': request}).data)
+
+@async_api_view
+async def customer_list(request, business_id):
+    business = await aresolve_business(request, business_id)
+    queryset = api_serializer.CustomerSerializer.narrow_queryset(business.customer_set.all(), request)
+    customers = [customer async for customer in queryset.aiterator()]
+    return api_response(request, api_serializer.CustomerSerializer(customers, many=True, context={'request': request}).data)
+
+@async_api_view
+async def notification_list(request):
+    business_id = request.GET.get('business_id')
+    if not business_id:
+        return api_response(request, {"error": "Business ID is required"}, status.HTTP_400_BAD_REQUEST)
+    business = await aresolve_business(request, business_id)
+    queryset = api_serializer.NotificationSerializer.narrow_queryset(business.noti_business.all(), request)
+    notifications = [notification async for notification in queryset.aiterator()]
+    return api_response(request, api_serializer.NotificationSerializer(notifications, many=True, context={'request': request}).data)
+
+@async_api_view
+async def admin_counters(request, business_id):
+    business = await aresolve_business(request, business_id)
+    # Django runs the ORM calls of one request on a single thread, so the
+    # statements still reach the database one by one, but the event loop
+    # is free while they do.
+    invoice_counts, customers, products = await asyncio.gather(
+        business.business.aaggregate(
+            invoices=Count('id'),
+            draft_invoices=Count('id', filter=Q(status="draft")),
+            paid_invoices=Count('id', filter=Q(status="paid")),
+            unpaid_invoices=Count('id', filter=Q(status="unpaid")),
+            pending_invoices=Count('id', filter=Q(status="pending")),
+        ),
+        business.customer_set.acount(),
+        business.product_set.acount(),
+    )
+    data = [{**invoice_counts, "customers": customers, "products": products}]
+    return api_response(request, api_serializer.InvoiceAdminSerializer(data, many=True).data)
+
+@async_api_view
+async def dashboard_stats(request, business_id):
+    business = await aresolve_business(request, business_id)
+    months = business.business.annotate(month=ExtractMonth("date_created")).values("month")
+    invoice_data = [row async for row in months.annotate(invoices=Count("id")).values("month", "invoices")]
+    return api_response(request, api_serializer.DashboardStatsSerializer(invoice_data, many=True).data)
+
+@async_api_view
+async def invoice_stats(request, business_id):
+    business = await aresolve_business(request, business_id)
+    months = business.business.annotate(month=ExtractMonth("date_created")).values("month")
+    invoice_data = [
+        row async for row in months.annotate(
+            invoices=Count("id"),
+            paid=Count('id', filter=Q(status='paid')),
+        ).values("month", "invoices", "paid")
+    ]
+    return api_response(request, api_serializer.InvoiceStatsSerializer(invoice_data, many=True).data)
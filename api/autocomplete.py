@@ -0,0 +1,83 @@
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import cache # type:ignore
+from api import models as api_models
+from api.metrics import cache_lookup
+
+# kind -> (model, business column, name field, extra display fields)
+AUTOCOMPLETE_SOURCES = {
+    'customer': (api_models.Customer, 'business_id', 'full_name', ('email',)),
+    'product': (api_models.Product, 'owner_id', 'name', ('price',)),
+    'category': (api_models.Category, 'business_id', 'name', ()),
+}
+
+# Per-process indexes, least recently used first. One is rebuilt after
+# INDEX_MAX_AGE seconds even if no bump reached this process.
+MAX_INDEXES = 512
+INDEX_MAX_AGE = 300
+_indexes = OrderedDict()
+_lock = Lock()
+
+
+def version_key(kind, business_id):
+    return f'autocomplete_version_{kind}_{business_id}'
+
+def bump_version(kind, business_id):
+    """
+    Invalidate the index of one business in every worker process, which
+    see the version through the shared cache (speedvoice_backend.caches).
+    """
+    key = version_key(kind, business_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+def _build_index(kind, business_id):
+    model, business_column, name_field, extra_fields = AUTOCOMPLETE_SOURCES[kind]
+    rows = sorted(
+        model.objects.filter(**{business_column: business_id}).values('id', name_field, *extra_fields),
+        key=lambda row: row[name_field].casefold(),
+    )
+    keys = [row[name_field].casefold() for row in rows]
+    return keys, rows
+
+def autocomplete(kind, business_id, prefix, limit=10):
+    """
+    Return up to `limit` rows of `kind` whose name starts with `prefix`,
+    ignoring case, in name order.
+
+    The names of a business are kept sorted in memory, so a lookup is a
+    binary search. The index is rebuilt when the version in the shared
+    cache moves, which the model signals do on every write, or when it
+    is INDEX_MAX_AGE seconds old.
+    """
+    version = cache.get(version_key(kind, business_id), 0)
+    index_key = (kind, business_id)
+
+    with _lock:
+        entry = _indexes.get(index_key)
+        if entry is not None:
+            _indexes.move_to_end(index_key)
+
+    current = entry is not None and entry[0] == version and time.monotonic() - entry[1] < INDEX_MAX_AGE
+    cache_lookup('autocomplete_index', current)
+    if not current:
+        entry = (version, time.monotonic(), *_build_index(kind, business_id))
+        with _lock:
+            _indexes[index_key] = entry
+            _indexes.move_to_end(index_key)
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+
+    _, _, keys, rows = entry
+    folded = prefix.casefold()
+    position = bisect_left(keys, folded)
+    matches = []
+    while position < len(keys) and len(matches) < limit and keys[position].startswith(folded):
+        matches.append(rows[position])
+        position += 1
+    return matches
@@ -0,0 +1,144 @@
+"""
+Several API GETs in one round trip.
+
+run_batch() dispatches relative API paths (`dashboard/admin/1/`,
+`dashboard/notifications/?business_id=1`, ...) straight to their views
+through the resolver of api/urls.py, skipping the middleware, and
+returns every response in one list.
+
+The sub-requests share the user the batch authenticated (as DRF's
+forced authentication, which the async views honour too) and the
+business identity map of the batch (api.mixins.get_business_map), so
+each business is looked up once. Each gets its own shard routing, as
+they may be for different businesses, and runs inside the replica
+routing of the batch, so they all read from the same replica.
+
+With `concurrent` they run on a thread pool, each thread with its own
+database connections, closed when it is done.
+
+As the middleware would, each sub-request records its own queries: it
+is held to the query budget of its route, charged to its business and
+logged and measured under its route, and its entry carries its own
+Server-Timing. Its queries are left out of the batch's.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import copy_context
+from inspect import iscoroutinefunction
+
+import orjson # type:ignore
+from asgiref.sync import async_to_sync # type:ignore
+from django.db import connections # type:ignore
+from django.http import HttpRequest, QueryDict # type:ignore
+from django.urls import Resolver404, resolve # type:ignore
+from rest_framework import status # type:ignore
+from api.instrumentation import QueryRecorder, paused
+from api.middleware import finish_request, record_queries
+from api.mixins import get_business_map
+from api.shards import ShardRouting, shard_routing
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+
+def sub_request(request, prefix, path):
+    """A GET of `path` (relative to `prefix`) made by the user of `request`."""
+    path, _, query = path.partition('?')
+    http_request = getattr(request, '_request', request)
+    sub = HttpRequest()
+    sub.method = 'GET'
+    sub.path = sub.path_info = prefix + path
+    sub.META = {
+        **http_request.META,
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': sub.path, 'QUERY_STRING': query,
+        # Sub-responses are decoded into the envelope, which is negotiated as a whole
+        'HTTP_ACCEPT': 'application/json',
+    }
+    sub.GET = QueryDict(query)
+    sub.COOKIES = http_request.COOKIES
+    sub.user = request.user
+    sub._force_auth_user = request.user
+    sub._force_auth_token = getattr(request, 'auth', None)
+    sub._business_map = get_business_map(request)
+    return sub
+
+def response_body(response):
+    data = getattr(response, 'data', None)
+    if data is not None or not response.content:
+        return data
+    if 'json' in response.get('Content-Type', ''):
+        return orjson.loads(response.content)
+    return response.content.decode(response.charset)
+
+@contextmanager
+def own_shard_routing():
+    parent = shard_routing.get()
+    if parent is None:
+        yield
+        return
+    state = ShardRouting()
+    state.placements = parent.placements
+    token = shard_routing.set(state)
+    try:
+        yield
+    finally:
+        shard_routing.reset(token)
+
+def dispatch(request, prefix, path, exclude):
+    """Run one sub-request, returns its envelope entry."""
+    entry = {"path": path}
+    if path.startswith('/'):
+        return {**entry, "status": status.HTTP_400_BAD_REQUEST, "body": {"detail": "Paths are relative to the API root."}}
+    sub = sub_request(request, prefix, path)
+    try:
+        # The full path, so the route is the one budgets and metrics know it by
+        match = resolve(sub.path)
+    except Resolver404:
+        return {**entry, "status": status.HTTP_404_NOT_FOUND, "body": {"detail": "Not found."}}
+    if match.func in exclude:
+        return {**entry, "status": status.HTTP_400_BAD_REQUEST, "body": {"detail": "Batches cannot be nested."}}
+
+    sub.resolver_match = match
+    view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+    recorder = QueryRecorder()
+    sub.query_recorder = recorder
+    start = time.perf_counter()
+    try:
+        # async_to_sync views run their ORM calls back on this thread
+        with own_shard_routing(), record_queries(ExitStack(), recorder):
+            response = view(sub, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+    except Exception:
+        logger.exception("Batched request to %s failed", path)
+        return {**entry, "status": status.HTTP_500_INTERNAL_SERVER_ERROR, "body": {"detail": "A server error occurred."}}
+    finish_request(sub, response, recorder, start)
+    return {**entry, "status": response.status_code, "body": response_body(response), "server_timing": response['Server-Timing']}
+
+def _dispatch_in_thread(context, *args):
+    try:
+        return context.run(dispatch, *args)
+    finally:
+        connections.close_all()
+
+def run_batch(request, prefix, paths, concurrent=False, exclude=()):
+    """
+    The envelope entries of GETs to `paths` on behalf of `request`, in
+    order. `exclude` are views that cannot be batched.
+    """
+    if not concurrent or len(paths) < 2:
+        # The sub-requests record their own queries on these connections
+        with paused(getattr(request, 'query_recorder', None)):
+            return [dispatch(request, prefix, path, exclude) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(len(paths), BATCH_MAX_WORKERS)) as executor:
+        # Each thread runs in a copy of the batch's context (replica and shard
+        # routing), on connections the batch's recorder isn't installed on
+        futures = [
+            executor.submit(_dispatch_in_thread, copy_context(), request, prefix, path, exclude)
+            for path in paths
+        ]
+        return [future.result() for future in futures]
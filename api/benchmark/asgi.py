@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from django.core.handlers.asgi import ASGIHandler # type:ignore
+from django.core.handlers.wsgi import WSGIHandler # type:ignore
+from api.benchmark.runner import API_PREFIX, percentile
+from api.benchmark.startup import wsgi_get
+
+# (sync route, async mirror) pairs compared by bench_asgi
+ROUTE_PAIRS = {
+    'invoices': ('dashboard/invoices/{business}/', 'async/dashboard/invoices/{business}/'),
+    'invoice': ('dashboard/invoice/{invoice}/', 'async/dashboard/invoice/{invoice}/'),
+    'products': ('dashboard/products/{business}/', 'async/dashboard/products/{business}/'),
+    'customers': ('dashboard/customers/{business}/', 'async/dashboard/customers/{business}/'),
+    'notifications': ('dashboard/notifications/?business_id={business}', 'async/dashboard/notifications/?business_id={business}'),
+    'admin': ('dashboard/admin/{business}/', 'async/dashboard/admin/{business}/'),
+    'stats': ('dashboard/invoice/admin/stats/{business}/', 'async/dashboard/invoice/admin/stats/{business}/'),
+}
+
+
+def _split(path):
+    path, _, query = (API_PREFIX + path).partition('?')
+    return path, query
+
+def _summary(latencies, elapsed):
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+def wsgi_throughput(path, token, requests):
+    """One sync worker: requests are served one after the other."""
+    handler = WSGIHandler()
+    path, query = _split(path)
+    started = time.perf_counter()
+    latencies = [wsgi_get(handler, path, query, token) for _ in range(requests)]
+    return _summary(latencies, time.perf_counter() - started)
+
+async def _asgi_request(application, path, query, token):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'authorization', f'Token {token}'.encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    sent = asyncio.Event()
+
+    async def receive():
+        if sent.is_set():
+            # The handler listens for a disconnect while the view runs
+            await asyncio.Event().wait()
+        sent.set()
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    await application(scope, receive, send)
+
+async def _asgi_throughput(path, token, requests, concurrency):
+    application = ASGIHandler()
+    path, query = _split(path)
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            await _asgi_request(application, path, query, token)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return _summary(latencies, time.perf_counter() - started)
+
+def asgi_throughput(path, token, requests, concurrency):
+    """One ASGI worker with `concurrency` clients in flight."""
+    return asyncio.run(_asgi_throughput(path, token, requests, concurrency))
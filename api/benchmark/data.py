@@ -0,0 +1,122 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password # type:ignore
+from django.db import transaction # type:ignore
+from django.utils.timezone import now # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from userauth.models import User
+from api import models as api_models
+
+BENCH_PASSWORD = "pass1000"
+
+
+def seed_tenants(businesses=1, invoices=100, items_per_invoice=3, customers=50, products=50,
+                 categories=5, receipts=10, notifications=20, batch_size=2000, seed=0, log=print):
+    """
+    Bulk insert `businesses` synthetic tenants, each with its own owner.
+
+    Every tenant gets the given number of categories, customers,
+    products, notifications and invoices. Each invoice gets
+    `items_per_invoice` items, and the first `receipts` invoices get a
+    receipt. Rows are written with bulk_create in batches of
+    `batch_size`, so 1 business with 100k invoices and 1M items, or 10k
+    small businesses, both run in bounded memory.
+
+    Returns the ids of the created businesses.
+    """
+    rng = random.Random(seed)
+    run = f"{time.time_ns()}{rng.randrange(1000):03d}"
+    password = make_password(BENCH_PASSWORD)
+    started = time.monotonic()
+    business_ids = []
+
+    owner_batch = max(1, min(batch_size, 500))
+    for tenant_start in range(0, businesses, owner_batch):
+        tenant_numbers = range(tenant_start, min(businesses, tenant_start + owner_batch))
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    email=f"bench-{run}-{n}@example.com", username=f"bench{n}", fullname=f"Bench Owner {n}",
+                    password=password, hasAccess=True, product_type="premium",
+                )
+                for n in tenant_numbers
+            ])
+            Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users])
+            tenants = api_models.Business.objects.bulk_create([
+                api_models.Business(
+                    owner=user, name=f"Bench Business {n}", slug=f"bench-{run}-{n}",
+                    country="Nigeria", state="Lagos", city="Ikeja", currency="USD", active=True,
+                )
+                for n, user in zip(tenant_numbers, users)
+            ])
+            api_models.PlanUsage.objects.bulk_create([
+                api_models.PlanUsage(user=user, invoices=invoices, businesses=1) for user in users
+            ])
+
+            category_rows = api_models.Category.objects.bulk_create([
+                api_models.Category(business=business, name=f"Category {c}")
+                for business in tenants for c in range(categories)
+            ], batch_size=batch_size)
+            customer_rows = api_models.Customer.objects.bulk_create([
+                api_models.Customer(
+                    business=business, full_name=f"Customer {c} {rng.choice(['Ade', 'Bola', 'Chidi', 'Dayo'])}",
+                    email=f"customer{c}@example.com", phone_number=f"080{c:08d}",
+                )
+                for business in tenants for c in range(customers)
+            ], batch_size=batch_size)
+            product_rows = api_models.Product.objects.bulk_create([
+                api_models.Product(
+                    owner=business, name=f"Product {p}", price=Decimal(rng.randrange(100, 100000)) / 100,
+                    category=category_rows[i * categories + p % categories] if categories else None,
+                )
+                for i, business in enumerate(tenants) for p in range(products)
+            ], batch_size=batch_size)
+            api_models.Notification.objects.bulk_create([
+                api_models.Notification(business=business, title="Bench notification", description="Synthetic", type="other")
+                for business in tenants for _ in range(notifications)
+            ], batch_size=batch_size)
+
+        for i, business in enumerate(tenants):
+            tenant_customers = customer_rows[i * customers:(i + 1) * customers]
+            tenant_products = product_rows[i * products:(i + 1) * products]
+            _seed_invoices(rng, business, tenant_customers, tenant_products, invoices, items_per_invoice, receipts, batch_size)
+            business_ids.append(business.id)
+
+        log(f"Seeded {len(business_ids)}/{businesses} businesses in {time.monotonic() - started:.1f}s")
+
+    return business_ids
+
+def _seed_invoices(rng, business, customers, products, invoices, items_per_invoice, receipts, batch_size):
+    statuses = [status for status, _ in api_models.INVOICE_STATUS]
+    invoice_batch = max(1, batch_size // max(1, items_per_invoice))
+
+    for start in range(0, invoices, invoice_batch):
+        count = min(invoice_batch, invoices - start)
+        with transaction.atomic():
+            rows = []
+            for n in range(start, start + count):
+                total = Decimal(rng.randrange(1000, 1000000)) / 100
+                rows.append(api_models.Invoice(
+                    owner_id=business.owner_id, business=business,
+                    customer=rng.choice(customers) if customers else None,
+                    title=f"Invoice {n}", description="Synthetic benchmark invoice",
+                    status=rng.choice(statuses), total=total, grand_total=total,
+                    date_due=now() + timedelta(days=rng.randrange(-60, 60)),
+                ))
+            rows = api_models.Invoice.objects.bulk_create(rows)
+
+            if products and items_per_invoice:
+                api_models.Invoice_item.objects.bulk_create([
+                    api_models.Invoice_item(invoice=invoice, product=rng.choice(products), quantity=rng.randrange(1, 10))
+                    for invoice in rows for _ in range(items_per_invoice)
+                ], batch_size=batch_size)
+
+            receipt_rows = rows[:max(0, receipts - start)]
+            api_models.Receipt.objects.bulk_create([
+                api_models.Receipt(owner_id=business.owner_id, business=business, customer=invoice.customer, invoice=invoice)
+                for invoice in receipt_rows
+            ])
@@ -0,0 +1,264 @@
+import logging
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from django.db import connection # type:ignore
+from django.test import Client # type:ignore
+from django.utils.timezone import now # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from rest_framework_simplejwt.tokens import RefreshToken # type:ignore
+from api import models as api_models
+from api import urls as api_urls
+from api.benchmark.data import BENCH_PASSWORD
+from api.instrumentation import QueryRecorder
+
+API_PREFIX = "/api/v1/"
+
+
+@dataclass
+class Tenant:
+    """The rows of one seeded business that endpoint requests refer to."""
+    business: api_models.Business
+    token: str
+    invoice: api_models.Invoice
+    item: api_models.Invoice_item
+    customer: api_models.Customer
+    product: api_models.Product
+    category: api_models.Category
+    receipt: api_models.Receipt = None
+    counter: int = 0
+
+    @classmethod
+    def load(cls, business):
+        invoice = business.business.exclude(customer=None).order_by('id').first()
+        return cls(
+            business=business,
+            token=Token.objects.get_or_create(user=business.owner)[0].key,
+            invoice=invoice,
+            item=invoice.invoice_item_set.order_by('id').first(),
+            customer=invoice.customer,
+            product=business.product_set.order_by('id').first(),
+            category=business.category_set.order_by('id').first(),
+            receipt=business.business_receipt.order_by('id').first(),
+        )
+
+    def next(self):
+        self.counter += 1
+        return self.counter
+
+    @property
+    def user(self):
+        return self.business.owner
+
+    def new_invoice(self):
+        invoice = api_models.Invoice(
+            owner=self.user, business=self.business, customer=self.customer,
+            title="Bench invoice", description="Created by the benchmark", date_due=now(),
+        )
+        invoice.save()
+        return invoice
+
+
+@dataclass
+class Endpoint:
+    """How to issue one request against a route of api/urls.py."""
+    route: str
+    method: str
+    build: callable
+    writes: bool = False
+
+    @property
+    def name(self):
+        return f"{self.method.upper()} {self.route}"
+
+
+def dashboard_paths(tenant):
+    """What the dashboard page requests on load."""
+    business_id = tenant.business.id
+    return [
+        f'dashboard/admin/{business_id}/',
+        f'dashboard/admin/stats/{business_id}/',
+        f'dashboard/invoice/admin/stats/{business_id}/',
+        f'dashboard/notifications/?business_id={business_id}',
+        f'dashboard/invoices/{business_id}/',
+    ]
+
+def dashboard_batch(tenant, concurrent=False):
+    """Query string of a batch/ request for the dashboard page."""
+    query = [('path', path) for path in dashboard_paths(tenant)]
+    return urlencode(query + [('concurrent', '1')] if concurrent else query)
+
+def endpoints():
+    b = lambda t: t.business.id
+    return [
+        Endpoint('user/token/', 'post', lambda t: ('user/token/', {'email': t.user.email, 'password': BENCH_PASSWORD})),
+        Endpoint('user/token/refresh/', 'post', lambda t: ('user/token/refresh/', {'refresh': str(RefreshToken.for_user(t.user))})),
+        Endpoint('user/', 'get', lambda t: (f'user/?email={t.user.email}', None)),
+        Endpoint('auth/check-user-email/', 'post', lambda t: ('auth/check-user-email/', {'email': t.user.email})),
+        Endpoint('auth/verify-invoice-token/', 'post', lambda t: ('auth/verify-invoice-token/', {'token': api_models.InvoiceAccessToken.create_token(t.invoice)})),
+        Endpoint('auth/business-get-by-name/', 'get', lambda t: (f'auth/business-get-by-name/?slug={t.business.slug}', None)),
+        Endpoint('auth/business/public/<slug:slug>/', 'get', lambda t: (f'auth/business/public/{t.business.slug}/', None)),
+        Endpoint('auth/business/list/', 'get', lambda t: (f'auth/business/list/?user_id={t.user.id}', None)),
+        Endpoint('auth/business/<int:business_id>/', 'get', lambda t: (f'auth/business/{b(t)}/', None)),
+        Endpoint('dashboard/invoices/<business_id>/', 'get', lambda t: (f'dashboard/invoices/{b(t)}/', None)),
+        Endpoint('dashboard/invoice/<Uid>/', 'get', lambda t: (f'dashboard/invoice/{t.invoice.Uid}/', None)),
+        Endpoint('dashboard/categories/<int:business_id>/', 'get', lambda t: (f'dashboard/categories/{b(t)}/', None)),
+        Endpoint('dashboard/categories/<int:business_id>/<name>/', 'get', lambda t: (f'dashboard/categories/{t.user.id}/{t.category.name}/', None)),
+        Endpoint('dashboard/customers/<int:business_id>/', 'get', lambda t: (f'dashboard/customers/{b(t)}/', None)),
+        Endpoint('dashboard/customer/<id>/', 'get', lambda t: (f'dashboard/customer/{t.customer.id}/', None)),
+        Endpoint('dashboard/invoice-items/<invoice_id>/', 'get', lambda t: (f'dashboard/invoice-items/{t.invoice.Uid}/', None)),
+        Endpoint('dashboard/invoice-items/<invoice_id>/<id>/', 'get', lambda t: (f'dashboard/invoice-items/{t.invoice.Uid}/{t.item.id}/', None)),
+        Endpoint('dashboard/products/<int:business_id>/', 'get', lambda t: (f'dashboard/products/{b(t)}/', None)),
+        Endpoint('dashboard/product/<int:business_id>/<id>/', 'get', lambda t: (f'dashboard/product/{b(t)}/{t.product.id}/', None)),
+        Endpoint('dashboard/admin/<int:business_id>/', 'get', lambda t: (f'dashboard/admin/{b(t)}/', None)),
+        Endpoint('dashboard/admin/stats/<int:business_id>/', 'get', lambda t: (f'dashboard/admin/stats/{b(t)}/', None)),
+        Endpoint('dashboard/invoice/admin/stats/<int:business_id>/', 'get', lambda t: (f'dashboard/invoice/admin/stats/{b(t)}/', None)),
+        Endpoint('dashboard/overview/', 'get', lambda t: ('dashboard/overview/', None)),
+        Endpoint('dashboard/receipts/<int:business_id>/', 'get', lambda t: (f'dashboard/receipts/{b(t)}/', None)),
+        Endpoint('dashboard/receipt/<int:business_id>/<Uid>/', 'get', lambda t: (f'dashboard/receipt/{b(t)}/{t.receipt.Uid}/', None)),
+        Endpoint('dashboard/notifications/', 'get', lambda t: (f'dashboard/notifications/?business_id={b(t)}', None)),
+        Endpoint('dashboard/search/<int:business_id>/', 'get', lambda t: (f'dashboard/search/{b(t)}/?q=customer', None)),
+        Endpoint('dashboard/autocomplete/<int:business_id>/', 'get', lambda t: (f'dashboard/autocomplete/{b(t)}/?type=customer&q=cust', None)),
+        Endpoint('async/dashboard/invoices/<int:business_id>/', 'get', lambda t: (f'async/dashboard/invoices/{b(t)}/', None)),
+        Endpoint('async/dashboard/invoice/<Uid>/', 'get', lambda t: (f'async/dashboard/invoice/{t.invoice.Uid}/', None)),
+        Endpoint('async/dashboard/products/<int:business_id>/', 'get', lambda t: (f'async/dashboard/products/{b(t)}/', None)),
+        Endpoint('async/dashboard/customers/<int:business_id>/', 'get', lambda t: (f'async/dashboard/customers/{b(t)}/', None)),
+        Endpoint('async/dashboard/notifications/', 'get', lambda t: (f'async/dashboard/notifications/?business_id={b(t)}', None)),
+        Endpoint('async/dashboard/admin/<int:business_id>/', 'get', lambda t: (f'async/dashboard/admin/{b(t)}/', None)),
+        Endpoint('async/dashboard/admin/stats/<int:business_id>/', 'get', lambda t: (f'async/dashboard/admin/stats/{b(t)}/', None)),
+        Endpoint('async/dashboard/invoice/admin/stats/<int:business_id>/', 'get', lambda t: (f'async/dashboard/invoice/admin/stats/{b(t)}/', None)),
+        Endpoint('batch/', 'get', lambda t: (f'batch/?{dashboard_batch(t)}', None)),
+
+        # Writes run after every read so they don't change what the reads see
+        Endpoint('user/register/', 'post', lambda t: ('user/register/', {
+            'email': f'bench-register-{time.time_ns()}@example.com', 'fullname': 'Bench Register',
+            'customer_id': 'bench', 'product_type': 'premium',
+        }), writes=True),
+        Endpoint('auth/generate-login-token/', 'post', lambda t: ('auth/generate-login-token/', {'email': t.user.email}), writes=True),
+        Endpoint('auth/token-login/', 'post', lambda t: ('auth/token-login/', {'token': api_models.LoginToken.create_token(t.user)}), writes=True),
+        Endpoint('auth/generate-invoice-token/', 'post', lambda t: ('auth/generate-invoice-token/', {'email': t.customer.email, 'Uid': t.invoice.Uid}), writes=True),
+        Endpoint('dashboard/invoices-create/', 'post', lambda t: ('dashboard/invoices-create/', {
+            'user_id': t.user.id, 'business_id': b(t), 'title': 'Bench', 'description': 'Bench',
+            'customer_name': t.customer.full_name, 'date_due': now().isoformat(),
+        }), writes=True),
+        Endpoint('dashboard/invoice-update/', 'put', lambda t: ('dashboard/invoice-update/', {
+            'Uid': t.invoice.Uid, 'user_id': b(t), 'title': t.invoice.title, 'description': t.invoice.description,
+            'customer': t.customer.full_name, 'date_due': t.invoice.date_due.isoformat(), 'discount': '0.00',
+            'is_recurring': False, 'status': t.invoice.status,
+        }), writes=True),
+        Endpoint('dashboard/invoice/delete/<business_id>/<Uid>/', 'delete', lambda t: (f'dashboard/invoice/delete/{b(t)}/{t.new_invoice().Uid}/', None), writes=True),
+        Endpoint('dashboard/categories-create/', 'post', lambda t: ('dashboard/categories-create/', {'user_id': t.user.id, 'name': f'Bench {t.next()}'}), writes=True),
+        Endpoint('dashboard/customers-create/', 'post', lambda t: ('dashboard/customers-create/', {
+            'user_id': b(t), 'full_name': f'Bench Customer {t.next()}', 'email': 'bench@example.com', 'phone_number': '0800',
+        }), writes=True),
+        Endpoint('dashboard/invoice-items-create/', 'post', lambda t: ('dashboard/invoice-items-create/', {
+            'user_id': b(t), 'invoice_Uid': t.invoice.Uid, 'product_id': t.product.id, 'quantity': 1,
+        }), writes=True),
+        Endpoint('dashboard/products-create/', 'post', lambda t: ('dashboard/products-create/', {
+            'user_id': b(t), 'name': f'Bench Product {t.next()}', 'category': t.category.name, 'price': '9.99',
+        }), writes=True),
+        Endpoint('dashboard/receipt-create/', 'post', lambda t: ('dashboard/receipt-create/', {
+            'user_id': t.user.id, 'business_id': b(t), 'customer_id': t.customer.id, 'uid': t.new_invoice().Uid,
+        }), writes=True),
+        Endpoint('dashboard/notifications/read/', 'put', lambda t: (f'dashboard/notifications/read/?business_id={b(t)}', None), writes=True),
+        Endpoint('auth/business-create/', 'post', lambda t: ('auth/business-create/', {
+            'owner': t.user.id, 'name': f'Bench Extra {b(t)} {t.next()}', 'country': 'Nigeria', 'state': 'Lagos', 'city': 'Ikeja', 'currency': 'USD',
+        }), writes=True),
+    ]
+
+def uncovered_routes(specs):
+    """Routes of api/urls.py that have no benchmark request yet."""
+    covered = {spec.route for spec in specs}
+    return [str(pattern.pattern) for pattern in api_urls.urlpatterns if str(pattern.pattern) not in covered]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def measure(client, tenant, endpoint, iterations, warmup=2):
+    """
+    Issue `endpoint` `iterations` times and summarise latency, query
+    count and the peak Python memory of one extra traced request.
+    """
+    def issue():
+        path, data = endpoint.build(tenant)
+        recorder = QueryRecorder()
+        method = getattr(client, endpoint.method)
+        kwargs = {'data': data, 'content_type': 'application/json'} if data is not None else {}
+        with connection.execute_wrapper(recorder):
+            start = time.perf_counter()
+            response = method(API_PREFIX + path, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+        return response, elapsed, recorder.count
+
+    for _ in range(warmup):
+        issue()
+
+    latencies, queries, statuses = [], [], set()
+    for _ in range(iterations):
+        response, elapsed, count = issue()
+        latencies.append(elapsed)
+        queries.append(count)
+        statuses.add(response.status_code)
+
+    tracemalloc.start()
+    try:
+        issue()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "queries": max(queries),
+        "peak_kb": round(peak / 1024, 1),
+        "status": sorted(statuses),
+    }
+
+def run(business, iterations=20, include_writes=True, only=None, log=print):
+    """
+    Benchmark every endpoint of api/urls.py against `business` and return
+    the results keyed by "METHOD route".
+    """
+    tenant = Tenant.load(business)
+    client = Client(HTTP_AUTHORIZATION=f"Token {tenant.token}")
+    specs = [spec for spec in endpoints() if (include_writes or not spec.writes) and (not only or only in spec.route)]
+
+    for route in uncovered_routes(endpoints()):
+        log(f"No benchmark request for {route}")
+
+    # The per-request JSON log lines would drown the results
+    logging.getLogger('api').setLevel(logging.WARNING)
+
+    results = {}
+    for spec in specs:
+        results[spec.name] = measure(client, tenant, spec, iterations)
+        result = results[spec.name]
+        log(f"{spec.name:<70} p50 {result['p50_ms']:>9.2f}ms  p99 {result['p99_ms']:>9.2f}ms  "
+            f"{result['queries']:>5} queries  {result['peak_kb']:>9.1f}KB  {result['status']}")
+    return results
+
+def compare(baseline, current, threshold=0.2, min_ms=1.0):
+    """
+    Regressions of `current` against `baseline`: endpoints whose p95 grew
+    by more than `threshold` (and at least `min_ms`) or that run more
+    queries than before.
+    """
+    regressions = []
+    for name, before in baseline.get("endpoints", {}).items():
+        after = current.get("endpoints", {}).get(name)
+        if after is None:
+            continue
+        if after["queries"] > before["queries"]:
+            regressions.append(f"{name}: queries {before['queries']} -> {after['queries']}")
+        grown = after["p95_ms"] - before["p95_ms"]
+        if grown > min_ms and grown > before["p95_ms"] * threshold:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {after['p95_ms']:.2f}ms")
+    return regressions
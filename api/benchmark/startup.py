@@ -0,0 +1,109 @@
+"""
+Boot time, memory and request latency of one fresh worker.
+
+`python -m api.benchmark.startup <mode> <token> <requests> <path>...`
+boots Django with the DJANGO_SETTINGS_MODULE of its environment the way
+a WSGI server does, serves `requests` requests and prints what it
+measured as JSON. Modes: `boot` (bench_startup), `cold` and `warm`
+(bench_warmup, without and with api.warmup).
+"""
+import io
+import json
+import resource
+import sys
+import time
+from wsgiref.util import setup_testing_defaults
+
+# Resolves to no view, so it only pays for the middleware and the URL resolver
+NO_VIEW_PATH = 'bench-startup-no-view/'
+
+
+def wsgi_get(handler, path, query, token):
+    """
+    Serve one GET through a WSGI `handler` and return its latency in ms.
+    Imports nothing, so a worker measured from boot loads the API itself.
+    """
+    environ = {
+        'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET',
+        'HTTP_AUTHORIZATION': f'Token {token}', 'HTTP_HOST': 'localhost', 'wsgi.input': io.BytesIO(),
+    }
+    setup_testing_defaults(environ)
+    start = time.perf_counter()
+    response = handler(environ, lambda status, headers, exc_info=None: None)
+    b"".join(response)
+    response.close()
+    return (time.perf_counter() - start) * 1000
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def measure(path, token, requests):
+    started = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application # type:ignore
+    from django.urls import get_resolver # type:ignore
+    get_wsgi_application()
+    # Workers import the URLconf, and with it every view, on their first request
+    get_resolver().url_patterns
+    boot_ms = (time.perf_counter() - started) * 1000
+    boot_rss_mb = max_rss_mb()
+    modules = len(sys.modules)
+
+    from django.conf import settings # type:ignore
+    from api.benchmark.asgi import wsgi_throughput
+    settings.ALLOWED_HOSTS = ['*']
+    overhead = wsgi_throughput(NO_VIEW_PATH, token, requests)
+    served = wsgi_throughput(path, token, requests)
+    return {
+        "apps": len(settings.INSTALLED_APPS),
+        "middleware": len(settings.MIDDLEWARE),
+        "modules": modules,
+        "boot_ms": round(boot_ms, 1),
+        "boot_rss_mb": round(boot_rss_mb, 1),
+        "rss_mb": round(max_rss_mb(), 1),
+        "overhead_p50_ms": overhead['p50_ms'],
+        "p50_ms": served['p50_ms'],
+        "rps": served['rps'],
+    }
+
+def first_requests(paths, token, requests, warm):
+    """
+    Latency of the first `requests` requests of a new worker, going
+    round the full `paths` (with their query strings), and of as many
+    more once it has served them all. The slowdown is how much longer
+    each first request took than the same request once warm.
+    """
+    started = time.perf_counter()
+    from django.core.wsgi import get_wsgi_application # type:ignore
+    handler = get_wsgi_application()
+    if warm:
+        from api.warmup import warm_up
+        warm_up()
+    boot_ms = (time.perf_counter() - started) * 1000
+
+    from django.conf import settings # type:ignore
+    settings.ALLOWED_HOSTS = ['*']
+    issued = [paths[i % len(paths)].partition('?')[::2] for i in range(requests)]
+    first = [wsgi_get(handler, path, query, token) for path, query in issued]
+    steady = [wsgi_get(handler, path, query, token) for path, query in issued]
+
+    from api.benchmark.runner import percentile
+    return {
+        "boot_ms": round(boot_ms, 1),
+        "first_request_ms": round(first[0], 2),
+        "first_p50_ms": round(percentile(first, 50), 2),
+        "first_p99_ms": round(percentile(first, 99), 2),
+        "steady_p50_ms": round(percentile(steady, 50), 2),
+        "steady_p99_ms": round(percentile(steady, 99), 2),
+        "slowdown_p99": round(percentile([cold / warm for cold, warm in zip(first, steady)], 99), 2),
+    }
+
+
+if __name__ == '__main__':
+    mode, token, requests, *paths = sys.argv[1:]
+    if mode == 'boot':
+        result = measure(paths[0], token, int(requests))
+    else:
+        result = first_requests(paths, token, int(requests), warm=mode == 'warm')
+    print(json.dumps(result))
@@ -0,0 +1,60 @@
+"""
+System checks of the deployment settings, run by `manage.py check`,
+`migrate` and `runserver`, and by gunicorn.conf.py when a worker boots.
+"""
+import os
+
+from django.conf import settings # type:ignore
+from django.core.checks import Error, Tags, register # type:ignore
+from django.core.exceptions import ImproperlyConfigured # type:ignore
+from django.db import connections # type:ignore
+from api.shards import SHARD_VENDORS
+
+# Caches other processes can't see
+PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def shared_cache_errors(workers):
+    """
+    The autocomplete indexes, owner overviews, public profiles, cached
+    businesses and replica pins of one worker are invalidated, or set,
+    through the cache, so `workers` processes need one they all reach.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if workers <= 1 or backend not in PROCESS_CACHES:
+        return []
+    return [Error(
+        f"{workers} workers can't share the {backend.rsplit('.', 1)[-1]} cache, "
+        "they would keep serving what the others invalidated.",
+        hint="Set CACHE_URL to a Redis or Memcached server (speedvoice_backend.caches).",
+        id='api.E001',
+    )]
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    # gunicorn's own default for the number of workers
+    return shared_cache_errors(int(os.environ.get('WEB_CONCURRENCY') or 1))
+
+def shard_vendor_errors():
+    """Shards on backends api.shards can't start the ids of."""
+    return [
+        Error(
+            f"Shard {alias} is on {connections[alias].vendor}, shards can only be on {' or '.join(SHARD_VENDORS)}.",
+            id='api.E002',
+        )
+        for alias in settings.DATABASE_SHARDS
+        if connections[alias].vendor not in SHARD_VENDORS
+    ]
+
+# Not Tags.database, which only runs when asked for a database
+@register()
+def check_shard_vendors(app_configs, **kwargs):
+    return shard_vendor_errors()
+
+def require_bootable(workers):
+    """Raise ImproperlyConfigured for the first error a worker of `workers` would run with."""
+    for error in [*shared_cache_errors(workers), *shard_vendor_errors()]:
+        raise ImproperlyConfigured(f"{error.msg} {error.hint or ''}".strip())
@@ -0,0 +1,35 @@
+"""
+drf_yasg's `openapi` and `swagger_auto_schema` for the views, when the
+API docs are installed.
+
+The API-only workers (speedvoice_backend.settings_api) serve no docs, so
+importing drf_yasg there would only load it, PyYAML and the admin it
+pulls in. They get no-op stand-ins instead: the decorator returns the
+view unchanged and every openapi name is accepted and ignored.
+"""
+from django.conf import settings # type:ignore
+
+DOCS_ENABLED = 'drf_yasg' in settings.INSTALLED_APPS
+
+
+class NoSchema:
+    """Stand-in for drf_yasg.openapi: any attribute or call is itself."""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+
+def no_schema(*args, **kwargs):
+    """Stand-in for swagger_auto_schema."""
+    return lambda view: view
+
+
+if DOCS_ENABLED:
+    from drf_yasg import openapi # type:ignore
+    from drf_yasg.utils import swagger_auto_schema # type:ignore
+else:
+    openapi = NoSchema()
+    swagger_auto_schema = no_schema
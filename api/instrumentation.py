@@ -0,0 +1,79 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST_RE = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Normalise a statement so queries that only differ in their literal
+    values, or the length of an IN list, share one fingerprint.
+    """
+    sql = STRING_RE.sub("?", sql)
+    sql = NUMBER_RE.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = PLACEHOLDER_LIST_RE.sub("(...)", sql)
+    return WHITESPACE_RE.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper that records every query run through it.
+
+    Install it with connection.execute_wrapper(recorder). It keeps the
+    query count, total database time, and how often each fingerprint
+    was seen. With keep_log it also keeps every statement in `queries`.
+    `rows` adds up the cursor row counts where the driver reports them
+    (PostgreSQL does for SELECTs, SQLite only for writes). While
+    `paused` it lets queries through without recording them.
+    """
+
+    def __init__(self, keep_log=False):
+        self.paused = False
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.rows = 0
+        self.queries = [] if keep_log else None
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+            self.rows += max(getattr(context['cursor'], 'rowcount', -1) or 0, 0)
+            if self.queries is not None:
+                self.queries.append({
+                    "alias": context['connection'].alias,
+                    "sql": sql,
+                    "params": repr(params),
+                    "ms": round(elapsed * 1000, 3),
+                })
+
+    def duplicates(self):
+        """Fingerprints that ran more than once, most repeated first."""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+
+
+@contextmanager
+def paused(recorder):
+    """Leave the queries run in the block to another recorder."""
+    if recorder is None:
+        yield
+        return
+    recorder.paused = True
+    try:
+        yield
+    finally:
+        recorder.paused = False
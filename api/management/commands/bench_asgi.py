@@ -0,0 +1,48 @@
+from django.conf import settings # type:ignore
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db.models import Count # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from api import models as api_models
+from api.benchmark.asgi import ROUTE_PAIRS, asgi_throughput, wsgi_throughput
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the requests per second one worker serves for the dashboard reads: "
+        "sync views under WSGI, sync views under ASGI, and the async views under ASGI"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the one with most invoices)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route and stack')
+        parser.add_argument('--concurrency', type=int, default=20, help='Clients in flight on the ASGI worker')
+        parser.add_argument('--routes', default=','.join(ROUTE_PAIRS), help=f"Comma separated subset of: {', '.join(ROUTE_PAIRS)}")
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None:
+            raise CommandError("No business to benchmark, run bench_seed first")
+        invoice = business.business.order_by('id').first()
+        token = Token.objects.get_or_create(user=business.owner)[0].key
+
+        settings.ALLOWED_HOSTS = ['*']
+        requests, concurrency = options['requests'], options['concurrency']
+
+        self.stdout.write(f"{'route':<15}{'wsgi sync':>22}{'asgi sync':>22}{'asgi async':>22}")
+        for name in options['routes'].split(','):
+            sync_path, async_path = (
+                path.format(business=business.id, invoice=invoice.Uid if invoice else '') for path in ROUTE_PAIRS[name]
+            )
+            results = [
+                wsgi_throughput(sync_path, token, requests),
+                asgi_throughput(sync_path, token, requests, concurrency),
+                asgi_throughput(async_path, token, requests, concurrency),
+            ]
+            self.stdout.write(f"{name:<15}" + "".join(
+                f"{result['rps']:>9.1f} rps {result['p99_ms']:>6.0f}ms" for result in results
+            ))
+        self.stdout.write(f"rps: requests per second, then p99 latency at {concurrency} concurrent ASGI clients")
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from api.benchmark.runner import compare
+
+
+class Command(BaseCommand):
+    help = "Compare two bench_run result files and fail on latency or query count regressions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 growth')
+        parser.add_argument('--min-ms', type=float, default=1.0, help='Ignore p95 growth below this many milliseconds')
+
+    def handle(self, *args, **options):
+        with open(options['baseline']) as baseline, open(options['current']) as current:
+            regressions = compare(json.load(baseline), json.load(current), options['threshold'], options['min_ms'])
+
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError(f"{len(regressions)} regressions")
+        self.stdout.write("No regressions")
@@ -0,0 +1,66 @@
+from django.conf import settings # type:ignore
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db import connections # type:ignore
+from django.db.backends.signals import connection_created # type:ignore
+from django.db.models import Count # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from api import models as api_models
+from api.benchmark.asgi import wsgi_throughput
+
+# label -> settings_dict overrides of the default connection
+MODES = {
+    'per request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': False},
+    'persistent + health checks': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the same request through the WSGI handler with a new connection per request, "
+        "with persistent connections, and with the configured DATABASES, and compare latency "
+        "and connections opened"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the one with most invoices)')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--path', default='dashboard/admin/{business}/', help='API path to request, {business} is replaced')
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None:
+            raise CommandError("No business to benchmark, run bench_seed first")
+        token = Token.objects.get_or_create(user=business.owner)[0].key
+        path = options['path'].format(business=business.id)
+        settings.ALLOWED_HOSTS = ['*']
+
+        connection = connections['default']
+        configured = dict(connection.settings_dict)
+        modes = dict(MODES)
+        modes['configured'] = {key: configured[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+
+        opened = []
+        count_connection = lambda sender, connection, **kwargs: opened.append(connection.alias)
+        connection_created.connect(count_connection)
+        try:
+            self.stdout.write(f"{'mode':<28}{'p50':>10}{'p99':>10}{'rps':>10}{'connections':>13}")
+            for label, overrides in modes.items():
+                connection.close()
+                connection.settings_dict.update(overrides)
+                opened.clear()
+                result = wsgi_throughput(path, token, options['requests'])
+                self.stdout.write(
+                    f"{label:<28}{result['p50_ms']:>8.2f}ms{result['p99_ms']:>8.2f}ms{result['rps']:>10.1f}{len(opened):>13}"
+                )
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            connection.settings_dict.update(configured)
+
+        if 'pool' in configured.get('OPTIONS', {}):
+            self.stdout.write("The configured row used the psycopg connection pool")
@@ -0,0 +1,71 @@
+import io
+import time
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db.models import Count # type:ignore
+from rest_framework.parsers import JSONParser # type:ignore
+from rest_framework.renderers import JSONRenderer # type:ignore
+from api import models as api_models
+from api import serializer as api_serializer
+from api.renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer, msgpack
+from api.views import invoice_list_queryset
+
+VALUES_FIELDS = ('id', 'Uid', 'title', 'status', 'total', 'discount', 'grand_total', 'date_created', 'date_due', 'customer__full_name')
+
+
+class Command(BaseCommand):
+    help = (
+        "Render and parse a large invoice list with DRF's JSON pair, the orjson pair and, "
+        "when msgpack is installed, the MessagePack pair"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant whose invoices are rendered (defaults to the one with most invoices)')
+        parser.add_argument('--invoices', type=int, default=10000, help="Rows per payload, the tenant's invoices repeated")
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per renderer, the fastest is shown')
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None or not business.business.exists():
+            raise CommandError("No invoices to render, run bench_seed first")
+
+        count = options['invoices']
+        payloads = {
+            # What the invoice list views return: strings, numbers and nested dicts
+            'serialized': list(islice(cycle(api_serializer.InvoiceSerializer(invoice_list_queryset(business), many=True).data), count)),
+            # Raw rows, with Decimals and datetimes left for the renderer
+            'values': list(islice(cycle(business.business.values(*VALUES_FIELDS)), count)),
+        }
+        pairs = {
+            'json': (JSONRenderer(), JSONParser()),
+            'orjson': (ORJSONRenderer(), ORJSONParser()),
+        }
+        if msgpack is not None:
+            pairs['msgpack'] = (MessagePackRenderer(), MessagePackParser())
+
+        self.stdout.write(f"{'payload':<12}{'format':<10}{'render':>12}{'parse':>12}{'size':>12}")
+        for payload_name, payload in payloads.items():
+            for format_name, (renderer, parser) in pairs.items():
+                body, render_ms = self.fastest(options['repeat'], renderer.render, payload)
+                _, parse_ms = self.fastest(options['repeat'], lambda: parser.parse(io.BytesIO(body)))
+                self.stdout.write(
+                    f"{payload_name:<12}{format_name:<10}{render_ms:>10.1f}ms{parse_ms:>10.1f}ms{len(body) / 1024:>10.0f}KB"
+                )
+        if msgpack is None:
+            self.stdout.write("msgpack is not installed, MessagePack was skipped")
+        self.stdout.write(f"{count} invoices per payload, fastest of {options['repeat']} runs")
+
+    @staticmethod
+    def fastest(repeat, function, *args):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
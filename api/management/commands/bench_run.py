@@ -0,0 +1,58 @@
+import json
+import platform
+import sys
+
+from django.conf import settings # type:ignore
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db import connection # type:ignore
+from django.db.models import Count # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+from api.benchmark.runner import run
+
+
+class Command(BaseCommand):
+    help = "Drive every API endpoint through the test client and record latency, query count and memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the one with most invoices)')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--reads-only', action='store_true', help='Skip endpoints that write')
+        parser.add_argument('--only', help='Only endpoints whose route contains this text')
+        parser.add_argument('--output', default='bench_output.json', help='Where to write the JSON results')
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None:
+            raise CommandError("No business to benchmark, run bench_seed first")
+
+        # Let the test client reach the views without ALLOWED_HOSTS surprises
+        settings.ALLOWED_HOSTS = ['*']
+
+        endpoints = run(
+            business,
+            iterations=options['iterations'],
+            include_writes=not options['reads_only'],
+            only=options['only'],
+            log=self.stdout.write,
+        )
+
+        results = {
+            "meta": {
+                "created_at": now().isoformat(),
+                "business_id": business.id,
+                "invoices": business.business.count(),
+                "iterations": options['iterations'],
+                "database": connection.vendor,
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+            },
+            "endpoints": endpoints,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(f"Wrote {len(endpoints)} endpoint results to {options['output']}")
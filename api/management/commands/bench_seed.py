@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand # type:ignore
+from api.benchmark.data import seed_tenants
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk insert synthetic tenants into the configured database for benchmarking. "
+        "Point CONNECTION_STRING at a scratch SQLite or local PostgreSQL database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=1)
+        parser.add_argument('--invoices', type=int, default=1000, help='Invoices per business')
+        parser.add_argument('--items-per-invoice', type=int, default=3)
+        parser.add_argument('--customers', type=int, default=100, help='Customers per business')
+        parser.add_argument('--products', type=int, default=100, help='Products per business')
+        parser.add_argument('--categories', type=int, default=5, help='Categories per business')
+        parser.add_argument('--receipts', type=int, default=10, help='Receipts per business')
+        parser.add_argument('--notifications', type=int, default=20, help='Notifications per business')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        business_ids = seed_tenants(
+            businesses=options['businesses'],
+            invoices=options['invoices'],
+            items_per_invoice=options['items_per_invoice'],
+            customers=options['customers'],
+            products=options['products'],
+            categories=options['categories'],
+            receipts=options['receipts'],
+            notifications=options['notifications'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(f"Business ids {business_ids[0]}..{business_ids[-1]}" if business_ids else "Nothing seeded")
@@ -0,0 +1,75 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings # type:ignore
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db.models import Count # type:ignore
+from rest_framework.authtoken.models import Token # type:ignore
+from api import models as api_models
+
+# label -> DJANGO_SETTINGS_MODULE
+PROFILES = {
+    'full': 'speedvoice_backend.settings',
+    'api only': 'speedvoice_backend.settings_api',
+}
+
+COLUMNS = (
+    ('apps', 'apps', '{:.0f}'),
+    ('middleware', 'middleware', '{:.0f}'),
+    ('modules', 'modules', '{:.0f}'),
+    ('boot_ms', 'boot', '{:.0f}ms'),
+    ('boot_rss_mb', 'rss boot', '{:.1f}MB'),
+    ('rss_mb', 'rss', '{:.1f}MB'),
+    ('overhead_p50_ms', 'no view p50', '{:.2f}ms'),
+    ('p50_ms', 'p50', '{:.2f}ms'),
+    ('rps', 'rps', '{:.1f}'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot a fresh worker with the full settings and with the API-only settings "
+        "(speedvoice_backend.settings_api), and compare boot time, memory and the "
+        "time every request spends outside its view"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the one with most invoices)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per worker and path')
+        parser.add_argument('--runs', type=int, default=3, help='Workers booted per profile, the median is shown')
+        parser.add_argument('--path', default='dashboard/admin/{business}/', help='API path to request, {business} is replaced')
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None:
+            raise CommandError("No business to benchmark, run bench_seed first")
+        token = Token.objects.get_or_create(user=business.owner)[0].key
+        path = options['path'].format(business=business.id)
+
+        self.stdout.write(f"{'profile':<12}" + "".join(f"{title:>13}" for _, title, _ in COLUMNS))
+        for label, module in PROFILES.items():
+            runs = [self.boot(module, path, token, options['requests']) for _ in range(options['runs'])]
+            self.stdout.write(f"{label:<12}" + "".join(
+                f"{fmt.format(statistics.median(run[key] for run in runs)):>13}" for key, _, fmt in COLUMNS
+            ))
+        self.stdout.write(
+            "rss: peak resident memory of the worker after booting and after serving the requests; "
+            "no view p50: a request that resolves to no view, i.e. the middleware"
+        )
+
+    def boot(self, module, path, token, requests):
+        environ = {**os.environ, 'DJANGO_SETTINGS_MODULE': module}
+        worker = subprocess.run(
+            [sys.executable, '-m', 'api.benchmark.startup', 'boot', token, str(requests), path],
+            cwd=settings.BASE_DIR, env=environ, capture_output=True, text=True,
+        )
+        if worker.returncode:
+            raise CommandError(f"The {module} worker failed:\n{worker.stderr}")
+        return json.loads(worker.stdout.splitlines()[-1])
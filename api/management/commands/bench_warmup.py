@@ -0,0 +1,70 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings # type:ignore
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from django.db.models import Count # type:ignore
+from api import models as api_models
+from api.benchmark.runner import API_PREFIX, Tenant, endpoints
+
+# label -> mode of api.benchmark.startup
+MODES = {
+    'cold': 'cold',
+    'warmed up': 'warm',
+}
+
+COLUMNS = (
+    ('boot_ms', 'boot', '{:.0f}ms'),
+    ('first_request_ms', 'request 1', '{:.1f}ms'),
+    ('first_p50_ms', 'first p50', '{:.2f}ms'),
+    ('first_p99_ms', 'first p99', '{:.1f}ms'),
+    ('steady_p50_ms', 'steady p50', '{:.2f}ms'),
+    ('steady_p99_ms', 'steady p99', '{:.1f}ms'),
+    ('slowdown_p99', 'slowdown p99', '{:.2f}x'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot fresh workers with and without api.warmup and compare the latency of their "
+        "first requests, going round every read endpoint, with the same requests once warm"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business-id', type=int, help='Tenant to benchmark (defaults to the one with most invoices)')
+        parser.add_argument('--requests', type=int, default=100, help='First requests measured per worker')
+        parser.add_argument('--runs', type=int, default=3, help='Workers booted per mode, the median is shown')
+
+    def handle(self, *args, **options):
+        businesses = api_models.Business.objects.select_related('owner')
+        if options['business_id']:
+            business = businesses.filter(id=options['business_id']).first()
+        else:
+            business = businesses.annotate(invoice_count=Count('business')).order_by('-invoice_count').first()
+        if business is None:
+            raise CommandError("No business to benchmark, run bench_seed first")
+        tenant = Tenant.load(business)
+        paths = [API_PREFIX + spec.build(tenant)[0] for spec in endpoints() if spec.method == 'get']
+
+        self.stdout.write(f"{'worker':<12}" + "".join(f"{title:>13}" for _, title, _ in COLUMNS))
+        for label, mode in MODES.items():
+            runs = [self.boot(mode, paths, tenant.token, options['requests']) for _ in range(options['runs'])]
+            self.stdout.write(f"{label:<12}" + "".join(
+                f"{fmt.format(statistics.median(run[key] for run in runs)):>13}" for key, _, fmt in COLUMNS
+            ))
+        self.stdout.write(
+            f"first: the first {options['requests']} requests after boot, round {len(paths)} read endpoints; "
+            "steady: the same requests again; slowdown: first / steady latency of each request"
+        )
+
+    def boot(self, mode, paths, token, requests):
+        worker = subprocess.run(
+            [sys.executable, '-m', 'api.benchmark.startup', mode, token, str(requests), *paths],
+            cwd=settings.BASE_DIR, env=dict(os.environ), capture_output=True, text=True,
+        )
+        if worker.returncode:
+            raise CommandError(f"The {mode} worker failed:\n{worker.stderr}")
+        return json.loads(worker.stdout.splitlines()[-1])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand # type:ignore
+from api.recurring import generate_recurring_invoices
+
+
+class Command(BaseCommand):
+    help = "Create the next occurrence of every recurring invoice that is due"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Invoices cloned per transaction')
+        parser.add_argument('--interval-days', type=int, default=None, help='Days between occurrences (defaults to RECURRING_INVOICE_INTERVAL_DAYS)')
+        parser.add_argument('--time-budget', type=float, default=None, help='Stop starting new batches after this many seconds')
+
+    def handle(self, *args, **options):
+        generated = generate_recurring_invoices(
+            interval_days=options['interval_days'],
+            batch_size=options['batch_size'],
+            time_budget=options['time_budget'],
+        )
+        self.stdout.write(f"Generated {generated} recurring invoices")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError # type:ignore
+from api import models as api_models
+from api.shards import move_business
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the invoices, customers, products and other rows of a business to another database "
+        "(default or a shard) while it keeps serving reads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('business_id', type=int)
+        parser.add_argument('database', help='Target database, e.g. shard_1')
+        parser.add_argument('--settle', type=float, default=None, help='Seconds to wait for workers to drop their cached placement (defaults to SHARD_DIRECTORY_CACHE_TIMEOUT)')
+
+    def handle(self, *args, **options):
+        if not api_models.Business.objects.filter(id=options['business_id']).exists():
+            raise CommandError(f"Business {options['business_id']} does not exist")
+        try:
+            moved = move_business(options['business_id'], options['database'], options['settle'], log=self.stdout.write)
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(f"Moved {sum(moved.values())} rows to {options['database']}")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+from api.shards import tenant_databases
+
+
+class Command(BaseCommand):
+    help = "Delete expired login and invoice access tokens in bounded batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cutoff = now()
+
+        # Invoice access tokens live with their invoice, on every shard
+        targets = [(api_models.LoginToken, 'default')]
+        targets += [(api_models.InvoiceAccessToken, database) for database in tenant_databases()]
+
+        for model, database in targets:
+            deleted = 0
+            tokens = model.objects.using(database)
+            while True:
+                # Walk the expires_at index and delete by primary key so each
+                # statement only locks a bounded number of rows.
+                ids = list(
+                    tokens.filter(expires_at__lte=cutoff)
+                    .order_by('expires_at')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                tokens.filter(pk__in=ids).delete()
+                deleted += len(ids)
+
+            self.stdout.write(f"{model.__name__} on {database}: deleted {deleted} expired tokens")
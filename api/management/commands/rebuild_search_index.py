@@ -0,0 +1,16 @@
+from django.db import DEFAULT_DB_ALIAS, connections # type:ignore
+from django.core.management.base import BaseCommand # type:ignore
+from api.search import create_search_index, drop_search_index
+
+
+class Command(BaseCommand):
+    help = "Drop and recreate the invoice, customer and product search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to rebuild the index of (default or a shard)')
+
+    def handle(self, *args, **options):
+        with connections[options['database']].schema_editor() as schema_editor:
+            drop_search_index(schema_editor)
+            create_search_index(schema_editor)
+        self.stdout.write("Search index rebuilt")
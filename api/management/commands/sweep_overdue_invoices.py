@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand # type:ignore
+from api.overdue import sweep_overdue_invoices
+
+
+class Command(BaseCommand):
+    help = "Flag invoices that passed their due date and notify their businesses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Invoices flagged per transaction')
+
+    def handle(self, *args, **options):
+        flagged = sweep_overdue_invoices(batch_size=options['batch_size'])
+        self.stdout.write(f"Flagged {flagged} overdue invoices")
@@ -0,0 +1,254 @@
+import fcntl
+import json
+import os
+import tempfile
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock, get_ident
+
+from django.conf import settings # type:ignore
+from django.core.cache import cache # type:ignore
+from django.db import DEFAULT_DB_ALIAS # type:ignore
+from django.db.models import Min, Q # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'speedvoice_requests_total': ('counter', 'Requests served', None),
+    'speedvoice_request_duration_seconds': ('histogram', 'Request latency', LATENCY_BUCKETS),
+    'speedvoice_response_size_bytes': ('histogram', 'Response body size', SIZE_BUCKETS),
+    'speedvoice_db_queries': ('histogram', 'Database queries per request', QUERY_BUCKETS),
+    'speedvoice_db_duration_seconds': ('histogram', 'Database time per request', LATENCY_BUCKETS),
+    'speedvoice_cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+}
+
+
+class Registry:
+    """
+    Counters and histograms of one process, flushed to a file per pid.
+
+    Gunicorn workers can't see each other's memory, so every process
+    writes its values to METRICS_DIR at most every
+    METRICS_FLUSH_INTERVAL seconds and a scrape sums the files of all
+    processes. The file is named after the pid and the start of the
+    process, so a reused pid starts a new file. When a worker exits
+    mark_process_dead() folds its file into ARCHIVE, which keeps the
+    totals monotonic without a file per worker that ever ran.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.started = time.time_ns()
+        self.values = {}
+        self.flushed_at = 0.0
+
+    def _check_fork(self):
+        # A worker forked from a preloaded master starts from zero
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def _value(self, name, labels):
+        self._check_fork()
+        key = (name, tuple(sorted(labels.items())))
+        value = self.values.get(key)
+        if value is None:
+            buckets = METRICS[name][2]
+            value = 0 if buckets is None else [[0] * (len(buckets) + 1), 0.0, 0]
+            self.values[key] = value
+        return key, value
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            key, value = self._value(name, labels)
+            self.values[key] = value + amount
+
+    def observe(self, name, labels, amount):
+        with self._lock:
+            _, value = self._value(name, labels)
+            value[0][bisect_left(METRICS[name][2], amount)] += 1
+            value[1] += amount
+            value[2] += 1
+
+    def flush(self, force=False):
+        if not force and time.monotonic() - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self._lock:
+            self._check_fork()
+            rows = [[name, dict(labels), value] for (name, labels), value in self.values.items()]
+            self.flushed_at = time.monotonic()
+            pid, started = self.pid, self.started
+
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{pid}-{started}.json")
+        temporary = f"{path}.{get_ident()}.tmp"
+        with open(temporary, "w") as output:
+            json.dump(rows, output)
+        os.replace(temporary, path)
+
+
+registry = Registry()
+
+# Totals of the workers that have exited
+ARCHIVE = 'archive.json'
+JOB_LAG_CACHE_KEY = 'metrics_job_lag'
+
+
+def metrics_dir():
+    return settings.METRICS_DIR or os.path.join(tempfile.gettempdir(), 'speedvoice-metrics')
+
+@contextmanager
+def locked(directory, exclusive=False):
+    """
+    A scrape reads the files under a shared lock and mark_process_dead()
+    moves a file into ARCHIVE under an exclusive one, so no scrape sees a
+    counter twice or not at all.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+def observe_request(method, route, status, seconds, size, queries, db_seconds):
+    labels = {'method': method, 'route': route or 'unmatched'}
+    registry.inc('speedvoice_requests_total', {**labels, 'status': str(status)})
+    registry.observe('speedvoice_request_duration_seconds', labels, seconds)
+    if size is not None:
+        registry.observe('speedvoice_response_size_bytes', labels, size)
+    registry.observe('speedvoice_db_queries', labels, queries)
+    registry.observe('speedvoice_db_duration_seconds', labels, db_seconds)
+    registry.flush()
+
+def cache_lookup(cache_name, hit):
+    registry.inc('speedvoice_cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+def _read(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return []
+
+def _merge(merged, rows):
+    for name, labels, value in rows:
+        if name not in METRICS:
+            continue
+        key = (name, tuple(sorted(labels.items())))
+        if METRICS[name][2] is None:
+            merged[key] = merged.get(key, 0) + value
+        else:
+            total = merged.setdefault(key, [[0] * len(value[0]), 0.0, 0])
+            total[0] = [a + b for a, b in zip(total[0], value[0])]
+            total[1] += value[1]
+            total[2] += value[2]
+    return merged
+
+def collect():
+    """Sum the flushed values of every process, keyed like Registry.values."""
+    registry.flush(force=True)
+    merged = {}
+    directory = metrics_dir()
+    with locked(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith('.json'):
+                _merge(merged, _read(os.path.join(directory, filename)))
+    return merged
+
+def mark_process_dead(pid):
+    """
+    Fold the files of an exited process into ARCHIVE. Called by the
+    gunicorn master for each worker that exits (gunicorn.conf.py).
+    """
+    directory = metrics_dir()
+    with locked(directory, exclusive=True):
+        paths = [
+            os.path.join(directory, filename) for filename in os.listdir(directory)
+            if filename.startswith(f"{pid}-") and filename.endswith('.json')
+        ]
+        if not paths:
+            return
+        archive = os.path.join(directory, ARCHIVE)
+        merged = _merge({}, _read(archive))
+        for path in paths:
+            _merge(merged, _read(path))
+        temporary = f"{archive}.{os.getpid()}.tmp"
+        with open(temporary, "w") as output:
+            json.dump([[name, dict(labels), value] for (name, labels), value in merged.items()], output)
+        os.replace(temporary, archive)
+        for path in paths:
+            os.remove(path)
+
+def _oldest_due():
+    """
+    When the oldest due recurring invoice and the oldest unnotified overdue
+    invoice became due, on any shard. Both lookups are served by partial
+    indexes.
+    """
+    current = now()
+    recurrences, overdues = [], []
+    for database in (DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS):
+        invoices = api_models.Invoice.objects.using(database)
+        recurrences.append(invoices.filter(
+            is_recurring=True, next_recurrence_at__lte=current,
+        ).aggregate(oldest=Min('next_recurrence_at'))['oldest'])
+        overdues.append(invoices.filter(
+            Q(overdue_notified_at__isnull=True) & ~Q(status='paid'), date_due__lte=current,
+        ).aggregate(oldest=Min('date_due'))['oldest'])
+    return {
+        'recurring_invoices': min(filter(None, recurrences), default=None),
+        'overdue_invoices': min(filter(None, overdues), default=None),
+    }
+
+def job_lag():
+    """
+    Seconds the background sweepers are behind. The oldest due dates are
+    looked up at most every METRICS_JOB_LAG_INTERVAL seconds, shared by
+    all workers, so scrapes don't query every database each time.
+    """
+    oldest = cache.get(JOB_LAG_CACHE_KEY)
+    if oldest is None:
+        oldest = _oldest_due()
+        cache.set(JOB_LAG_CACHE_KEY, oldest, timeout=settings.METRICS_JOB_LAG_INTERVAL)
+    current = now()
+    return {job: (current - due).total_seconds() if due else 0.0 for job, due in oldest.items()}
+
+def _labels(labels):
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    values = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(values.items()):
+            if metric != name:
+                continue
+            if buckets is None:
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    lines.append("# HELP speedvoice_job_lag_seconds How far behind each background sweeper is")
+    lines.append("# TYPE speedvoice_job_lag_seconds gauge")
+    for job, lag in job_lag().items():
+        lines.append(f'speedvoice_job_lag_seconds{{job="{job}"}} {lag}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,337 @@
+import cProfile
+import json
+import logging
+import marshal
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async # type:ignore
+from django.conf import settings # type:ignore
+from django.core.files.base import ContentFile # type:ignore
+from django.db import connections # type:ignore
+from rest_framework.exceptions import APIException # type:ignore
+from rest_framework.request import Request # type:ignore
+from rest_framework.settings import api_settings # type:ignore
+from api import models as api_models
+from api.accounting import record_request
+from api.instrumentation import QueryRecorder
+from api.metrics import observe_request
+from api.replicas import SAFE_METHODS, ReadRouting, may_use_replica, pin_to_primary, routing
+from api.shards import ShardRouting, shard_routing
+from api.slowlog import current_request
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(request):
+    """
+    Query budget of the route that served `request`.
+
+    QUERY_BUDGETS is keyed by URL name or by route pattern, e.g.
+    "invoices_list" or "api/v1/dashboard/invoices/<business_id>/".
+    QUERY_BUDGET_DEFAULT applies to routes that aren't listed.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        for key in (match.view_name, match.route):
+            if key in budgets:
+                return budgets[key]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+def record_queries(stack, recorder):
+    """Install `recorder` on every database connection until `stack` closes."""
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(recorder))
+    return stack
+
+def finish_request(request, response, recorder, start):
+    """
+    Report the queries `recorder` saw while serving `request` (started
+    at perf_counter() `start`): the Server-Timing header of `response`,
+    the log line, the metrics, the tenant usage and the query budget.
+    """
+    total_ms = (time.perf_counter() - start) * 1000
+    db_ms = recorder.duration * 1000
+    response['Server-Timing'] = f'db;dur={db_ms:.1f};desc="{recorder.count} queries", total;dur={total_ms:.1f}'
+
+    match = getattr(request, 'resolver_match', None)
+    if response.streaming:
+        size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+    else:
+        size = len(response.content)
+    observe_request(
+        request.method, match.route if match else None, response.status_code,
+        total_ms / 1000, size, recorder.count, db_ms / 1000,
+    )
+    record_request(request, total_ms, db_ms, recorder.rows, size or 0)
+
+    duplicates = recorder.duplicates()
+    logger.info(json.dumps({
+        "method": request.method,
+        "path": request.path,
+        "route": match.route if match else None,
+        "status": response.status_code,
+        "queries": recorder.count,
+        "db_ms": round(db_ms, 2),
+        "total_ms": round(total_ms, 2),
+        "duplicate_queries": sum(count - 1 for _, count in duplicates),
+    }))
+
+    budget = query_budget(request)
+    if budget is not None and recorder.count > budget:
+        message = "%s %s ran %d queries, budget is %d. Repeated: %s" % (
+            request.method, request.path, recorder.count, budget,
+            "; ".join(f"{count}x {sql}" for sql, count in duplicates[:5]) or "none",
+        )
+        if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the queries each request runs on every database connection.
+
+    The query count and database time are sent back as a Server-Timing
+    header, logged as one JSON line per request, fed to the /metrics
+    histograms and charged to the business the request worked on.
+    Requests over their query budget log a warning, or raise
+    QueryBudgetExceeded when QUERY_BUDGET_RAISE is set (as in
+    speedvoice_backend.settings_test).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        start = time.perf_counter()
+
+        request_token = current_request.set(request)
+        try:
+            with record_queries(ExitStack(), recorder):
+                response = self.get_response(request)
+        finally:
+            current_request.reset(request_token)
+
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        start = time.perf_counter()
+
+        # Connections are per thread, and the ORM calls of an async request
+        # run on its sync_to_async thread, so the wrappers go on there
+        request_token = current_request.set(request)
+        stack = await sync_to_async(record_queries)(ExitStack(), recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            current_request.reset(request_token)
+
+        return await sync_to_async(self.finish)(request, response, recorder, start)
+
+    def finish(self, request, response, recorder, start):
+        finish_request(request, response, recorder, start)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the reads of safe requests go to a replica (see api.replicas)
+    and pins clients that write to the primary for
+    REPLICA_STICKY_SECONDS, so they read their own writes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = ReadRouting(may_use_replica(request))
+        token = routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = ReadRouting(await sync_to_async(may_use_replica)(request))
+        # sync_to_async copies the context, so the ORM threads share `state`
+        token = routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing.reset(token)
+        await sync_to_async(self.finish)(request, state)
+        return response
+
+    @staticmethod
+    def finish(request, state):
+        if state.wrote or request.method not in SAFE_METHODS:
+            pin_to_primary(request)
+
+
+class ShardRoutingMiddleware:
+    """
+    Gives every request its own shard routing (see api.shards), which
+    resolve_business points at the database of the business it resolves.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_SHARDS:
+            return self.get_response(request)
+        token = shard_routing.set(ShardRouting())
+        try:
+            return self.get_response(request)
+        finally:
+            shard_routing.reset(token)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_SHARDS:
+            return await self.get_response(request)
+        token = shard_routing.set(ShardRouting())
+        try:
+            return await self.get_response(request)
+        finally:
+            shard_routing.reset(token)
+
+
+def profiling_user(request):
+    """
+    The staff user asking for `request` to be profiled, or None.
+
+    API clients send a token rather than a session, so the DRF
+    authenticators are run here when the session user isn't staff.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return user
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated and user.is_staff else None
+
+
+class ProfilingMiddleware:
+    """
+    Runs one request under cProfile when a staff user asks for it with
+    the X-Profile header or a `profile` query parameter.
+
+    The stats are stored as a .pstats file on a RequestProfile, together
+    with the route, the business the view resolved and every query it
+    ran, and can be downloaded from the admin (open them with
+    `python -m pstats`, snakeviz or flameprof). The id of the profile is
+    returned in the X-Profile-Id header. Requests without the flag only
+    pay for two dictionary lookups.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def wants_profile(request):
+        return 'HTTP_X_PROFILE' in request.META or 'profile' in request.GET
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.wants_profile(request):
+            return self.get_response(request)
+        user = profiling_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        recorder = QueryRecorder(keep_log=True)
+        start = time.perf_counter()
+        with record_queries(ExitStack(), recorder):
+            response = profiler.runcall(self.get_response, request)
+        return self.save(request, response, user, profiler, recorder, start)
+
+    async def __acall__(self, request):
+        if not self.wants_profile(request):
+            return await self.get_response(request)
+        user = await sync_to_async(profiling_user)(request)
+        if user is None:
+            return await self.get_response(request)
+
+        # Only the event loop thread is profiled, so concurrent requests on
+        # the same worker show up too and ORM work appears as awaits
+        profiler = cProfile.Profile()
+        recorder = QueryRecorder(keep_log=True)
+        start = time.perf_counter()
+        stack = await sync_to_async(record_queries)(ExitStack(), recorder)
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+            await sync_to_async(stack.close)()
+        return await sync_to_async(self.save)(request, response, user, profiler, recorder, start)
+
+    def save(self, request, response, user, profiler, recorder, start):
+        duration_ms = (time.perf_counter() - start) * 1000
+        profiler.create_stats()
+
+        match = getattr(request, 'resolver_match', None)
+        business = getattr(request, 'business', None)
+        profile = api_models.RequestProfile(
+            user=user,
+            business_id=business.id if business is not None else None,
+            method=request.method,
+            path=request.path[:255],
+            route=match.route[:255] if match else "",
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            query_count=recorder.count,
+            queries=recorder.queries,
+        )
+        profile.stats.save(f"{int(time.time())}-{request.method.lower()}.pstats", ContentFile(marshal.dumps(profiler.stats)), save=False)
+        profile.save()
+
+        response['X-Profile-Id'] = str(profile.id)
+        return response
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    LoginToken = apps.get_model('api', 'LoginToken')
+    InvoiceAccessToken = apps.get_model('api', 'InvoiceAccessToken')
+
+    for login_token in LoginToken.objects.all().iterator():
+        login_token.token_hash = hashlib.sha256(login_token.token.encode()).hexdigest()
+        login_token.expires_at = login_token.created_at + timedelta(minutes=15)
+        login_token.save(update_fields=['token_hash', 'expires_at'])
+
+    for access_token in InvoiceAccessToken.objects.all().iterator():
+        access_token.token_hash = hashlib.sha256(access_token.token.encode()).hexdigest()
+        access_token.save(update_fields=['token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_alter_business_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logintoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='logintoken',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='invoiceaccesstoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='logintoken',
+            name='token',
+        ),
+        migrations.RemoveField(
+            model_name='invoiceaccesstoken',
+            name='token',
+        ),
+        migrations.AlterField(
+            model_name='logintoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='logintoken',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='invoiceaccesstoken',
+            name='token_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='invoiceaccesstoken',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
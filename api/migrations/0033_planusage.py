@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_plan_usage(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    PlanUsage = apps.get_model('api', 'PlanUsage')
+
+    users = User.objects.annotate(
+        invoice_count=Count('user', distinct=True),
+        business_count=Count('business', distinct=True),
+    ).values_list('id', 'invoice_count', 'business_count')
+
+    PlanUsage.objects.bulk_create(
+        (PlanUsage(user_id=user_id, invoices=invoices, businesses=businesses) for user_id, invoices, businesses in users.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0032_hashed_tokens'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoices', models.PositiveIntegerField(default=0)),
+                ('businesses', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='plan_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill_plan_usage, migrations.RunPython.noop),
+    ]
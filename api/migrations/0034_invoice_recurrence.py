@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:33
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def schedule_existing_recurring_invoices(apps, schema_editor):
+    Invoice = apps.get_model('api', 'Invoice')
+    Invoice.objects.filter(is_recurring=True, next_recurrence_at__isnull=True).update(
+        next_recurrence_at=F('date_created') + timedelta(days=settings.RECURRING_INVOICE_INTERVAL_DAYS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0033_planusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='next_recurrence_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='recurrence_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='recurring_parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='api.invoice'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('is_recurring', True)), fields=['next_recurrence_at'], name='invoice_recurrence_due_idx'),
+        ),
+        migrations.RunPython(schedule_existing_recurring_invoices, migrations.RunPython.noop),
+    ]
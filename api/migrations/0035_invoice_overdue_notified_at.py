@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.timezone import now
+
+
+def mark_existing_overdue_invoices(apps, schema_editor):
+    # Invoices that were already overdue before the sweeper existed should
+    # not all produce a notification on its first run.
+    Invoice = apps.get_model('api', 'Invoice')
+    Invoice.objects.filter(date_due__lt=now()).exclude(status='paid').update(overdue_notified_at=now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0034_invoice_recurrence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='overdue_notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('overdue_notified_at__isnull', True), models.Q(('status', 'paid'), _negated=True)), fields=['date_due'], name='invoice_overdue_pending_idx'),
+        ),
+        migrations.RunPython(mark_existing_overdue_invoices, migrations.RunPython.noop),
+    ]
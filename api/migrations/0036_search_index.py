@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# The SQL is frozen here, api.search may change after this migration.
+
+# On SQLite every searchable row lives in the api_search FTS5 table under
+# rowid = object id * 4 + kind code, kept up to date by triggers.
+# kind, table, code, values of a `new` row
+SQLITE_SOURCES = [
+    ('invoice', 'api_invoice', 1, "new.id * 4 + 1, new.title, new.\"Uid\", coalesce(new.description, ''), new.business_id"),
+    ('customer', 'api_customer', 2, "new.id * 4 + 2, new.full_name, new.email, coalesce(new.phone_number, ''), new.business_id"),
+    ('product', 'api_product', 3, "new.id * 4 + 3, new.name, '', '', new.owner_id"),
+]
+
+# On PostgreSQL the source tables get expression indexes, matching the
+# documents the search queries use.
+POSTGRES_DOCUMENTS = [
+    ('invoice', 'api_invoice', "(coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(\"Uid\", ''))"),
+    ('customer', 'api_customer', "(coalesce(full_name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(phone_number, ''))"),
+    ('product', 'api_product', "coalesce(name, '')"),
+]
+
+
+def sqlite_index_sql(kind, table, code, values):
+    """
+    Statements indexing the rows of `table` already there, then the
+    triggers keeping api_search up to date with it.
+    """
+    insert = "INSERT INTO api_search(rowid, title, subtitle, body, business_id)"
+    delete = f"DELETE FROM api_search WHERE rowid = old.id * 4 + {code};"
+    return [
+        f"{insert} SELECT {values.replace('new.', table + '.')} FROM {table}",
+        f"CREATE TRIGGER api_search_{kind}_insert AFTER INSERT ON {table} BEGIN {insert} VALUES ({values}); END",
+        f"CREATE TRIGGER api_search_{kind}_update AFTER UPDATE ON {table} BEGIN {delete} {insert} VALUES ({values}); END",
+        f"CREATE TRIGGER api_search_{kind}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+    ]
+
+def sqlite_forwards(schema_editor):
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE api_search USING fts5("
+        "title, subtitle, body, business_id UNINDEXED, tokenize='unicode61', prefix='2 3')"
+    )
+    for source in SQLITE_SOURCES:
+        for sql in sqlite_index_sql(*source):
+            schema_editor.execute(sql)
+
+def postgres_forwards(schema_editor):
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for kind, table, document in POSTGRES_DOCUMENTS:
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS api_search_{kind}_tsv ON {table} USING gin (to_tsvector('simple', {document}))")
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS api_search_{kind}_trgm ON {table} USING gin ({document} gin_trgm_ops)")
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        sqlite_forwards(schema_editor)
+    elif vendor == 'postgresql':
+        postgres_forwards(schema_editor)
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for kind, *_ in SQLITE_SOURCES:
+            for event in ('insert', 'update', 'delete'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS api_search_{kind}_{event}")
+        schema_editor.execute("DROP TABLE IF EXISTS api_search")
+    elif vendor == 'postgresql':
+        for kind, *_ in POSTGRES_DOCUMENTS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_search_{kind}_tsv")
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_search_{kind}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0035_invoice_overdue_notified_at'),
+    ]
+
+    operations = [
+        # Shards have the search index too
+        migrations.RunPython(forwards, backwards, hints={'shards': True}),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def populate_slugs(apps, schema_editor):
+    Business = apps.get_model('api', 'Business')
+    taken = set()
+    for business in Business.objects.order_by('id').iterator():
+        base = slugify(business.name)[:100] or 'business'
+        slug, suffix = base, 2
+        while slug in taken:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        taken.add(slug)
+        business.slug = slug
+        business.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0036_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='business',
+            name='slug',
+            field=models.SlugField(max_length=110, null=True),
+        ),
+        migrations.RunPython(populate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='business',
+            name='slug',
+            field=models.SlugField(max_length=110, unique=True),
+        ),
+    ]
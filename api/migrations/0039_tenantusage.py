@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0038_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantCost',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'tenant cost',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('api.business',),
+        ),
+        migrations.CreateModel(
+            name='TenantUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('wall_ms', models.FloatField(default=0)),
+                ('db_ms', models.FloatField(default=0)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('bytes_sent', models.PositiveBigIntegerField(default=0)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='api.business')),
+            ],
+            options={
+                'ordering': ['-period'],
+                'constraints': [models.UniqueConstraint(fields=('business', 'period'), name='tenant_usage_business_period')],
+            },
+        ),
+    ]
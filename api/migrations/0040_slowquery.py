@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-19 15:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0039_tenantusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint_hash', models.CharField(max_length=64, unique=True)),
+                ('fingerprint', models.TextField()),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('view', models.CharField(blank=True, max_length=255)),
+                ('plan', models.TextField(blank=True)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'Slow queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.4 on 2026-10-19 16:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0040_slowquery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessShard',
+            fields=[
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='shard', serialize=False, to='api.business')),
+                ('database', models.CharField(max_length=64)),
+                ('moving', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='business', to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='owner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='user', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='noti_business', to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='owner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='business_receipt', to='api.business'),
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='owner',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_receipt', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='signature',
+            name='business',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+    ]
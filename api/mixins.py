@@ -0,0 +1,134 @@
+from asgiref.sync import sync_to_async # type:ignore
+from django.conf import settings # type:ignore
+from django.core.cache import cache # type:ignore
+from rest_framework.exceptions import NotFound # type:ignore
+from api import models as api_models
+from api.metrics import cache_lookup
+from api.shards import activate, placement
+
+# api.signals drops cached businesses on save, delete and bulk update
+# (BusinessQuerySet.update). Writes in raw SQL are seen after this long.
+BUSINESS_CACHE_TIMEOUT = 60
+
+
+def business_cache_key(business_id):
+    return f'business_{business_id}'
+
+def public_business_cache_key(slug):
+    return f'public_business_{slug}'
+
+def get_business_map(request):
+    """
+    Request-scoped identity map of resolved businesses, keyed by id.
+
+    It lives on the underlying Django request so DRF wrappers and
+    middleware see the same instances.
+    """
+    http_request = getattr(request, '_request', request)
+    business_map = getattr(http_request, '_business_map', None)
+    if business_map is None:
+        business_map = {}
+        http_request._business_map = business_map
+    return business_map
+
+def resolve_business(request, business_id):
+    """
+    Return the business with the given id if it belongs to request.user.
+
+    Looks in the request identity map first, then the cache, then the
+    database. Raises Business.DoesNotExist for unknown ids and for
+    businesses owned by someone else.
+    """
+    try:
+        business_id = int(business_id)
+    except (TypeError, ValueError):
+        raise api_models.Business.DoesNotExist("Business not found")
+
+    business_map = get_business_map(request)
+    business = business_map.get(business_id)
+
+    if business is None:
+        key = business_cache_key(business_id)
+        business = cache.get(key)
+        cache_lookup('business', business is not None)
+        if business is None:
+            business = api_models.Business.objects.get(id=business_id)
+            cache.set(key, business, timeout=BUSINESS_CACHE_TIMEOUT)
+        business_map[business_id] = business
+
+    return _owned_business(request, business)
+
+async def aresolve_business(request, business_id):
+    """resolve_business for the async views."""
+    try:
+        business_id = int(business_id)
+    except (TypeError, ValueError):
+        raise api_models.Business.DoesNotExist("Business not found")
+
+    business_map = get_business_map(request)
+    business = business_map.get(business_id)
+
+    if business is None:
+        key = business_cache_key(business_id)
+        business = await cache.aget(key)
+        cache_lookup('business', business is not None)
+        if business is None:
+            business = await api_models.Business.objects.aget(id=business_id)
+            await cache.aset(key, business, timeout=BUSINESS_CACHE_TIMEOUT)
+        business_map[business_id] = business
+
+    if settings.DATABASE_SHARDS:
+        # Looked up here so _owned_business finds it without I/O
+        await sync_to_async(placement)(business.id)
+    return _owned_business(request, business)
+
+def _owned_business(request, business):
+    if business.owner_id != request.user.id:
+        raise api_models.Business.DoesNotExist("Business not found")
+
+    http_request = getattr(request, '_request', request)
+    http_request.business = business
+    activate(business.id)
+    return business
+
+
+class BusinessMixin:
+    """
+    Resolves the business a view operates on once per request.
+
+    The id is read from the URL kwarg, then the query string, then the
+    request body (or its legacy_business_body_field, for the endpoints
+    that used to take the business id as `user_id`). Querysets built
+    from the returned instance through its related managers
+    (business.customer_set, ...) reuse it for the reverse foreign key
+    instead of fetching it again.
+
+    The instance may come from the cache and be up to
+    BUSINESS_CACHE_TIMEOUT old: views that save the business itself
+    reload it first.
+    """
+    business_kwarg = 'business_id'
+    business_query_param = 'business_id'
+    business_body_field = 'business_id'
+    legacy_business_body_field = None
+
+    def get_business_id(self):
+        business_id = self.kwargs.get(self.business_kwarg)
+        if business_id is None:
+            business_id = self.request.query_params.get(self.business_query_param)
+        if business_id is None and self.business_body_field:
+            business_id = self.request.data.get(self.business_body_field)
+        if business_id is None and self.legacy_business_body_field:
+            business_id = self.request.data.get(self.legacy_business_body_field)
+        return business_id
+
+    def get_business(self):
+        business = getattr(self.request, 'business', None)
+        if business is not None:
+            return business
+        return resolve_business(self.request, self.get_business_id())
+
+    def handle_exception(self, exc):
+        if isinstance(exc, api_models.Business.DoesNotExist):
+            exc = NotFound("Business not found")
+        return super().handle_exception(exc)
@@ -1,8 +1,15 @@
-from django.db import models # type:ignore
+from django.conf import settings # type:ignore
+from django.db import DEFAULT_DB_ALIAS, models, router, transaction # type:ignore
+from django.db.models import F, Q # type:ignore
+from django.db.models.functions import Greatest # type:ignore
+from django.dispatch import Signal # type:ignore
 from userauth.models import User # type:ignore
+from django.utils.text import slugify # type:ignore
 from django.utils.timezone import now # type:ignore
 from datetime import timedelta # type:ignore
 from shortuuid.django_fields import ShortUUIDField # type:ignore
+import hashlib
+import os
 import secrets
 
 INVOICE_STATUS = (
@@ -40,29 +47,69 @@ NOTI_TYPE = (
 )
 
 
+LOGIN_TOKEN_LIFETIME = timedelta(minutes=15)
+INVOICE_TOKEN_LIFETIME = timedelta(hours=48)
+
+# What the basic plan allows, counted in PlanUsage
+BASIC_PLAN_INVOICE_LIMIT = 15
+BASIC_PLAN_BUSINESS_LIMIT = 1
+
+
 def user_directory_path(instance, filename):
     ext = filename.split(".")[-1]
     filename = "%s_%s" % (instance.id, ext)
     return "user_{0}/{1}".format(instance.user_id, filename)
 
+def hash_token(token):
+    # Only the SHA-256 digest is stored, so the unique index stays fixed-width
+    # and a leaked table does not hand out usable tokens.
+    return hashlib.sha256(token.encode()).hexdigest()
+
 
 class LoginToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    token = models.CharField(max_length=255, unique=True)
+    token_hash = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
 
     class Meta:
         ordering = ['-created_at']
 
+    @staticmethod
+    def create_token(user):
+        token = secrets.token_urlsafe(32)
+        expires_at = now() + LOGIN_TOKEN_LIFETIME
+        LoginToken.objects.create(user=user, token_hash=hash_token(token), expires_at=expires_at)
+        return token
+
+    @staticmethod
+    def get_valid(token):
+        return LoginToken.objects.select_related('user').get(token_hash=hash_token(token), expires_at__gt=now())
+
     def is_valid(self):
-        return now() < self.created_at + timedelta(minutes=15)   
+        return now() < self.expires_at
 
     def __str__(self):
-        return self.token
+        return self.token_hash
+
+# Sent by BusinessQuerySet.update() with the (id, slug, owner_id) of the
+# rows it changed, before and after, as bulk updates send no post_save
+businesses_updated = Signal()
+
+
+class BusinessQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        before = list(self.values_list('id', 'slug', 'owner_id'))
+        rows = super().update(**kwargs)
+        if before:
+            after = self.model.objects.using(self.db).filter(id__in=[row[0] for row in before])
+            businesses_updated.send(sender=self.model, rows=before + list(after.values_list('id', 'slug', 'owner_id')))
+        return rows
 
 class Business(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=110, unique=True)
     country = models.CharField(max_length=100)
     state = models.CharField(max_length=100)
     city = models.CharField(max_length=100)
@@ -72,6 +119,8 @@ class Business(models.Model):
     active = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BusinessQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Businesses"
@@ -79,18 +128,61 @@ class Business(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = self.unique_slug()
+        return super(Business, self).save(*args, **kwargs)
+
+    def unique_slug(self):
+        base = slugify(self.name)[:100] or "business"
+        others = Business.objects.exclude(pk=self.pk)
+        slug, suffix = base, 2
+        while others.filter(slug=slug).exists():
+            slug = f"{base}-{suffix}"
+            suffix += 1
+        return slug
+
+class TenantQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """
+        Save through the new instance, so the database router sees which
+        business the row belongs to (api.shards) rather than only its model.
+        """
+        instance = self.model(**kwargs)
+        if self._db is not None or instance.pk is not None:
+            return super().create(**kwargs)
+        instance.save()
+        return instance
+
+# Database holding the tenant rows of a business (api.shards), `default`
+# for businesses without a row
+class BusinessShard(models.Model):
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, primary_key=True, related_name="shard")
+    database = models.CharField(max_length=64)
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.business_id} on {self.database}"
+
+# Tenant rows may live on another database than their business and its
+# owner, so those foreign keys have no database constraint
 class Signature(models.Model):
-    business = models.ForeignKey(Business, on_delete=models.CASCADE)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, db_constraint=False)
     text = models.CharField(max_length=100)
     font = models.CharField(max_length=50)
 
+    objects = TenantQuerySet.as_manager()
+
     def __str__(self):
         return self.text
 
 class Category(models.Model):
-    business = models.ForeignKey(Business, on_delete=models.CASCADE)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, db_constraint=False)
     name = models.CharField(max_length=100)
 
+    objects = TenantQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Categories"
 
@@ -98,16 +190,18 @@ class Category(models.Model):
         return self.name
 
 class Customer(models.Model):
-    business = models.ForeignKey(Business, on_delete=models.CASCADE)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, db_constraint=False)
     full_name = models.CharField(max_length=100)
     email = models.CharField(max_length=100, blank=True)
     phone_number = models.CharField(max_length=100, blank=True)
 
+    objects = TenantQuerySet.as_manager()
+
     def __str__(self):
         return self.full_name
 
 class Product(models.Model):
-    owner = models.ForeignKey(Business, on_delete=models.CASCADE)
+    owner = models.ForeignKey(Business, on_delete=models.CASCADE, db_constraint=False)
     name = models.CharField(max_length=100, null=False, blank=False)
     category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, null=True, blank=True, related_name="category")
     price = models.DecimalField(decimal_places=2, default=0.00, max_digits=15)
@@ -117,13 +211,15 @@ class Product(models.Model):
     class Meta:
         ordering = ['-date_added']
 
+    objects = TenantQuerySet.as_manager()
+
     def __str__(self):
         return self.name 
         
 
 class Invoice(models.Model):
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user")
-    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="business")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user", db_constraint=False)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="business", db_constraint=False)
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, related_name="customer")
     signature = models.ForeignKey(Signature, on_delete=models.DO_NOTHING, null=True, blank=True)
     Uid = ShortUUIDField(unique=True, max_length=17, length=12, alphabet="abcdefghijklmnopqrstuvwxyz", prefix="Inv-")
@@ -134,17 +230,31 @@ class Invoice(models.Model):
     discount = models.DecimalField(default=0.00, decimal_places=2, max_digits=15)
     grand_total = models.DecimalField(default=0.00, decimal_places=2, max_digits=15)
     is_recurring = models.BooleanField(default=False)
+    recurring_parent = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True, related_name="occurrences")
+    recurrence_count = models.PositiveIntegerField(default=0)
+    next_recurrence_at = models.DateTimeField(blank=True, null=True)
     date_created = models.DateTimeField(auto_now_add=True)
     date_due = models.DateTimeField(blank=True, null=True)
+    overdue_notified_at = models.DateTimeField(blank=True, null=True)
+
+    objects = TenantQuerySet.as_manager()
 
     class Meta:
         ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['next_recurrence_at'], condition=Q(is_recurring=True), name='invoice_recurrence_due_idx'),
+            models.Index(fields=['date_due'], condition=Q(overdue_notified_at__isnull=True) & ~Q(status='paid'), name='invoice_overdue_pending_idx'),
+        ]
 
     def __str__(self):
         return self.business.name
 
     def save(self):
         self.grand_total = float(self.total) - float(self.discount)
+        if not self.is_recurring:
+            self.next_recurrence_at = None
+        elif self.next_recurrence_at is None:
+            self.next_recurrence_at = (self.date_created or now()) + timedelta(days=settings.RECURRING_INVOICE_INTERVAL_DAYS)
         return super(Invoice, self).save()
 
     def set_unpaid(self):
@@ -161,6 +271,8 @@ class Invoice_item(models.Model):
     quantity = models.IntegerField(default=0)
     date = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = "Sale Items"
 
@@ -173,14 +285,16 @@ class Invoice_item(models.Model):
         return "saved"
     
 class Receipt(models.Model):
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_receipt")
-    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="business_receipt")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="user_receipt", db_constraint=False)
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="business_receipt", db_constraint=False)
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, related_name="customer_receipt")
     signature = models.ForeignKey(Signature, on_delete=models.DO_NOTHING, null=True, blank=True)
     invoice = models.OneToOneField(Invoice, on_delete=models.CASCADE, related_name="invoice_receipt")
     Uid = ShortUUIDField(unique=True, max_length=15, length=10, alphabet="abcdefghijklmnopqrstuvwxyz1234567890", prefix="Rcpt-")
     date_created = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date_created']
 
@@ -188,13 +302,15 @@ class Receipt(models.Model):
         return self.invoice.title
     
 class Notification(models.Model):
-    business = models.ForeignKey(Business, related_name="noti_business", on_delete=models.CASCADE)
+    business = models.ForeignKey(Business, related_name="noti_business", on_delete=models.CASCADE, db_constraint=False)
     title = models.CharField(max_length=50)
     description = models.CharField(max_length=100)
     type = models.CharField(max_length=50, choices=NOTI_TYPE)
     seen = models.BooleanField(default=False)
     date_created = models.DateTimeField(auto_now_add=True)
 
+    objects = TenantQuerySet.as_manager()
+
     class Meta:
         ordering = ['-date_created']
 
@@ -202,21 +318,156 @@ class Notification(models.Model):
         return self.title
     
 class InvoiceAccessToken(models.Model):
-    token = models.CharField(max_length=100, unique=True)
+    token_hash = models.CharField(max_length=64, unique=True)
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    objects = TenantQuerySet.as_manager()
 
     @staticmethod
     def create_token(invoice):
+        """
+        A new token for `invoice`. It replaces the earlier ones, so an invoice
+        has at most one token however often it is asked for.
+        """
         token = secrets.token_urlsafe(32)
-        expires_at = now() + timedelta(hours=48)
-        InvoiceAccessToken.objects.create(invoice=invoice, token=token, expires_at=expires_at)
+        access_token = InvoiceAccessToken(invoice=invoice, token_hash=hash_token(token), expires_at=now() + INVOICE_TOKEN_LIFETIME)
+        # The database of the invoice's business (api.shards)
+        database = router.db_for_write(InvoiceAccessToken, instance=access_token)
+        with transaction.atomic(using=database):
+            InvoiceAccessToken.objects.using(database).filter(invoice=invoice).delete()
+            access_token.save(using=database)
         return token
+
+    @staticmethod
+    def valid(token):
+        return InvoiceAccessToken.objects.select_related('invoice').filter(token_hash=hash_token(token), expires_at__gt=now())
+
+    @staticmethod
+    def get_valid(token):
+        return InvoiceAccessToken.valid(token).get()
     
     def is_valid(self):
         return now() < self.expires_at
     
     def __str__(self):
-        return self.token
+        return self.token_hash
+
+class PlanUsage(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="plan_usage")
+    invoices = models.PositiveIntegerField(default=0)
+    businesses = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.invoices} invoices, {self.businesses} businesses"
+
+    @staticmethod
+    def reserve(user, field, limit=None, amount=1):
+        """
+        Increment a usage counter unless it would go past `limit`.
+
+        The check and the increment are one conditional UPDATE, so two
+        concurrent requests can't both take the last slot. Returns False
+        when the limit has been reached.
+        """
+        usage = PlanUsage.objects.filter(user=user)
+        if limit is not None:
+            usage = usage.filter(**{f"{field}__lte": limit - amount})
+        if usage.update(**{field: F(field) + amount}):
+            return True
+
+        # Users without a row yet get one seeded from their current totals
+        PlanUsage.objects.get_or_create(user=user, defaults=PlanUsage.totals(user))
+        return bool(usage.update(**{field: F(field) + amount}))
+
+    @staticmethod
+    def totals(user):
+        """The invoices and businesses of `user`, counted from their tables."""
+        return {
+            "invoices": sum(
+                Invoice.objects.using(database).filter(owner=user).count()
+                for database in (DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS)
+            ),
+            "businesses": Business.objects.filter(owner=user).count(),
+        }
+
+    @staticmethod
+    def recount(user):
+        """
+        Set the counters of `user` back to the totals. Returns whether they
+        had drifted from them.
+        """
+        totals = PlanUsage.totals(user)
+        return bool(PlanUsage.objects.filter(user=user).exclude(**totals).update(**totals))
+
+    @staticmethod
+    def invoice_limit(user):
+        """The most invoices the plan of `user` allows, None without a limit."""
+        return BASIC_PLAN_INVOICE_LIMIT if user.product_type == os.environ.get('BASIC_PLAN') else None
+
+    @staticmethod
+    def release(user_id, field, amount=1):
+        PlanUsage.objects.filter(user_id=user_id).update(**{field: Greatest(F(field) - amount, 0)})
+
+class RequestProfile(models.Model):
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="request_profiles")
+    business = models.ForeignKey(Business, on_delete=models.SET_NULL, null=True, blank=True, related_name="request_profiles")
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    route = models.CharField(max_length=255, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    queries = models.JSONField(default=list, blank=True)
+    stats = models.FileField(upload_to="profiles")
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-date_created']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
+
+class TenantUsage(models.Model):
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="usage")
+    period = models.DateTimeField()
+    requests = models.PositiveIntegerField(default=0)
+    wall_ms = models.FloatField(default=0)
+    db_ms = models.FloatField(default=0)
+    rows = models.PositiveBigIntegerField(default=0)
+    bytes_sent = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-period']
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'period'], name='tenant_usage_business_period'),
+        ]
 
+    def __str__(self):
+        return f"{self.business_id} @ {self.period:%Y-%m-%d %H:00}: {self.requests} requests"
+
+class TenantCost(Business):
+    class Meta:
+        proxy = True
+        verbose_name = "tenant cost"
+
+class SlowQuery(models.Model):
+    fingerprint_hash = models.CharField(max_length=64, unique=True)
+    fingerprint = models.TextField()
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    view = models.CharField(max_length=255, blank=True)
+    plan = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=1)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=now)
+
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name_plural = "Slow queries"
+
+    def __str__(self):
+        return f"{self.count}x {self.max_ms:.0f}ms {self.fingerprint[:80]}"
@@ -0,0 +1,64 @@
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+from api.overview import bump_businesses_overview
+from api.shards import tenant_databases, use_database
+
+
+def sweep_batch(cutoff, batch_size, using=DEFAULT_DB_ALIAS):
+    """
+    Flag up to `batch_size` invoices on database `using` whose due date
+    passed before `cutoff` and create their invoice_overdue notifications.
+
+    Only unflagged, unpaid invoices are read, through the partial
+    date_due index, so the cost follows the number of newly overdue
+    invoices rather than the size of the table. Returns the number flagged.
+    """
+    with use_database(using), transaction.atomic(using=using):
+        overdue = list(
+            api_models.Invoice.objects.select_for_update(skip_locked=True)
+            .filter(overdue_notified_at__isnull=True, date_due__lt=cutoff)
+            .exclude(status='paid')
+            .order_by('date_due')
+            .values_list('id', 'business_id', 'Uid')[:batch_size]
+        )
+        if not overdue:
+            return 0
+
+        # Past due invoices are "pending", the same state set_unpaid() computes
+        api_models.Invoice.objects.filter(id__in=[invoice_id for invoice_id, _, _ in overdue]).update(
+            overdue_notified_at=cutoff,
+            status='pending',
+        )
+
+        transaction.on_commit(partial(bump_businesses_overview, [business_id for _, business_id, _ in overdue]), using=using)
+
+        api_models.Notification.objects.bulk_create(
+            [
+                api_models.Notification(
+                    business_id=business_id,
+                    title="Invoice overdue",
+                    description=f'Invoice {uid} is past its due date',
+                    type="invoice_overdue"
+                )
+                for _, business_id, uid in overdue
+            ],
+            batch_size=batch_size,
+        )
+
+    return len(overdue)
+
+def sweep_overdue_invoices(batch_size=1000):
+    cutoff = now()
+    flagged = 0
+
+    for database in tenant_databases():
+        while True:
+            swept = sweep_batch(cutoff, batch_size, database)
+            if not swept:
+                break
+            flagged += swept
+
+    return flagged
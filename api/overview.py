@@ -0,0 +1,127 @@
+"""
+Totals across all the businesses of an owner.
+
+owner_overview() counts invoices by status, adds up paid and
+outstanding (unpaid or pending) amounts and counts customers and
+products, per business and per currency. Whatever the number of
+businesses that is one query for the businesses, one for where they
+live when sharded (api.shards.placements) and three grouped queries per
+database holding their rows.
+
+The result is cached per owner under a version that bump_overview()
+moves on: the signals do it for single writes, and the bulk writes
+(invoice refreshes, the overdue sweep, recurring invoices) do it
+themselves. Both live in the cache every worker shares (api.checks
+refuses to run several workers without one).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache # type:ignore
+from django.db.models import Count, Q, Sum # type:ignore
+from api import models as api_models
+from api.metrics import cache_lookup
+from api.mixins import business_cache_key
+from api.shards import placements
+
+OWNER_OVERVIEW_CACHE_TIMEOUT = 60 * 15
+
+INVOICE_TOTALS = {
+    'invoices': Count('id'),
+    'draft_invoices': Count('id', filter=Q(status='draft')),
+    'paid_invoices': Count('id', filter=Q(status='paid')),
+    'unpaid_invoices': Count('id', filter=Q(status='unpaid')),
+    'pending_invoices': Count('id', filter=Q(status='pending')),
+    'paid_amount': Sum('grand_total', filter=Q(status='paid')),
+    # Sent and not paid yet
+    'outstanding_amount': Sum('grand_total', filter=Q(status__in=('unpaid', 'pending'))),
+}
+AMOUNTS = ('paid_amount', 'outstanding_amount')
+TOTALS = (*INVOICE_TOTALS, 'customers', 'products')
+
+
+def version_key(owner_id):
+    return f'owner_overview_version_{owner_id}'
+
+def overview_cache_key(owner_id, version):
+    return f'owner_overview_{owner_id}_{version}'
+
+def bump_overview(owner_id):
+    """Invalidate the cached overview of one owner."""
+    key = version_key(owner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+def bump_business_overview(business_id):
+    """bump_overview for the owner of a business."""
+    business = cache.get(business_cache_key(business_id))
+    if business is not None:
+        owner_id = business.owner_id
+    else:
+        owner_id = api_models.Business.objects.filter(id=business_id).values_list('owner_id', flat=True).first()
+    if owner_id is not None:
+        bump_overview(owner_id)
+
+def bump_businesses_overview(business_ids):
+    """bump_overview for the owners of several businesses."""
+    owner_ids = api_models.Business.objects.filter(id__in=set(business_ids)).values_list('owner_id', flat=True).distinct()
+    for owner_id in owner_ids:
+        bump_overview(owner_id)
+
+def _zero_totals():
+    return {name: Decimal(0) if name in AMOUNTS else 0 for name in TOTALS}
+
+def _business_totals(business_ids, using):
+    """{business id: totals} of businesses whose rows live on `using`."""
+    totals = {business_id: _zero_totals() for business_id in business_ids}
+    invoices = (
+        api_models.Invoice.objects.using(using).filter(business_id__in=business_ids)
+        .values('business_id').annotate(**INVOICE_TOTALS)
+    )
+    for row in invoices:
+        business_id = row.pop('business_id')
+        totals[business_id].update({name: value for name, value in row.items() if value is not None})
+    customers = (
+        api_models.Customer.objects.using(using).filter(business_id__in=business_ids)
+        .values('business_id').annotate(count=Count('id')).values_list('business_id', 'count')
+    )
+    for business_id, count in customers:
+        totals[business_id]['customers'] = count
+    products = (
+        api_models.Product.objects.using(using).filter(owner_id__in=business_ids)
+        .values('owner_id').annotate(count=Count('id')).values_list('owner_id', 'count')
+    )
+    for business_id, count in products:
+        totals[business_id]['products'] = count
+    return totals
+
+def compute_overview(owner_id):
+    businesses = list(api_models.Business.objects.filter(owner_id=owner_id).values('id', 'name', 'currency'))
+
+    by_database = defaultdict(list)
+    for business_id, found in placements([business['id'] for business in businesses]).items():
+        by_database[found.database].append(business_id)
+    totals = {}
+    for database, business_ids in by_database.items():
+        totals.update(_business_totals(business_ids, database))
+
+    currencies = {}
+    for business in businesses:
+        business.update(totals[business['id']])
+        currency = currencies.setdefault(business['currency'], {'currency': business['currency'], 'businesses': 0, **_zero_totals()})
+        currency['businesses'] += 1
+        for name in TOTALS:
+            currency[name] += business[name]
+    return {"businesses": businesses, "currencies": sorted(currencies.values(), key=lambda row: row['currency'])}
+
+def owner_overview(owner_id):
+    """The overview of the businesses of `owner_id`, from the cache when it is current."""
+    key = overview_cache_key(owner_id, cache.get(version_key(owner_id), 0))
+    overview = cache.get(key)
+    cache_lookup('owner_overview', overview is not None)
+    if overview is None:
+        overview = compute_overview(owner_id)
+        cache.set(key, overview, timeout=OWNER_OVERVIEW_CACHE_TIMEOUT)
+    return overview
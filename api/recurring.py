@@ -0,0 +1,130 @@
+import time
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings # type:ignore
+from django.db import DEFAULT_DB_ALIAS, transaction # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+from userauth.models import User # type:ignore
+from api.overview import bump_overview
+from api.shards import tenant_databases, use_database
+
+CLONED_FIELDS = ['owner_id', 'business_id', 'customer_id', 'signature_id', 'title', 'description', 'total', 'discount', 'grand_total']
+
+
+def reserve_invoices(owner, count):
+    """
+    How many of `count` new invoices the plan of `owner` allows, counted
+    in PlanUsage like the invoices created through the API.
+    """
+    limit = api_models.PlanUsage.invoice_limit(owner)
+    if api_models.PlanUsage.reserve(owner, "invoices", limit, amount=count):
+        return count
+    # Close to the limit: take what is left of it one at a time
+    granted = 0
+    while granted < count and api_models.PlanUsage.reserve(owner, "invoices", limit):
+        granted += 1
+    return granted
+
+def generate_batch(cutoff, interval, batch_size, using=DEFAULT_DB_ALIAS):
+    """
+    Clone up to `batch_size` recurring invoices on database `using` that
+    are due at `cutoff`.
+
+    The clones, their items and the advanced schedule of the source
+    invoices are written in one transaction, so a batch either fully
+    happens or not at all and re-running never duplicates an occurrence.
+    Occurrences past the invoice limit of the owner's plan are skipped
+    and notified instead. Returns the number of invoices generated and
+    the number skipped.
+    """
+    with use_database(using), transaction.atomic(using=using):
+        sources = list(
+            api_models.Invoice.objects.select_for_update(skip_locked=True)
+            .filter(is_recurring=True, next_recurrence_at__lte=cutoff)
+            .order_by('next_recurrence_at')[:batch_size]
+        )
+        if not sources:
+            return 0, 0
+
+        # Owners live on `default`, whichever database holds their invoices
+        owners = User.objects.in_bulk({source.owner_id for source in sources})
+        granted = {
+            owner_id: reserve_invoices(owners[owner_id], count)
+            for owner_id, count in Counter(source.owner_id for source in sources).items()
+        }
+
+        clones, cloned_sources, skipped = [], [], []
+        for source in sources:
+            if granted[source.owner_id]:
+                granted[source.owner_id] -= 1
+                clones.append(api_models.Invoice(
+                    recurring_parent=source,
+                    date_due=source.date_due + interval * (source.recurrence_count + 1) if source.date_due else None,
+                    **{field: getattr(source, field) for field in CLONED_FIELDS}
+                ))
+                cloned_sources.append(source)
+            else:
+                skipped.append(source)
+            source.next_recurrence_at += interval
+            source.recurrence_count += 1
+
+        api_models.Invoice.objects.bulk_create(clones, batch_size=batch_size)
+
+        clone_by_source = {source.id: clone for source, clone in zip(cloned_sources, clones)}
+        items = [
+            api_models.Invoice_item(invoice=clone_by_source[invoice_id], product_id=product_id, quantity=quantity)
+            for invoice_id, product_id, quantity in api_models.Invoice_item.objects.filter(
+                invoice_id__in=clone_by_source
+            ).values_list('invoice_id', 'product_id', 'quantity').iterator()
+        ]
+        api_models.Invoice_item.objects.bulk_create(items, batch_size=batch_size)
+
+        api_models.Invoice.objects.bulk_update(sources, ['next_recurrence_at', 'recurrence_count'], batch_size=batch_size)
+
+        for owner_id in {clone.owner_id for clone in clones}:
+            transaction.on_commit(partial(bump_overview, owner_id), using=using)
+
+        api_models.Notification.objects.bulk_create(
+            [
+                api_models.Notification(
+                    business_id=clone.business_id,
+                    title="Recurring invoice created",
+                    description=f'Invoice {clone.Uid} was generated from recurring invoice {source.Uid}',
+                    type="invoice_created"
+                )
+                for source, clone in zip(cloned_sources, clones)
+            ] + [
+                api_models.Notification(
+                    business_id=source.business_id,
+                    title="Recurring invoice skipped",
+                    description=f'Recurring invoice {source.Uid} was not generated again because of your current plan, please upgrade your plan to create more invoices.',
+                    type="invoice_creation_failed"
+                )
+                for source in skipped
+            ],
+            batch_size=batch_size,
+        )
+
+    return len(clones), len(skipped)
+
+def generate_recurring_invoices(interval_days=None, batch_size=500, time_budget=None):
+    """
+    Generate every due occurrence in batches until nothing is due or the
+    time budget (in seconds) runs out. Returns the number generated.
+    """
+    interval = timedelta(days=interval_days or settings.RECURRING_INVOICE_INTERVAL_DAYS)
+    cutoff = now()
+    deadline = time.monotonic() + time_budget if time_budget else None
+    generated = 0
+
+    for database in tenant_databases():
+        while deadline is None or time.monotonic() < deadline:
+            created, skipped = generate_batch(cutoff, interval, batch_size, database)
+            if not created and not skipped:
+                break
+            generated += created
+
+    return generated
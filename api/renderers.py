@@ -0,0 +1,84 @@
+"""
+Fast JSON, and MessagePack for the mobile clients.
+
+ORJSONRenderer and ORJSONParser replace DRF's JSON pair with orjson.
+MessagePackRenderer and MessagePackParser answer and read
+`application/msgpack` when the optional msgpack package is installed
+(settings.MSGPACK).
+
+Values neither library handles natively (Decimal, lazy translation
+strings, querysets, ...) and datetimes go through DRF's JSONEncoder, so
+both encode them exactly as JSONRenderer does.
+"""
+import orjson # type:ignore
+from rest_framework.exceptions import ParseError # type:ignore
+from rest_framework.parsers import BaseParser # type:ignore
+from rest_framework.renderers import BaseRenderer, JSONRenderer # type:ignore
+from rest_framework.utils.encoders import JSONEncoder # type:ignore
+
+try:
+    import msgpack # type:ignore
+except ImportError:
+    msgpack = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_encoder = JSONEncoder()
+
+
+def encode_default(value):
+    return _encoder.default(value)
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            # The only indent orjson has
+            options |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=encode_default, option=options)
+        # Escaped like JSONRenderer does, so the output is valid JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+def renderer_for(request):
+    """The renderer a plain Django request accepts: MessagePack if it asks for it, else JSON."""
+    if msgpack is not None and MessagePackRenderer.media_type in request.headers.get('Accept', ''):
+        return MessagePackRenderer()
+    return ORJSONRenderer()
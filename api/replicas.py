@@ -0,0 +1,140 @@
+"""
+Read replicas.
+
+ReplicaRoutingMiddleware decides per request whether its reads may go
+to a replica: only GET, HEAD and OPTIONS requests from a client that
+hasn't written in the last REPLICA_STICKY_SECONDS do. ReplicaRouter then
+sends their reads to one replica for the whole request, and everything
+else, writes included, to `default`. A request that writes switches
+its remaining reads back to `default` and pins its client there.
+
+Replicas whose lag is over REPLICA_MAX_LAG seconds, or that can't be
+reached, are left out until their next check.
+"""
+import hashlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings # type:ignore
+from django.core.cache import cache # type:ignore
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections # type:ignore
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Authentication reads a token or session right after the request that
+# created it, before a replica may have it
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+# The ReadRouting of the request being served, None outside requests so
+# commands and background threads only ever see `default`
+routing = ContextVar('replica_routing', default=None)
+
+
+class ReadRouting:
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+
+def replica_lag(alias):
+    """Seconds `alias` is behind its primary. 0 for backends without replication."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        # An idle primary sends nothing to replay, so a replica that has
+        # replayed everything it received is not behind
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+class LagMonitor:
+    """Which replicas are usable, rechecked every REPLICA_LAG_CHECK_INTERVAL seconds."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.checked = {}
+
+    def healthy(self, alias):
+        with self._lock:
+            checked_at, healthy = self.checked.get(alias, (None, False))
+            if checked_at is not None and time.monotonic() - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+                return healthy
+            # Other requests keep the last answer while this one checks
+            self.checked[alias] = (time.monotonic(), healthy)
+
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError as error:
+            logger.warning("Replica %s is unavailable: %s", alias, error)
+            healthy = False
+        else:
+            healthy = lag <= settings.REPLICA_MAX_LAG
+            if not healthy:
+                logger.warning("Replica %s is %.1fs behind, reading from %s", alias, lag, DEFAULT_DB_ALIAS)
+        with self._lock:
+            self.checked[alias] = (time.monotonic(), healthy)
+        return healthy
+
+
+monitor = LagMonitor()
+
+
+def choose_replica():
+    healthy = [alias for alias in settings.DATABASE_REPLICAS if monitor.healthy(alias)]
+    return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+def pin_key(request):
+    """Cache key pinning the client of `request` to the primary, None for anonymous clients."""
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credential:
+        return None
+    return 'primary_pin_' + hashlib.sha256(credential.encode()).hexdigest()
+
+def may_use_replica(request):
+    if request.method not in SAFE_METHODS:
+        return False
+    key = pin_key(request)
+    return key is None or cache.get(key) is None
+
+def pin_to_primary(request):
+    key = pin_key(request)
+    if key is not None:
+        cache.set(key, True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing.get()
+        if (
+            state is None or not state.use_replica or state.wrote
+            or model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            # One replica per request so all its reads see the same snapshot
+            state.replica = choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Explicit, or Django would save instances read from a replica back to it
+        state = routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,211 @@
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.db import DEFAULT_DB_ALIAS, connections # type:ignore
+from django.db.models import Q # type:ignore
+from api import models as api_models
+
+SEARCH_KINDS = ('invoice', 'customer', 'product')
+
+# On SQLite every searchable row lives in the api_search FTS5 table under
+# rowid = object id * 4 + kind code, so triggers can update it by rowid.
+SQLITE_KIND_CODES = {'invoice': 1, 'customer': 2, 'product': 3}
+
+# On PostgreSQL the documents are expressions over the source tables. They
+# must match the expression indexes created in the search migration exactly.
+POSTGRES_DOCUMENTS = {
+    'invoice': {
+        'table': 'api_invoice',
+        'business_column': 'business_id',
+        'title': 'title',
+        'subtitle': '"Uid"',
+        'document': "(coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(\"Uid\", ''))",
+    },
+    'customer': {
+        'table': 'api_customer',
+        'business_column': 'business_id',
+        'title': 'full_name',
+        'subtitle': 'email',
+        'document': "(coalesce(full_name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(phone_number, ''))",
+    },
+    'product': {
+        'table': 'api_product',
+        'business_column': 'owner_id',
+        'title': 'name',
+        'subtitle': "''",
+        'document': "coalesce(name, '')",
+    },
+}
+
+# kind, code, table, business column, title, subtitle, body
+SQLITE_SOURCES = [
+    ('invoice', 1, 'api_invoice', 'business_id', '{row}.title', '{row}."Uid"', "coalesce({row}.description, '')"),
+    ('customer', 2, 'api_customer', 'business_id', '{row}.full_name', '{row}.email', "coalesce({row}.phone_number, '')"),
+    ('product', 3, 'api_product', 'owner_id', '{row}.name', "''", "''"),
+]
+
+# Other databases have no search index and fall back to icontains over the
+# same columns: kind, model, business field, title, subtitle, other columns
+FALLBACK_SOURCES = [
+    ('invoice', api_models.Invoice, 'business_id', 'title', 'Uid', ('description',)),
+    ('customer', api_models.Customer, 'business_id', 'full_name', 'email', ('phone_number',)),
+    ('product', api_models.Product, 'owner_id', 'name', None, ()),
+]
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search(business_id, query, kinds=SEARCH_KINDS, limit=20, offset=0, using=DEFAULT_DB_ALIAS):
+    """
+    Ranked search over a business's invoices, customers and products.
+
+    Returns up to `limit` dicts with type, id, title, subtitle and rank,
+    best match first. `using` is the database holding the business's rows.
+    Databases other than PostgreSQL and SQLite have no search index, their
+    matches are unranked and newest first.
+    """
+    kinds = [kind for kind in kinds if kind in SEARCH_KINDS]
+    if not kinds or not TOKEN_RE.search(query or ''):
+        return []
+
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return _search_postgres(connection, business_id, query, kinds, limit, offset)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(connection, business_id, query, kinds, limit, offset)
+    return _search_fallback(using, business_id, query, kinds, limit, offset)
+
+def _search_sqlite(connection, business_id, query, kinds, limit, offset):
+    # Every word becomes a quoted prefix term, so user input can't inject
+    # FTS5 query syntax and "acm" still finds "Acme".
+    match = ' '.join('"%s"*' % token for token in TOKEN_RE.findall(query))
+    kind_codes = {SQLITE_KIND_CODES[kind]: kind for kind in kinds}
+
+    sql = (
+        "SELECT rowid, title, subtitle, bm25(api_search) AS rank FROM api_search "
+        "WHERE api_search MATCH %s AND business_id = %s AND (rowid & 3) IN (" + ', '.join(['%s'] * len(kind_codes)) + ") "
+        "ORDER BY rank LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, business_id, *kind_codes, limit, offset])
+        rows = cursor.fetchall()
+
+    return [
+        {'type': kind_codes[rowid % 4], 'id': rowid // 4, 'title': title, 'subtitle': subtitle, 'rank': -rank}
+        for rowid, title, subtitle, rank in rows
+    ]
+
+def _search_postgres(connection, business_id, query, kinds, limit, offset):
+    like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    selects = []
+    params = []
+    for kind in kinds:
+        document = POSTGRES_DOCUMENTS[kind]
+        # The tsvector match uses the GIN tsvector index, the ILIKE uses the
+        # trigram index, which also covers partial e-mails, phones and Uids.
+        selects.append(
+            "SELECT %s AS type, id, {title} AS title, {subtitle} AS subtitle, "
+            "ts_rank(to_tsvector('simple', {document}), websearch_to_tsquery('simple', %s)) "
+            "+ similarity({document}, %s) AS rank "
+            "FROM {table} WHERE {business_column} = %s AND ("
+            "to_tsvector('simple', {document}) @@ websearch_to_tsquery('simple', %s) "
+            "OR {document} ILIKE %s)".format(**document)
+        )
+        params += [kind, query, query, business_id, query, like]
+
+    sql = (
+        "SELECT type, id, title, subtitle, rank FROM (" + " UNION ALL ".join(selects) + ") AS results "
+        "ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        rows = cursor.fetchall()
+
+    return [
+        {'type': kind, 'id': object_id, 'title': title, 'subtitle': subtitle, 'rank': float(rank)}
+        for kind, object_id, title, subtitle, rank in rows
+    ]
+
+def _search_fallback(using, business_id, query, kinds, limit, offset):
+    # Unranked: every word must be in one of the columns, newest first
+    tokens = TOKEN_RE.findall(query)
+    results = []
+    for kind, model, business_field, title, subtitle, others in FALLBACK_SOURCES:
+        if kind not in kinds:
+            continue
+        columns = [title, *filter(None, [subtitle]), *others]
+        match = reduce(and_, (reduce(or_, (Q(**{f'{column}__icontains': token}) for column in columns)) for token in tokens))
+        rows = (
+            model.objects.using(using).filter(match, **{business_field: business_id})
+            .order_by('-id').values_list('id', title, *filter(None, [subtitle]))[:offset + limit]
+        )
+        results += [
+            {'type': kind, 'id': row[0], 'title': row[1], 'subtitle': row[2] if subtitle else '', 'rank': 0.0}
+            for row in rows
+        ]
+    results.sort(key=lambda result: result['id'], reverse=True)
+    return results[offset:offset + limit]
+
+def sqlite_statements():
+    # SQLite drops triggers when Django rebuilds a table during a migration:
+    # a migration altering a source table recreates them after, as 0042 does.
+    yield (
+        "CREATE VIRTUAL TABLE api_search USING fts5("
+        "title, subtitle, body, business_id UNINDEXED, tokenize='unicode61', prefix='2 3')"
+    )
+    for kind, code, table, business_column, title, subtitle, body in SQLITE_SOURCES:
+        def values(row):
+            return "{row}.id * 4 + {code}, {title}, {subtitle}, {body}, {row}.{business_column}".format(
+                row=row, code=code, title=title.format(row=row), subtitle=subtitle.format(row=row),
+                body=body.format(row=row), business_column=business_column,
+            )
+
+        yield (
+            f"INSERT INTO api_search(rowid, title, subtitle, body, business_id) "
+            f"SELECT {values(table)} FROM {table}"
+        )
+        yield (
+            f"CREATE TRIGGER api_search_{kind}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO api_search(rowid, title, subtitle, body, business_id) VALUES ({values('new')}); END"
+        )
+        yield (
+            f"CREATE TRIGGER api_search_{kind}_update AFTER UPDATE ON {table} BEGIN "
+            f"DELETE FROM api_search WHERE rowid = old.id * 4 + {code}; "
+            f"INSERT INTO api_search(rowid, title, subtitle, body, business_id) VALUES ({values('new')}); END"
+        )
+        yield (
+            f"CREATE TRIGGER api_search_{kind}_delete AFTER DELETE ON {table} BEGIN "
+            f"DELETE FROM api_search WHERE rowid = old.id * 4 + {code}; END"
+        )
+
+def postgres_statements():
+    yield "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+    for kind, document in POSTGRES_DOCUMENTS.items():
+        table, document = document['table'], document['document']
+        yield f"CREATE INDEX IF NOT EXISTS api_search_{kind}_tsv ON {table} USING gin (to_tsvector('simple', {document}))"
+        yield f"CREATE INDEX IF NOT EXISTS api_search_{kind}_trgm ON {table} USING gin ({document} gin_trgm_ops)"
+
+def create_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = sqlite_statements()
+    elif vendor == 'postgresql':
+        statements = postgres_statements()
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for kind, *_ in SQLITE_SOURCES:
+            for event in ('insert', 'update', 'delete'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS api_search_{kind}_{event}")
+        schema_editor.execute("DROP TABLE IF EXISTS api_search")
+    elif vendor == 'postgresql':
+        for kind in POSTGRES_DOCUMENTS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_search_{kind}_tsv")
+            schema_editor.execute(f"DROP INDEX IF EXISTS api_search_{kind}_trgm")
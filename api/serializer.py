@@ -1,10 +1,80 @@
 from . import models as api_models
+from .shards import is_tenant_model, locate
 from userauth.models import User
 from django.contrib.auth.password_validation import validate_password # type:ignore
 from rest_framework import serializers # type:ignore
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer # type:ignore
 from rest_framework.authtoken.models import Token # type:ignore
 
+SPARSE_METHODS = ('GET', 'HEAD')
+
+
+def requested_names(request, param):
+    """The comma separated names of the `param` query parameter of a GET, None without one."""
+    if request is None or request.method not in SPARSE_METHODS:
+        return None
+    value = getattr(request, 'query_params', request.GET).get(param)
+    if value is None:
+        return None
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+class SparseFieldsMixin:
+    """
+    `?fields=` and `?expand=` for the model serializers of GET requests.
+
+    `fields` picks the fields that are serialized and `expand` the
+    relations nested in full. Once either is given, relations left out
+    of `expand` are serialized as their primary key. Without them every
+    field is serialized and relations are nested, as before. Unknown
+    names are ignored.
+
+    Views narrow their queryset to match with narrow_queryset().
+    """
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        fields = requested_names(self.context.get('request'), 'fields')
+        if not fields:
+            return names
+        return [name for name in names if name in fields]
+
+    def build_nested_field(self, field_name, relation_info, nested_depth):
+        request = self.context.get('request')
+        expand = requested_names(request, 'expand')
+        if (expand is not None or requested_names(request, 'fields')) and field_name not in (expand or ()):
+            return self.build_relational_field(field_name, relation_info)
+        return super().build_nested_field(field_name, relation_info, nested_depth)
+
+    @classmethod
+    def narrow_queryset(cls, queryset, request, keep=()):
+        """
+        `queryset` loading only what the serializer will output for
+        `request`, plus the `keep` fields the view reads itself and the
+        foreign key of a related manager (`business.customer_set`), which
+        sets it on every row. Expanded relations on the same database are
+        joined, the others (businesses and users, see api.shards)
+        prefetched.
+        """
+        fields, expand = requested_names(request, 'fields'), requested_names(request, 'expand')
+        if not fields and expand is None:
+            return queryset
+
+        model_fields = {field.name: field for field in cls.Meta.model._meta.concrete_fields}
+        names = [name for name in (fields or model_fields) if name in model_fields]
+        known = {field.name for field in queryset._known_related_objects}
+        queryset = queryset.select_related(None).prefetch_related(None).only(*names, *keep, *known)
+        for name in expand or ():
+            field = model_fields.get(name)
+            if name not in names or not field.is_relation or name in known:
+                continue
+            if is_tenant_model(field.related_model):
+                queryset = queryset.select_related(name)
+            else:
+                many = [f'{name}__{related.name}' for related in field.related_model._meta.many_to_many]
+                queryset = queryset.prefetch_related(name, *many)
+        return queryset
+
 
 class UserSerializer(serializers.ModelSerializer):
 
@@ -82,17 +152,15 @@ class TokenLoginSerializer(serializers.Serializer):
         """
         token = data.get("token")
         try:
-            login_token = api_models.LoginToken.objects.get(token=token)
+            login_token = api_models.LoginToken.get_valid(token)
         except api_models.LoginToken.DoesNotExist:
-            raise serializers.ValidationError("Invalid token.")
-
-        if not login_token.is_valid():
-            raise serializers.ValidationError("Token has expired.")
+            raise serializers.ValidationError("Invalid or expired token.")
 
+        self.login_token = login_token
         self.user = login_token.user
         return data        
 
-class BusinessSerializer(serializers.ModelSerializer):
+class BusinessSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Business
         fields = "__all__"
@@ -105,7 +173,12 @@ class BusinessSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1                
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class PublicBusinessSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = api_models.Business
+        fields = ['id', 'name', 'slug', 'description', 'country', 'state', 'city', 'currency', 'image', 'active']
+
+class InvoiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Invoice
         fields = "__all__"
@@ -118,7 +191,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1       
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Category
         fields = "__all__"
@@ -131,7 +204,7 @@ class CategorySerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Customer
         fields = "__all__"
@@ -144,7 +217,7 @@ class CustomerSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1
 
-class InvoiceItemSerializer(serializers.ModelSerializer):
+class InvoiceItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Invoice_item
         fields = "__all__"  
@@ -157,7 +230,7 @@ class InvoiceItemSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Product
         fields = "__all__"
@@ -179,6 +252,23 @@ class InvoiceAdminSerializer(serializers.Serializer):
     customers = serializers.IntegerField(default=0)
     products = serializers.IntegerField(default=0)
 
+class OverviewTotalsSerializer(InvoiceAdminSerializer):
+    paid_amount = serializers.DecimalField(max_digits=17, decimal_places=2, default=0)
+    outstanding_amount = serializers.DecimalField(max_digits=17, decimal_places=2, default=0)
+
+class BusinessOverviewSerializer(OverviewTotalsSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    currency = serializers.CharField()
+
+class CurrencyOverviewSerializer(OverviewTotalsSerializer):
+    currency = serializers.CharField()
+    businesses = serializers.IntegerField(default=0)
+
+class OwnerOverviewSerializer(serializers.Serializer):
+    businesses = BusinessOverviewSerializer(many=True)
+    currencies = CurrencyOverviewSerializer(many=True)
+
 class DashboardStatsSerializer(serializers.Serializer):
     month = serializers.CharField()
     invoices = serializers.IntegerField(default=0)
@@ -188,7 +278,7 @@ class InvoiceStatsSerializer(serializers.Serializer):
     invoices = serializers.IntegerField(default=0)
     paid = serializers.IntegerField(default=0)
 
-class ReceiptSerializer(serializers.ModelSerializer):
+class ReceiptSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Receipt
         fields = "__all__"
@@ -201,7 +291,7 @@ class ReceiptSerializer(serializers.ModelSerializer):
         else:
             self.Meta.depth = 1
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = api_models.Notification
         fields = "__all__"
@@ -223,12 +313,9 @@ class InvoiceAccessTokenSerializer(serializers.Serializer):
         """
         token = data.get("token")
         try:
-            invoice_access_token = api_models.InvoiceAccessToken.objects.get(token=token)
+            invoice_access_token = locate(api_models.InvoiceAccessToken.valid(token))
         except api_models.InvoiceAccessToken.DoesNotExist:
-            raise serializers.ValidationError("Invalid token.")
-
-        if not invoice_access_token.is_valid():
-            raise serializers.ValidationError("Token has expired.")
+            raise serializers.ValidationError("Invalid or expired token.")
 
         self.invoice = invoice_access_token.invoice
         return data        
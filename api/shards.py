@@ -0,0 +1,362 @@
+"""
+Sharding by business.
+
+Every row of the tenant tables (TENANT_MODELS) belongs to one business,
+and all rows of a business live in one database: `default`, unless its
+BusinessShard row names one of DATABASE_SHARDS. Business itself, users,
+tokens and the other global tables only live on `default`.
+
+ShardRouter sends a tenant query to the database of
+- the business or tenant object it goes through (business.invoice_set,
+  invoice.invoice_item_set, instance.save(), ...), else
+- the business the request resolved (resolve_business, locate), else
+- the database of a use_database() block, else `default`.
+
+Each shard hands out ids from its own range of SHARD_ID_SPAN ids, so
+rows keep their ids when move_business copies them to another shard.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async # type:ignore
+from django.apps import apps # type:ignore
+from django.conf import settings # type:ignore
+from django.core.cache import cache # type:ignore
+from django.core.exceptions import ImproperlyConfigured # type:ignore
+from django.db import DEFAULT_DB_ALIAS, connections, transaction # type:ignore
+from rest_framework import status # type:ignore
+from rest_framework.exceptions import APIException # type:ignore
+from api import models as api_models
+from api.metrics import cache_lookup
+
+SHARD_ID_SPAN = 2 ** 40
+# Backends reserve_id_range() can start the ids of (checked by api.checks)
+SHARD_VENDORS = ('postgresql', 'sqlite')
+
+# Tenant models, parents first, with the field pointing at their business
+# (None: through their invoice)
+TENANT_MODELS = {
+    'signature': 'business',
+    'category': 'business',
+    'customer': 'business',
+    'product': 'owner',
+    'invoice': 'business',
+    'receipt': 'business',
+    'notification': 'business',
+    'invoice_item': None,
+    'invoiceaccesstoken': None,
+}
+
+
+class Placement(NamedTuple):
+    database: str
+    moving: bool = False
+
+
+DEFAULT_PLACEMENT = Placement(DEFAULT_DB_ALIAS)
+
+
+class ShardRouting:
+    def __init__(self, placement=None):
+        self.placement = placement
+        self.placements = {}
+
+
+# The ShardRouting of the request or use_database() block being run
+shard_routing = ContextVar('shard_routing', default=None)
+
+
+class BusinessMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "This business is being moved to another database, try again in a minute."
+    default_code = 'business_moving'
+
+
+def tenant_databases():
+    return [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]
+
+def tenant_models():
+    return [apps.get_model('api', name) for name in TENANT_MODELS]
+
+def is_tenant_model(model):
+    return model._meta.app_label == 'api' and model._meta.model_name in TENANT_MODELS
+
+def shard_index(database):
+    return 0 if database == DEFAULT_DB_ALIAS else int(database.rsplit('_', 1)[1])
+
+def placement_cache_key(business_id):
+    return f'business_shard_{business_id}'
+
+def placement(business_id):
+    """Where the rows of a business live, looked up once per request."""
+    if not settings.DATABASE_SHARDS:
+        return DEFAULT_PLACEMENT
+    state = shard_routing.get()
+    if state is not None and business_id in state.placements:
+        return state.placements[business_id]
+
+    key = placement_cache_key(business_id)
+    found = cache.get(key)
+    cache_lookup('business_shard', found is not None)
+    if found is None:
+        # Never from a replica, which may not have seen a move yet
+        directory = api_models.BusinessShard.objects.using(DEFAULT_DB_ALIAS)
+        row = directory.filter(business_id=business_id).values_list('database', 'moving').first()
+        found = Placement(*row) if row else DEFAULT_PLACEMENT
+        cache.set(key, tuple(found), timeout=settings.SHARD_DIRECTORY_CACHE_TIMEOUT)
+    found = Placement(*found)
+
+    if state is not None:
+        state.placements[business_id] = found
+    return found
+
+def placements(business_ids):
+    """placement() of several businesses, with one cache and one directory lookup."""
+    if not settings.DATABASE_SHARDS:
+        return {business_id: DEFAULT_PLACEMENT for business_id in business_ids}
+    state = shard_routing.get()
+    known = state.placements if state is not None else {}
+    found = {business_id: known[business_id] for business_id in business_ids if business_id in known}
+
+    missing = [business_id for business_id in business_ids if business_id not in found]
+    cached = cache.get_many([placement_cache_key(business_id) for business_id in missing])
+    for business_id in missing:
+        key = placement_cache_key(business_id)
+        cache_lookup('business_shard', key in cached)
+        if key in cached:
+            found[business_id] = Placement(*cached[key])
+
+    missing = [business_id for business_id in missing if business_id not in found]
+    if missing:
+        directory = api_models.BusinessShard.objects.using(DEFAULT_DB_ALIAS)
+        rows = {
+            business_id: Placement(database, moving)
+            for business_id, database, moving in directory.filter(business_id__in=missing).values_list('business_id', 'database', 'moving')
+        }
+        looked_up = {business_id: rows.get(business_id, DEFAULT_PLACEMENT) for business_id in missing}
+        cache.set_many(
+            {placement_cache_key(business_id): tuple(found) for business_id, found in looked_up.items()},
+            timeout=settings.SHARD_DIRECTORY_CACHE_TIMEOUT,
+        )
+        found.update(looked_up)
+
+    if state is not None:
+        state.placements.update(found)
+    return found
+
+def activate(business_id):
+    """Send the unqualified tenant queries of this request to the database of `business_id`."""
+    state = shard_routing.get()
+    if state is not None and settings.DATABASE_SHARDS:
+        state.placement = placement(business_id)
+
+@contextmanager
+def use_database(database):
+    """Send the unqualified tenant queries of the block to `database`."""
+    token = shard_routing.set(ShardRouting(Placement(database)))
+    try:
+        yield
+    finally:
+        shard_routing.reset(token)
+
+def business_id_of(instance):
+    field = TENANT_MODELS[instance._meta.model_name]
+    if field is not None:
+        return getattr(instance, f'{field}_id')
+    invoice = instance._meta.get_field('invoice')
+    return instance.invoice.business_id if invoice.is_cached(instance) else None
+
+def locate(queryset, **lookup):
+    """
+    queryset.get(**lookup) on whichever tenant database has the row, for
+    views that reach a tenant object by its Uid or id instead of through
+    its business. That database then serves the rest of the request.
+    """
+    databases = tenant_databases()
+    for database in databases:
+        try:
+            # `default` stays unqualified so reads can still go to a replica
+            instance = (queryset if database == DEFAULT_DB_ALIAS else queryset.using(database)).get(**lookup)
+        except queryset.model.DoesNotExist:
+            if database == databases[-1]:
+                raise
+            continue
+        state = shard_routing.get()
+        if state is not None and len(databases) > 1:
+            business_id = business_id_of(instance)
+            state.placement = placement(business_id) if business_id is not None else Placement(database)
+        return instance
+
+async def alocate(queryset, **lookup):
+    """locate() for the async views."""
+    if not settings.DATABASE_SHARDS:
+        return await queryset.aget(**lookup)
+    return await sync_to_async(locate)(queryset, **lookup)
+
+
+class ShardRouter:
+    """
+    Routes tenant models to their business's database. Answers None for
+    everything on `default`, so ReplicaRouter can still pick a replica.
+    """
+
+    def _placement(self, hints, reading):
+        instance = hints.get('instance')
+        if isinstance(instance, api_models.Business):
+            return placement(instance.pk)
+        if instance is not None and is_tenant_model(type(instance)):
+            if reading and instance._state.db:
+                return Placement(instance._state.db)
+            business_id = business_id_of(instance)
+            if business_id is not None:
+                return placement(business_id)
+            if instance._state.db in settings.DATABASE_SHARDS:
+                return Placement(instance._state.db)
+        state = shard_routing.get()
+        return state.placement if state is not None else None
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_SHARDS or not is_tenant_model(model):
+            return None
+        found = self._placement(hints, reading=True)
+        if found is None or found.database == DEFAULT_DB_ALIAS:
+            return None
+        return found.database
+
+    def db_for_write(self, model, **hints):
+        if not settings.DATABASE_SHARDS or not is_tenant_model(model):
+            return None
+        found = self._placement(hints, reading=False)
+        if found is None:
+            return None
+        if found.moving:
+            raise BusinessMoving()
+        return found.database if found.database != DEFAULT_DB_ALIAS else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {*tenant_databases(), *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards get every table, but data migrations (RunPython without a
+        # model) backfill rows of `default` and would run against it again
+        # through the router. Shards start empty and move_business copies
+        # rows over, so only the ones hinted `shards` run there.
+        if db in settings.DATABASE_SHARDS and model_name is None and not hints.get('shards'):
+            return False
+        return None
+
+
+def reserve_id_range(sender, using, **kwargs):
+    """
+    post_migrate receiver starting the ids of the tenant tables of a shard
+    at the beginning of its range, so they never collide with rows moved
+    in from other shards.
+    """
+    if using not in settings.DATABASE_SHARDS:
+        return
+    connection = connections[using]
+    start = shard_index(using) * SHARD_ID_SPAN
+    with connection.cursor() as cursor:
+        for model in tenant_models():
+            table = model._meta.db_table
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)} WHERE id >= %s AND id < %s",
+                [start, start + SHARD_ID_SPAN],
+            )
+            if cursor.fetchone()[0]:
+                continue
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)", [table, start])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = %s", [table])
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start - 1])
+            else:
+                # api.checks refuses these at boot
+                raise ImproperlyConfigured(f"Shards are not supported on {connection.vendor}")
+
+def business_rows(business_id, database):
+    """(model, queryset) of every tenant row of a business on `database`, parents first."""
+    rows = []
+    for model in tenant_models():
+        field = TENANT_MODELS[model._meta.model_name]
+        lookup = {f'{field}_id': business_id} if field else {'invoice__business_id': business_id}
+        rows.append((model, model._base_manager.using(database).filter(**lookup).order_by('pk')))
+    return rows
+
+def set_placement(business_id, database, moving=False):
+    if database == DEFAULT_DB_ALIAS and not moving:
+        api_models.BusinessShard.objects.filter(business_id=business_id).delete()
+    else:
+        api_models.BusinessShard.objects.update_or_create(
+            business_id=business_id, defaults={'database': database, 'moving': moving},
+        )
+    cache.delete(placement_cache_key(business_id))
+
+def place_new_business(business):
+    """Put a new business on one of SHARD_NEW_BUSINESSES, spread by id."""
+    databases = settings.SHARD_NEW_BUSINESSES
+    if databases and settings.DATABASE_SHARDS:
+        database = databases[business.id % len(databases)]
+        if database != DEFAULT_DB_ALIAS:
+            set_placement(business.id, database)
+
+def delete_business_rows(business_id):
+    """Delete the rows of a business that the cascade from Business can't reach."""
+    database = placement(business_id).database
+    if database == DEFAULT_DB_ALIAS:
+        return
+    for model, queryset in reversed(business_rows(business_id, database)):
+        queryset.delete()
+
+def move_business(business_id, target, settle=None, log=print):
+    """
+    Move every tenant row of a business to the `target` database.
+
+    Reads are served from the old database until the copy is done.
+    Writes answer 503 (BusinessMoving) from the moment every worker has
+    seen the business flagged as moving until it points at `target`.
+    `settle` is how long workers may keep an old placement cached,
+    SHARD_DIRECTORY_CACHE_TIMEOUT by default. Returns the rows moved.
+    """
+    if target not in tenant_databases():
+        raise ValueError(f"{target} is not a tenant database, expected one of {', '.join(tenant_databases())}")
+    settle = settings.SHARD_DIRECTORY_CACHE_TIMEOUT if settle is None else settle
+    row = api_models.BusinessShard.objects.using(DEFAULT_DB_ALIAS).filter(business_id=business_id).values_list('database', flat=True).first()
+    source = row or DEFAULT_DB_ALIAS
+    if source == target:
+        raise ValueError(f"Business {business_id} is already on {target}")
+
+    set_placement(business_id, source, moving=True)
+    log(f"Business {business_id} is read only, waiting {settle:g}s for workers to notice")
+    time.sleep(settle)
+
+    moved = {}
+    try:
+        with transaction.atomic(using=target):
+            for model, queryset in business_rows(business_id, source):
+                count = 0
+                for instance in queryset.iterator(chunk_size=1000):
+                    # raw keeps auto_now_add dates and generated Uids as they are
+                    instance.save_base(raw=True, force_insert=True, using=target)
+                    count += 1
+                moved[model.__name__] = count
+                log(f"  {model.__name__}: {count}")
+    except Exception:
+        set_placement(business_id, source)
+        raise
+
+    set_placement(business_id, target)
+    log(f"Business {business_id} now lives on {target}, waiting {settle:g}s before deleting it from {source}")
+    time.sleep(settle)
+
+    with transaction.atomic(using=source):
+        # Children first. A raw delete skips the signals: nothing was removed
+        # from the business, so PlanUsage and the name indexes stay as they are.
+        for model, queryset in reversed(business_rows(business_id, source)):
+            queryset.order_by()._raw_delete(source)
+    return moved
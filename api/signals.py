@@ -0,0 +1,82 @@
+from functools import partial
+
+from django.core.cache import cache # type:ignore
+from django.db import transaction # type:ignore
+from django.db.models import QuerySet # type:ignore
+from django.db.models.signals import post_save, post_delete, pre_delete # type:ignore
+from django.dispatch import receiver # type:ignore
+from api import models as api_models
+from api.mixins import business_cache_key, public_business_cache_key
+from api.autocomplete import bump_version
+from api.overview import bump_business_overview, bump_overview
+from api.shards import delete_business_rows, place_new_business
+
+
+@receiver([post_save, post_delete], sender=api_models.Business)
+def invalidate_business_cache(sender, instance, **kwargs):
+    cache.delete_many([business_cache_key(instance.id), public_business_cache_key(instance.slug)])
+
+
+@receiver(api_models.businesses_updated)
+def invalidate_updated_businesses(sender, rows, **kwargs):
+    cache.delete_many([key for business_id, slug, _ in rows for key in (business_cache_key(business_id), public_business_cache_key(slug))])
+    for owner_id in {owner_id for _, _, owner_id in rows}:
+        transaction.on_commit(partial(bump_overview, owner_id))
+
+
+@receiver(post_save, sender=api_models.Business)
+def place_business(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        place_new_business(instance)
+
+
+@receiver(pre_delete, sender=api_models.Business)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # The cascade only collects rows on the database of the business
+    delete_business_rows(instance.id)
+
+
+@receiver(post_delete, sender=api_models.Business)
+def release_business_usage(sender, instance, **kwargs):
+    api_models.PlanUsage.release(instance.owner_id, "businesses")
+
+
+@receiver(post_delete, sender=api_models.Invoice)
+def release_invoice_usage(sender, instance, **kwargs):
+    api_models.PlanUsage.release(instance.owner_id, "invoices")
+
+
+@receiver([post_save, post_delete], sender=api_models.Customer)
+@receiver([post_save, post_delete], sender=api_models.Category)
+def invalidate_name_index(sender, instance, **kwargs):
+    # Bump after commit so other workers can't rebuild from uncommitted rows
+    kind = 'customer' if sender is api_models.Customer else 'category'
+    transaction.on_commit(partial(bump_version, kind, instance.business_id))
+
+
+@receiver([post_save, post_delete], sender=api_models.Product)
+def invalidate_product_name_index(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_version, 'product', instance.owner_id))
+
+
+def deleted_with_business(origin):
+    # Tenant rows are only deleted by queryset in delete_business_rows
+    return isinstance(origin, (api_models.Business, QuerySet))
+
+
+@receiver([post_save, post_delete], sender=api_models.Business)
+@receiver([post_save, post_delete], sender=api_models.Invoice)
+def invalidate_owner_overview(sender, instance, origin=None, **kwargs):
+    if sender is api_models.Invoice and deleted_with_business(origin):
+        return
+    transaction.on_commit(partial(bump_overview, instance.owner_id))
+
+
+@receiver([post_save, post_delete], sender=api_models.Customer)
+@receiver([post_save, post_delete], sender=api_models.Product)
+def invalidate_business_overview(sender, instance, origin=None, **kwargs):
+    # The business's own signal bumps the overview once for all its rows
+    if deleted_with_business(origin):
+        return
+    business_id = instance.owner_id if sender is api_models.Product else instance.business_id
+    transaction.on_commit(partial(bump_business_overview, business_id))
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from threading import Lock, local
+
+from django.conf import settings # type:ignore
+from django.db import DatabaseError, IntegrityError, connections, transaction # type:ignore
+from django.db.models import F # type:ignore
+from django.db.models.functions import Greatest # type:ignore
+from django.utils.timezone import now # type:ignore
+from api import models as api_models
+from api.instrumentation import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# The request being served, set by QueryInstrumentationMiddleware
+current_request = ContextVar('current_request', default=None)
+
+EXPLAIN_PREFIX = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-log')
+_worker = local()
+_explained = set()
+_lock = Lock()
+
+
+def install(sender, connection, **kwargs):
+    """
+    connection_created receiver adding the slow query wrapper to every
+    connection. It goes first in the list so the execute_wrapper()
+    context managers, which pop the last wrapper, leave it alone.
+    """
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_slow_query)
+
+def current_view():
+    request = current_request.get()
+    if request is None:
+        return f"command: {' '.join(sys.argv[1:2])}"
+    match = getattr(request, 'resolver_match', None)
+    return f"{request.method} {match.route if match else request.path}"
+
+def log_slow_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        threshold = settings.SLOW_QUERY_MS
+        if threshold and elapsed_ms >= threshold and not many and not getattr(_worker, 'active', False):
+            statement = fingerprint(sql)
+            digest = hashlib.sha256(statement.encode()).hexdigest()
+            with _lock:
+                explain = digest not in _explained
+                _explained.add(digest)
+            logger.warning("Slow query %.0fms in %s: %s", elapsed_ms, current_view(), statement)
+            _executor.submit(
+                record, context['connection'].alias, digest, statement, sql, params,
+                elapsed_ms, current_view(), explain,
+            )
+
+def explain(alias, sql, params):
+    connection = connections[alias]
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return ""
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        return "\n".join(" | ".join(str(column) for column in row) for row in cursor.fetchall())
+
+def record(alias, digest, statement, sql, params, elapsed_ms, view, with_plan):
+    """
+    Add one slow execution to the SlowQuery row of its fingerprint. Runs
+    on the background thread, so the EXPLAIN and the writes don't delay
+    the request that ran the query.
+    """
+    _worker.active = True
+    try:
+        plan = explain(alias, sql, params) if with_plan else ""
+        sample = {"sql": sql, "params": repr(params)[:2000], "view": view[:255]}
+        rows = api_models.SlowQuery.objects.filter(fingerprint_hash=digest)
+        updated = rows.update(
+            count=F('count') + 1, total_ms=F('total_ms') + elapsed_ms,
+            max_ms=Greatest(F('max_ms'), elapsed_ms), last_seen=now(),
+        )
+        if updated:
+            # Keep the plan and parameters of the slowest run
+            rows.filter(max_ms__lte=elapsed_ms).update(**sample, **({"plan": plan} if plan else {}))
+            return
+        try:
+            with transaction.atomic():
+                api_models.SlowQuery.objects.create(
+                    fingerprint_hash=digest, fingerprint=statement, plan=plan,
+                    total_ms=elapsed_ms, max_ms=elapsed_ms, **sample,
+                )
+        except IntegrityError:
+            rows.update(count=F('count') + 1, total_ms=F('total_ms') + elapsed_ms, max_ms=Greatest(F('max_ms'), elapsed_ms), last_seen=now())
+    except DatabaseError:
+        logger.exception("Could not record slow query %s", statement)
+    finally:
+        _worker.active = False
+        connections.close_all()
@@ -0,0 +1,37 @@
+"""
+Static files middleware, apart from api.middleware so the API-only
+workers (speedvoice_backend.settings_api) never import WhiteNoise.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async # type:ignore
+from whitenoise.middleware import WhiteNoiseMiddleware # type:ignore
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that lets async requests through without a thread hop.
+
+    WhiteNoise 6.8 is sync only, which makes Django run everything below
+    it, async views included, on a worker thread. Static files are still
+    served by WhiteNoise itself.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -1,3 +1,1121 @@
-from django.test import TestCase
+import io
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver
+from django.utils.timezone import now
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from userauth.models import User
+
+from api import autocomplete as api_autocomplete
+from api import models as api_models
+from api import slowlog, warmup
+from api.accounting import TenantMeter
+from api.benchmark.data import seed_tenants
+from api.benchmark.runner import API_PREFIX, Tenant, dashboard_paths, endpoints, uncovered_routes
+from api.batch import BATCH_MAX_REQUESTS
+from api.checks import check_shard_vendors, check_shared_cache, require_bootable
+from api.instrumentation import QueryRecorder
+from api.metrics import collect, mark_process_dead, render
+from api.middleware import QueryBudgetExceeded, ReplicaRoutingMiddleware
+from api.mixins import business_cache_key, public_business_cache_key
+from api.models import hash_token
+from api.overdue import sweep_overdue_invoices
+from api.recurring import generate_recurring_invoices
+from api.renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer, msgpack
+from api.replicas import LagMonitor, ReadRouting, ReplicaRouter, may_use_replica, routing
+from api.search import search
+from api.shards import BusinessMoving, Placement, ShardRouter, ShardRouting, placement, shard_routing, use_database
+from api.views import refresh_invoices, save_refreshed
+from speedvoice_backend.caches import cache_config
+
+PLAN_ENVIRON = {'BASIC_PLAN': 'basic', 'PREMIUM_PLAN': 'premium'}
+SEED_DEFAULTS = dict(
+    businesses=1, invoices=1, items_per_invoice=1, customers=1, products=1,
+    categories=1, receipts=0, notifications=0,
+)
+
+
+class TenantTestCase(TestCase):
+    """
+    Seeds the businesses of `seed` (seed_tenants() arguments over
+    SEED_DEFAULTS) once per class: `tenants` has one Tenant per business,
+    the first is also `tenant`, `business`, `business_id` and `database`.
+    Each test starts with an empty cache, the plan names in the
+    environment and `client` authenticated as the owner of `tenant`.
+    """
+    seed = {}
+
+    @staticmethod
+    def load_tenants(**seed):
+        business_ids = seed_tenants(**{**SEED_DEFAULTS, **seed}, log=lambda message: None)
+        businesses = api_models.Business.objects.select_related('owner').in_bulk(business_ids)
+        return [Tenant.load(businesses[business_id]) for business_id in business_ids]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = cls.load_tenants(**cls.seed)
+        cls.business_ids = [tenant.business.id for tenant in cls.tenants]
+        cls.tenant = cls.tenants[0]
+        cls.business = cls.tenant.business
+        cls.business_id = cls.business.id
+        cls.database = placement(cls.business_id).database
+
+    def setUp(self):
+        self.enterContext(mock.patch.dict(os.environ, PLAN_ENVIRON))
+        cache.clear()
+        self.client = Client(HTTP_AUTHORIZATION=f"Token {self.tenant.token}")
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryCountTests(TenantTestCase):
+    """
+    Every endpoint must run the same number of queries whatever the size
+    of the tenant it serves, so a missing select_related or a per-row
+    query inside a loop fails here instead of in production.
+    """
+    SIZES = (2, 6, 18)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sized_tenants = {}
+        for size in cls.SIZES:
+            [cls.sized_tenants[size]] = cls.load_tenants(
+                invoices=size, items_per_invoice=3, customers=size, products=size,
+                categories=size, receipts=size, notifications=size,
+            )
+        cls.tenant = cls.sized_tenants[cls.SIZES[0]]
+
+    def issue(self, client, tenant, endpoint):
+        path, data = endpoint.build(tenant)
+        kwargs = {'data': data, 'content_type': 'application/json'} if data is not None else {}
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = getattr(client, endpoint.method)(API_PREFIX + path, **kwargs)
+        return response, recorder
+
+    def test_every_route_is_covered(self):
+        self.assertEqual(uncovered_routes(endpoints()), [])
+
+    def test_requests_over_budget_fail(self):
+        with override_settings(QUERY_BUDGET_DEFAULT=1), self.assertRaises(QueryBudgetExceeded):
+            self.client.get(f'{API_PREFIX}dashboard/admin/{self.tenant.business.id}/')
+
+    def test_query_count_does_not_grow_with_rows(self):
+        results = {}
+        for size, tenant in self.sized_tenants.items():
+            client = Client(HTTP_AUTHORIZATION=f"Token {tenant.token}")
+            for endpoint in endpoints():
+                response, recorder = self.issue(client, tenant, endpoint)
+                self.assertLess(response.status_code, 400, f"{endpoint.name} returned {response.status_code} for {size} rows")
+                results.setdefault(endpoint.name, []).append((size, recorder))
+
+        for name, runs in results.items():
+            with self.subTest(endpoint=name):
+                counts = [recorder.count for _, recorder in runs]
+                largest = runs[-1][1]
+                repeated = "\n".join(f"  {count}x {sql}" for sql, count in largest.duplicates()) or "  none"
+                self.assertEqual(
+                    len(set(counts)), 1,
+                    f"{name} ran " + ", ".join(f"{recorder.count} queries for {size} rows" for size, recorder in runs)
+                    + f"\nRepeated at {runs[-1][0]} rows:\n{repeated}",
+                )
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+@mock.patch('api.replicas.replica_lag', return_value=0.0)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        monitor = mock.patch('api.replicas.monitor', LagMonitor())
+        monitor.start()
+        self.addCleanup(monitor.stop)
+        self.router = ReplicaRouter()
+
+    def read_database(self, state, model=api_models.Invoice):
+        token = routing.set(state)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            routing.reset(token)
+
+    def test_reads_outside_requests_use_default(self, replica_lag):
+        self.assertEqual(self.router.db_for_read(api_models.Invoice), 'default')
+
+    def test_safe_request_reads_from_replica_until_it_writes(self, replica_lag):
+        state = ReadRouting(use_replica=True)
+        self.assertEqual(self.read_database(state), 'replica_0')
+        token = routing.set(state)
+        try:
+            self.assertEqual(self.router.db_for_write(api_models.Invoice), 'default')
+        finally:
+            routing.reset(token)
+        self.assertEqual(self.read_database(state), 'default')
+
+    def test_lagging_replica_is_skipped(self, replica_lag):
+        replica_lag.return_value = 60.0
+        self.assertEqual(self.read_database(ReadRouting(use_replica=True)), 'default')
+
+    def test_client_that_wrote_is_pinned_to_primary(self, replica_lag):
+        factory = RequestFactory(HTTP_AUTHORIZATION='Token writer')
+        middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        self.assertTrue(may_use_replica(factory.get('/')))
+
+        middleware(factory.post('/'))
+        self.assertFalse(may_use_replica(factory.get('/')))
+        self.assertTrue(may_use_replica(RequestFactory(HTTP_AUTHORIZATION='Token reader').get('/')))
+
+
+@override_settings(DATABASE_SHARDS=['shard_1'])
+class ShardRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ShardRouter()
+        # Placements of the request, so nothing is looked up
+        self.state = ShardRouting()
+        self.state.placements = {1: Placement('default'), 2: Placement('shard_1'), 3: Placement('shard_1', moving=True)}
+        token = shard_routing.set(self.state)
+        self.addCleanup(shard_routing.reset, token)
+
+    def test_queries_outside_a_business_are_left_to_the_next_router(self):
+        self.assertIsNone(self.router.db_for_read(api_models.Invoice))
+        self.assertIsNone(self.router.db_for_write(api_models.Invoice))
+        self.state.placement = Placement('shard_1')
+        self.assertIsNone(self.router.db_for_read(api_models.Business))
+
+    def test_tenant_rows_go_to_the_database_of_their_business(self):
+        self.assertEqual(self.router.db_for_write(api_models.Customer, instance=api_models.Customer(business_id=2)), 'shard_1')
+        self.assertIsNone(self.router.db_for_write(api_models.Customer, instance=api_models.Customer(business_id=1)))
+        self.assertEqual(self.router.db_for_read(api_models.Invoice, instance=api_models.Business(id=2)), 'shard_1')
+
+    def test_resolved_business_routes_unqualified_queries(self):
+        self.state.placement = self.state.placements[2]
+        self.assertEqual(self.router.db_for_read(api_models.Invoice_item), 'shard_1')
+        self.assertEqual(self.router.db_for_write(api_models.Notification), 'shard_1')
+
+    def test_moving_business_is_read_only(self):
+        self.state.placement = self.state.placements[3]
+        self.assertEqual(self.router.db_for_read(api_models.Invoice), 'shard_1')
+        with self.assertRaises(BusinessMoving):
+            self.router.db_for_write(api_models.Invoice)
+
+    def test_data_migrations_skip_shards_unless_hinted(self):
+        self.assertFalse(self.router.allow_migrate('shard_1', 'api'))
+        self.assertIsNone(self.router.allow_migrate('shard_1', 'api', shards=True))
+        self.assertIsNone(self.router.allow_migrate('shard_1', 'api', model_name='invoice'))
+        self.assertIsNone(self.router.allow_migrate('default', 'api'))
+
+
+class RendererTests(SimpleTestCase):
+    PAYLOAD = {
+        "total": Decimal("1250.50"),
+        "created": datetime(2024, 5, 17, 9, 30, 12, 345678, tzinfo=timezone.utc),
+        "due": date(2024, 6, 1),
+        "uid": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+        "detail": gettext_lazy("Not found."),
+        "rows": [{"name": "Caf\u00e9 \u2028 line", 1: None, "paid": True, "rate": 0.1}],
+    }
+
+    def test_orjson_renders_like_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.PAYLOAD), JSONRenderer().render(self.PAYLOAD))
+
+    def test_orjson_parser_round_trip(self):
+        body = ORJSONRenderer().render(self.PAYLOAD, 'application/json; indent=4')
+        self.assertIn(b"\n", body)
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body))["created"], "2024-05-17T09:30:12.345678Z")
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b"{"))
+
+    @skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        body = MessagePackRenderer().render({**self.PAYLOAD, "rows": [{"paid": True}]})
+        parsed = MessagePackParser().parse(io.BytesIO(body))
+        self.assertEqual(parsed["created"], "2024-05-17T09:30:12.345678Z")
+        self.assertEqual(parsed["total"], 1250.5)
+        self.assertEqual(parsed["rows"], [{"paid": True}])
+
+
+class SparseFieldsTests(TenantTestCase):
+    seed = dict(invoices=4, items_per_invoice=2, customers=3, products=3, categories=2, receipts=2, notifications=2)
+
+    def get(self, path):
+        recorder = QueryRecorder(keep_log=True)
+        with connection.execute_wrapper(recorder):
+            response = self.client.get(API_PREFIX + path)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), recorder
+
+    def test_without_parameters_relations_are_nested(self):
+        invoices, _ = self.get(f'dashboard/invoices/{self.tenant.business.id}/')
+        self.assertIn('description', invoices[0])
+        self.assertIsInstance(invoices[0]['customer'], dict)
+
+    def test_fields_and_expand(self):
+        for prefix in ('', 'async/'):
+            with self.subTest(prefix=prefix):
+                invoices, recorder = self.get(
+                    f'{prefix}dashboard/invoices/{self.tenant.business.id}/?fields=id,title,customer,business,nope&expand=customer'
+                )
+                self.assertEqual(list(invoices[0]), ['id', 'title', 'business', 'customer'])
+                self.assertEqual(invoices[0]['business'], self.tenant.business.id)
+                self.assertIsInstance(invoices[0]['customer'], dict)
+                [select] = [query['sql'] for query in recorder.queries if 'FROM "api_invoice"' in query['sql']]
+                self.assertNotIn('"description"', select.split(' FROM ')[0])
+                self.assertIn('JOIN "api_customer"', select)
+
+    def test_unexpanded_relations_are_keys(self):
+        products, recorder = self.get(f'dashboard/products/{self.tenant.business.id}/?fields=id,name,category')
+        self.assertEqual(products[0], {'id': products[0]['id'], 'name': products[0]['name'], 'category': products[0]['category']})
+        self.assertIsInstance(products[0]['category'], int)
+        [select] = [query['sql'] for query in recorder.queries if 'FROM "api_product"' in query['sql']]
+        self.assertNotIn('"price"', select)
+        self.assertNotIn('JOIN', select)
+
+
+class BatchTests(TenantTestCase):
+    seed = dict(invoices=3, items_per_invoice=2, customers=2, products=2, categories=2, receipts=1, notifications=2)
+
+    def batch(self, paths, **params):
+        response = self.client.get(API_PREFIX + 'batch/', {'path': paths, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['responses']
+
+    def test_responses_match_separate_requests(self):
+        paths = [*dashboard_paths(self.tenant), f'async/dashboard/products/{self.tenant.business.id}/']
+        # The invoice list brings invoice statuses up to date, the counters must see that
+        self.client.get(API_PREFIX + f'dashboard/invoices/{self.tenant.business.id}/')
+        separate = [self.client.get(API_PREFIX + path).json() for path in paths]
+        cache.clear()
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            responses = self.batch(paths)
+        self.assertEqual([response['path'] for response in responses], paths)
+        for response, body, path in zip(responses, separate, paths):
+            with self.subTest(path=path):
+                self.assertEqual(response['status'], 200)
+                self.assertEqual(response['body'], body)
+        # One token lookup and one business lookup for the whole batch
+        for table in ('authtoken_token', 'api_business'):
+            self.assertEqual(sum(count for sql, count in recorder.fingerprints.items() if f'FROM "{table}"' in sql), 1, table)
+
+    def test_rejected_paths(self):
+        responses = self.batch(['batch/', 'no-such-route/', '/api/v1/user/'], concurrent='1')
+        self.assertEqual([response['status'] for response in responses], [400, 404, 400])
+        [response] = self.batch(['dashboard/admin/999999/'])
+        self.assertEqual(response['status'], 404)
+
+    def test_sub_requests_are_accounted_for_separately(self):
+        admin = f'dashboard/admin/{self.business_id}/'
+        paths = [admin, f'async/dashboard/admin/stats/{self.business_id}/', f'dashboard/notifications/?business_id={self.business_id}']
+        # The batch itself only authenticates, its sub-requests are held to their own budgets
+        with override_settings(QUERY_BUDGETS={'batch': 1}, QUERY_BUDGET_RAISE=True), \
+                mock.patch('api.middleware.record_request') as record_request:
+            responses = self.batch(paths)
+        self.assertEqual([response['status'] for response in responses], [200] * 3)
+        for response in responses:
+            self.assertRegex(response['server_timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        charged = {call.args[0].path: call.args[0].business.id for call in record_request.call_args_list if hasattr(call.args[0], 'business')}
+        self.assertEqual(charged[API_PREFIX + admin], self.business_id)
+
+        with override_settings(QUERY_BUDGETS={'api/v1/dashboard/admin/<int:business_id>/': 0}, QUERY_BUDGET_RAISE=True):
+            with self.assertRaisesMessage(QueryBudgetExceeded, f"GET {API_PREFIX}{admin} ran"):
+                self.batch([admin])
+
+    def test_requires_paths_and_a_user(self):
+        self.assertEqual(self.client.get(API_PREFIX + 'batch/').status_code, 400)
+        too_many = ['dashboard/notifications/'] * (BATCH_MAX_REQUESTS + 1)
+        self.assertEqual(self.client.get(API_PREFIX + 'batch/', {'path': too_many}).status_code, 400)
+        self.assertEqual(Client().get(API_PREFIX + 'batch/', {'path': 'dashboard/notifications/'}).status_code, 401)
+
+
+class OwnerOverviewTests(TenantTestCase):
+    seed = dict(businesses=3, invoices=4, customers=2, products=3)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner = cls.business.owner
+        api_models.Business.objects.filter(id__in=cls.business_ids).update(owner=cls.owner)
+        api_models.Business.objects.filter(id=cls.business_ids[2]).update(currency="NGN")
+
+    def overview(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.get(API_PREFIX + 'dashboard/overview/')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), recorder
+
+    def test_totals_match_each_business(self):
+        overview, recorder = self.overview()
+        # Token, businesses, their shards if sharded, then invoices, customers and products grouped by business
+        self.assertEqual(recorder.count, 6 if settings.DATABASE_SHARDS else 5)
+        for business_id in self.business_ids:
+            with self.subTest(business_id=business_id):
+                [admin] = self.client.get(f'{API_PREFIX}dashboard/admin/{business_id}/').json()
+                [totals] = [row for row in overview['businesses'] if row['id'] == business_id]
+                self.assertEqual({name: totals[name] for name in admin}, admin)
+
+        invoices = api_models.Invoice.objects.filter(business_id__in=self.business_ids)
+        paid = sum(invoice.grand_total for invoice in invoices if invoice.status == 'paid')
+        self.assertEqual([row['currency'] for row in overview['currencies']], ['NGN', 'USD'])
+        self.assertEqual([row['businesses'] for row in overview['currencies']], [1, 2])
+        self.assertEqual(sum(Decimal(row['paid_amount']) for row in overview['currencies']), paid)
+
+    def test_cached_until_a_write(self):
+        before, _ = self.overview()
+        _, recorder = self.overview()
+        self.assertEqual(recorder.count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            api_models.Customer.objects.create(business_id=self.business_ids[0], full_name="New Customer", email="new@example.com", phone_number="0800")
+        after, _ = self.overview()
+        self.assertEqual(after['currencies'][1]['customers'], before['currencies'][1]['customers'] + 1)
+
+
+class SearchTests(TenantTestCase):
+    # Every shard has the search index
+    databases = '__all__'
+    seed = dict(invoices=2, customers=2, products=2)
+
+    def search(self, **params):
+        response = self.client.get(f'{API_PREFIX}dashboard/search/{self.business_id}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_index_follows_writes(self):
+        # The triggers must survive every migration that rebuilds a source table
+        customer = api_models.Customer.objects.create(business_id=self.business_id, full_name="Zebulon Quartz", email="zq@example.com", phone_number="0800")
+        self.assertEqual([(row['type'], row['id']) for row in self.search(q="zebulon")['results']], [('customer', customer.id)])
+
+        customer.full_name = "Yolanda Quartz"
+        customer.save()
+        self.assertEqual(self.search(q="zebulon")['results'], [])
+        self.assertEqual(self.search(q="yolanda")['results'][0]['title'], "Yolanda Quartz")
+
+        customer.delete()
+        self.assertEqual(self.search(q="quartz")['results'], [])
+
+    def test_triggers_exist_after_migrate(self):
+        expected = {f'api_search_{kind}_{event}' for kind in ('invoice', 'customer', 'product') for event in ('insert', 'update', 'delete')}
+        for alias in ['default', *settings.DATABASE_SHARDS]:
+            if connections[alias].vendor != 'sqlite':
+                continue
+            with self.subTest(alias=alias), connections[alias].cursor() as cursor:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'api_search_%'")
+                self.assertEqual({name for name, in cursor.fetchall()}, expected)
+
+    def customer(self, full_name, **fields):
+        return api_models.Customer.objects.create(
+            business_id=self.business_id, full_name=full_name,
+            **{'email': f"{uuid.uuid4().hex[:8]}@example.com", 'phone_number': "0800", **fields},
+        )
+
+    def test_best_match_first(self):
+        weak = self.customer("Orchid Traders")
+        strong = self.customer("Orchid Orchid Florists", email="orchid@example.com")
+        results = self.search(q="orchid")['results']
+        self.assertEqual([row['id'] for row in results], [strong.id, weak.id])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+
+    def test_type_filter(self):
+        customer = self.customer("Marigold Stores")
+        product = api_models.Product.objects.create(owner_id=self.business_id, name="Marigold Seeds", price=1)
+        self.assertEqual({row['type'] for row in self.search(q="marigold")['results']}, {'customer', 'product'})
+        self.assertEqual([(row['type'], row['id']) for row in self.search(q="marigold", type='product')['results']], [('product', product.id)])
+        self.assertEqual([(row['type'], row['id']) for row in self.search(q="marigold", type='customer,unknown')['results']], [('customer', customer.id)])
+
+    def test_pages(self):
+        customers = {self.customer(f"Juniper {number}").id for number in range(5)}
+        pages = [self.search(q="juniper", page=page, page_size=2) for page in (1, 2, 3)]
+        self.assertEqual([page['has_next'] for page in pages], [True, True, False])
+        self.assertEqual({row['id'] for page in pages for row in page['results']}, customers)
+        self.assertEqual(self.client.get(f'{API_PREFIX}dashboard/search/{self.business_id}/', {'q': "juniper", 'page': "x"}).status_code, 400)
+        self.assertEqual(self.client.get(f'{API_PREFIX}dashboard/search/{self.business_id}/').status_code, 400)
+
+    def test_other_databases_fall_back_to_icontains(self):
+        customer = self.customer("Saffron Wholesale", phone_number="5550199")
+        using = placement(self.business_id).database
+        # Only search() sees another vendor, the ORM still compiles for SQLite
+        with mock.patch('api.search.connections', {using: mock.Mock(vendor='oracle')}):
+            results = search(self.business_id, "saffron 0199", using=using)
+            self.assertEqual([(row['type'], row['id']) for row in results], [('customer', customer.id)])
+            self.assertEqual(search(self.business_id, "saffron", kinds=['product'], using=using), [])
+
+
+class InvoiceAccessTokenTests(TenantTestCase):
+    # The purge goes through every shard
+    databases = '__all__'
+    seed = dict(invoices=2)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.invoices = list(api_models.Invoice.objects.using(cls.database).select_related('customer').filter(business_id=cls.business_id).order_by('id'))
+
+    def setUp(self):
+        super().setUp()
+        self.tokens = api_models.InvoiceAccessToken.objects.using(self.database)
+
+    def get_valid(self, token):
+        with use_database(self.database):
+            return api_models.InvoiceAccessToken.get_valid(token)
+
+    def request_token(self, invoice):
+        response = Client().post(
+            API_PREFIX + 'auth/generate-invoice-token/',
+            {'email': invoice.customer.email, 'Uid': invoice.Uid}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['token']
+
+    def test_only_the_hash_is_stored(self):
+        token = self.request_token(self.invoices[0])
+        [row] = self.tokens.all()
+        self.assertNotEqual(row.token_hash, token)
+        self.assertEqual(row.token_hash, hash_token(token))
+        self.assertEqual(self.get_valid(token).invoice, self.invoices[0])
+
+    def test_new_token_replaces_the_earlier_ones(self):
+        first = self.request_token(self.invoices[0])
+        other = self.request_token(self.invoices[1])
+        second = self.request_token(self.invoices[0])
+        self.assertEqual(self.tokens.filter(invoice=self.invoices[0]).count(), 1)
+        with self.assertRaises(api_models.InvoiceAccessToken.DoesNotExist):
+            self.get_valid(first)
+        self.assertEqual(self.get_valid(second).invoice, self.invoices[0])
+        self.assertEqual(self.get_valid(other).invoice, self.invoices[1])
+
+    def test_expired_tokens_are_not_valid(self):
+        token = api_models.InvoiceAccessToken.create_token(self.invoices[0])
+        self.tokens.update(expires_at=now() - timedelta(seconds=1))
+        with self.assertRaises(api_models.InvoiceAccessToken.DoesNotExist):
+            self.get_valid(token)
+
+    def test_purge_deletes_expired_tokens_only(self):
+        expired = api_models.InvoiceAccessToken.create_token(self.invoices[0])
+        kept = api_models.InvoiceAccessToken.create_token(self.invoices[1])
+        self.tokens.filter(token_hash=hash_token(expired)).update(expires_at=now() - timedelta(seconds=1))
+        call_command('purge_expired_tokens', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(self.tokens.values_list('token_hash', flat=True)), [hash_token(kept)])
+
+
+class MetricsTests(TestCase):
+    # The job lag is looked up on every shard
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.enterContext(override_settings(METRICS_DIR=self.directory))
+
+    def write(self, filename, count):
+        with open(os.path.join(self.directory, filename), 'w') as output:
+            json.dump([['speedvoice_requests_total', {'status': '200'}, count]], output)
+
+    def requests_total(self):
+        return collect().get(('speedvoice_requests_total', (('status', '200'),)), 0)
+
+    def test_scrapes_need_the_token_or_an_allowed_address(self):
+        self.assertEqual(Client(REMOTE_ADDR='203.0.113.7').get('/metrics').status_code, 401)
+        self.assertEqual(Client(REMOTE_ADDR='127.0.0.1').get('/metrics').status_code, 200)
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(Client(REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer wrong').get('/metrics').status_code, 401)
+            self.assertEqual(Client(REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer scrape-token').get('/metrics').status_code, 200)
+
+    def test_job_lag_is_looked_up_once_per_interval(self):
+        render()
+        with self.assertNumQueries(0):
+            self.assertIn('speedvoice_job_lag_seconds{job="overdue_invoices"}', render())
+
+    def test_exited_workers_are_folded_into_the_archive(self):
+        self.write('4242-1.json', 3)
+        self.write('4343-1.json', 5)
+        self.assertEqual(self.requests_total(), 8)
+
+        mark_process_dead(4242)
+        self.assertEqual(self.requests_total(), 8)
+        self.assertNotIn('4242-1.json', os.listdir(self.directory))
+        # A new process reusing the pid starts a file of its own
+        self.write('4242-2.json', 1)
+        mark_process_dead(4343)
+        mark_process_dead(4242)
+        self.assertEqual(self.requests_total(), 9)
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.endswith('.json') and not name.startswith(f'{os.getpid()}-')), ['archive.json'])
+
+
+class TenantUsageTests(TenantTestCase):
+    seed = dict(businesses=2)
+
+    def setUp(self):
+        super().setUp()
+        self.meter = TenantMeter()
+
+    def usage(self):
+        return list(api_models.TenantUsage.objects.order_by('business_id', 'period').values_list('business_id', 'period', 'requests', 'rows', 'bytes_sent'))
+
+    def test_hourly_rollup(self):
+        first, second = self.business_ids
+        hour = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+        self.meter.record(first, 10.0, 2.0, 5, 100)
+        self.meter.record(first, 20.0, 4.0, 1, 50)
+        self.meter.record(second, 5.0, 1.0, 2, 10)
+        # Businesses deleted since are skipped
+        self.meter.record(0, 1.0, 1.0, 1, 1)
+        with mock.patch('api.accounting.now', return_value=hour.replace(minute=12)):
+            self.meter.flush(force=True)
+        self.meter.record(first, 1.0, 1.0, 1, 1)
+        with mock.patch('api.accounting.now', return_value=hour.replace(minute=59)):
+            self.meter.flush(force=True)
+        self.meter.record(first, 1.0, 1.0, 1, 1)
+        with mock.patch('api.accounting.now', return_value=hour + timedelta(minutes=61)):
+            self.meter.flush(force=True)
+
+        self.assertEqual(self.usage(), [
+            (first, hour, 3, 7, 151),
+            (first, hour + timedelta(hours=1), 1, 1, 1),
+            (second, hour, 1, 2, 10),
+        ])
+        self.assertEqual(self.meter.pending, {})
+
+    def test_flush_waits_for_the_interval(self):
+        self.meter.record(self.business_ids[0], 1.0, 1.0, 1, 1)
+        with override_settings(TENANT_USAGE_FLUSH_INTERVAL=3600):
+            self.meter.flush()
+            self.meter.flush_in_background()
+        self.assertEqual(self.usage(), [])
+        self.assertEqual(list(self.meter.pending), [self.business_ids[0]])
+
+    def test_only_resolved_businesses_are_charged(self):
+        client = Client(HTTP_AUTHORIZATION=f"Token {self.tenant.token}")
+        with mock.patch('api.accounting.meter', self.meter), override_settings(TENANT_USAGE_FLUSH_INTERVAL=3600):
+            self.assertEqual(client.get(f'{API_PREFIX}dashboard/admin/{self.business_ids[0]}/').status_code, 200)
+            # Someone else's business is not resolved, so not charged
+            self.assertEqual(client.get(f'{API_PREFIX}dashboard/admin/{self.business_ids[1]}/').status_code, 404)
+        self.assertEqual(list(self.meter.pending), [self.business_ids[0]])
+        self.assertEqual(self.meter.pending[self.business_ids[0]][0], 1)
+
+
+class OverdueTests(TenantTestCase):
+    # The sweep goes through every shard
+    databases = '__all__'
+    seed = dict(invoices=3)
+
+    def setUp(self):
+        super().setUp()
+        with use_database(self.database):
+            self.invoices = list(api_models.Invoice.objects.select_related('customer').filter(business_id=self.business_id).order_by('id'))
+        past, future = now() - timedelta(days=2), now() + timedelta(days=2)
+        for invoice, date_due, invoice_status in zip(self.invoices, (past, future, past), ('unpaid', 'unpaid', 'paid')):
+            invoice.date_due, invoice.status, invoice.overdue_notified_at = date_due, invoice_status, None
+            invoice.save()
+
+    def refreshed(self, invoice):
+        invoice.refresh_from_db()
+        return invoice
+
+    def test_sweep_flags_each_overdue_invoice_once(self):
+        overdue, upcoming, paid = self.invoices
+        notifications = api_models.Notification.objects.using(placement(self.business_id).database).filter(type='invoice_overdue')
+        self.assertEqual(sweep_overdue_invoices(batch_size=1), 1)
+        self.assertEqual(sweep_overdue_invoices(), 0)
+
+        self.assertEqual(self.refreshed(overdue).status, 'pending')
+        self.assertIsNotNone(overdue.overdue_notified_at)
+        self.assertIsNone(self.refreshed(upcoming).overdue_notified_at)
+        self.assertIsNone(self.refreshed(paid).overdue_notified_at)
+        self.assertEqual([notification.description for notification in notifications], [f'Invoice {overdue.Uid} is past its due date'])
+
+    def update(self, invoice, date_due):
+        response = Client(HTTP_AUTHORIZATION=f"Token {self.tenant.token}").put(API_PREFIX + 'dashboard/invoice-update/', {
+            'Uid': invoice.Uid, 'user_id': self.business_id, 'title': invoice.title, 'description': invoice.description,
+            'customer': invoice.customer.full_name, 'date_due': date_due, 'discount': invoice.discount,
+            'is_recurring': invoice.is_recurring, 'status': 'unpaid',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return self.refreshed(invoice)
+
+    def test_only_a_new_due_date_clears_the_flag(self):
+        overdue = self.invoices[0]
+        overdue.date_due = datetime(2026, 1, 5, tzinfo=timezone.utc)
+        overdue.save()
+        sweep_overdue_invoices()
+        notified_at = self.refreshed(overdue).overdue_notified_at
+
+        # The same due date, written as a date, without an offset or with one
+        for date_due in ('2026-01-05', '2026-01-05T00:00:00', '2026-01-05T01:00:00+01:00'):
+            with self.subTest(date_due=date_due):
+                self.assertEqual(self.update(overdue, date_due).overdue_notified_at, notified_at)
+        self.assertIsNone(self.update(overdue, '2026-01-06').overdue_notified_at)
+
+
+class PlanUsageTests(TenantTestCase):
+    # Usage is counted on every shard
+    databases = '__all__'
+    seed = dict(invoices=2)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner = cls.business.owner
+        User.objects.filter(id=cls.owner.id).update(product_type='basic')
+
+    def create_business(self, owner):
+        return self.client.post(API_PREFIX + 'auth/business-create/', {
+            'owner': owner.id, 'name': "Second Shop", 'country': "NG", 'state': "Lagos", 'city': "Ikeja", 'currency': "NGN",
+        }, content_type='application/json')
+
+    def usage(self, user):
+        return api_models.PlanUsage.objects.get(user=user)
+
+    def test_basic_plan_allows_one_business(self):
+        response = self.create_business(self.owner)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(api_models.Business.objects.filter(owner=self.owner).count(), 1)
+        self.assertEqual(self.usage(self.owner).businesses, 1)
+        self.assertTrue(api_models.Notification.objects.filter(business=self.business, title="New business creation failed").exists())
+
+    def test_drifted_counter_is_recounted(self):
+        # A basic user whose counter says one business but who has none
+        user = User.objects.create_user(username="drifted", email="drifted@example.com", password="x", product_type='basic')
+        api_models.PlanUsage.objects.create(user=user, businesses=1)
+        response = self.create_business(user)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.usage(user).businesses, 1)
+        self.assertEqual(api_models.Business.objects.filter(owner=user).count(), 1)
+
+    def test_recount(self):
+        api_models.PlanUsage.objects.update_or_create(user=self.owner, defaults={'invoices': 40, 'businesses': 3})
+        self.assertTrue(api_models.PlanUsage.recount(self.owner))
+        self.assertFalse(api_models.PlanUsage.recount(self.owner))
+        usage = self.usage(self.owner)
+        self.assertEqual((usage.invoices, usage.businesses), (2, 1))
+
+
+class RecurringInvoiceTests(TenantTestCase):
+    # Generation goes through every shard
+    databases = '__all__'
+    seed = dict(invoices=2, items_per_invoice=2)
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.owner = cls.business.owner
+
+    def setUp(self):
+        super().setUp()
+        self.invoices = api_models.Invoice.objects.using(self.database).filter(business_id=self.business_id)
+        self.invoices.update(is_recurring=True, next_recurrence_at=now() - timedelta(days=1), recurrence_count=0)
+
+    def set_plan(self, product_type, invoices):
+        User.objects.filter(id=self.owner.id).update(product_type=product_type)
+        api_models.PlanUsage.objects.update_or_create(user=self.owner, defaults={'invoices': invoices, 'businesses': 1})
+
+    def test_occurrences_count_towards_the_plan(self):
+        self.set_plan('premium', 2)
+        self.assertEqual(generate_recurring_invoices(), 2)
+        self.assertEqual(api_models.PlanUsage.objects.get(user=self.owner).invoices, 4)
+        clones = self.invoices.filter(recurring_parent__isnull=False)
+        self.assertEqual(clones.count(), 2)
+        self.assertEqual(api_models.Invoice_item.objects.using(self.database).filter(invoice__in=clones).count(), 4)
+        self.assertEqual(generate_recurring_invoices(), 0)
+
+    def test_basic_plan_limit_skips_occurrences(self):
+        self.set_plan('basic', api_models.BASIC_PLAN_INVOICE_LIMIT - 1)
+        self.assertEqual(generate_recurring_invoices(), 1)
+        self.assertEqual(api_models.PlanUsage.objects.get(user=self.owner).invoices, api_models.BASIC_PLAN_INVOICE_LIMIT)
+        self.assertEqual(self.invoices.filter(recurring_parent__isnull=False).count(), 1)
+
+        # The skipped occurrence is notified and not retried
+        notifications = api_models.Notification.objects.using(self.database).filter(business_id=self.business_id)
+        self.assertEqual(notifications.filter(title="Recurring invoice skipped").count(), 1)
+        self.assertEqual(set(self.invoices.filter(recurring_parent__isnull=True).values_list('recurrence_count', flat=True)), {1})
+        self.assertEqual(generate_recurring_invoices(), 0)
+
+
+class BusinessResolutionTests(TenantTestCase):
+    seed = dict(businesses=2)
+
+    def test_body_names_the_business_as_business_id_or_user_id(self):
+        for field in ('business_id', 'user_id'):
+            with self.subTest(field=field):
+                response = self.client.post(API_PREFIX + 'dashboard/customers-create/', {
+                    field: self.business.id, 'full_name': f"Named By {field}", 'email': f"{field}@example.com", 'phone_number': "0800",
+                }, content_type='application/json')
+                self.assertEqual(response.status_code, 201)
+                with use_database(placement(self.business.id).database):
+                    self.assertTrue(api_models.Customer.objects.filter(business_id=self.business.id, full_name=f"Named By {field}").exists())
+
+    def test_bulk_updates_drop_the_cached_business(self):
+        self.assertEqual(self.client.get(f'{API_PREFIX}auth/business/public/{self.business.slug}/').status_code, 200)
+        self.assertEqual(self.client.get(f'{API_PREFIX}dashboard/admin/{self.business.id}/').status_code, 200)
+        self.assertIsNotNone(cache.get(business_cache_key(self.business.id)))
+        self.assertIsNotNone(cache.get(public_business_cache_key(self.business.slug)))
+
+        api_models.Business.objects.filter(id=self.business.id).update(name="Renamed Shop", slug="renamed-shop")
+        self.assertIsNone(cache.get(business_cache_key(self.business.id)))
+        self.assertIsNone(cache.get(public_business_cache_key(self.business.slug)))
+        self.assertEqual(self.client.get(f'{API_PREFIX}auth/business/public/renamed-shop/').json()['data']['name'], "Renamed Shop")
+
+    def test_updates_start_from_the_stored_business(self):
+        self.assertEqual(self.client.get(f'{API_PREFIX}auth/business/{self.business.id}/').status_code, 200)
+        stale = cache.get(business_cache_key(self.business.id))
+        api_models.Business.objects.filter(id=self.business.id).update(description="Edited elsewhere")
+        # As another worker could still have it
+        cache.set(business_cache_key(self.business.id), stale)
+
+        response = self.client.put(f'{API_PREFIX}auth/business/{self.business.id}/', {'city': "Ibadan"}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.business.refresh_from_db()
+        self.assertEqual((self.business.city, self.business.description), ("Ibadan", "Edited elsewhere"))
+
+    def test_invoices_of_other_businesses_are_not_found(self):
+        response = self.client.post(API_PREFIX + 'dashboard/invoice-items-create/', {
+            'business_id': self.business.id, 'invoice_Uid': self.tenants[1].invoice.Uid, 'product_id': self.tenant.product.id, 'quantity': 1,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        with use_database(placement(self.tenants[1].business.id).database):
+            self.assertEqual(self.tenants[1].invoice.invoice_item_set.count(), 1)
+
+
+class AutocompleteTests(TenantTestCase):
+    def setUp(self):
+        super().setUp()
+        api_autocomplete._indexes.clear()
+
+    def suggest(self, kind, prefix, **params):
+        response = self.client.get(f'{API_PREFIX}dashboard/autocomplete/{self.business_id}/', {'type': kind, 'q': prefix, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row.get('full_name', row.get('name')) for row in response.json()]
+
+    def customer(self, full_name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return api_models.Customer.objects.create(
+                business_id=self.business_id, full_name=full_name, email=f"{uuid.uuid4().hex[:8]}@example.com", phone_number="0800",
+            )
+
+    def test_prefix_ignores_case_in_name_order(self):
+        for full_name in ("bramble Foods", "Brook Supplies", "Acorn Ltd", "Bramble Farms"):
+            self.customer(full_name)
+        self.assertEqual(self.suggest('customer', "BR"), ["Bramble Farms", "bramble Foods", "Brook Supplies"])
+        self.assertEqual(self.suggest('customer', "br", limit=1), ["Bramble Farms"])
+        self.assertEqual(self.suggest('customer', "zz"), [])
+
+    def test_index_is_rebuilt_when_the_version_moves(self):
+        customer = self.customer("Quince Lane")
+        self.assertEqual(self.suggest('customer', "q"), ["Quince Lane"])
+        version = cache.get(api_autocomplete.version_key('customer', self.business_id), 0)
+
+        # Reads alone keep the index
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            self.assertEqual(api_autocomplete.autocomplete('customer', self.business_id, "c"), [mock.ANY])
+        self.assertEqual(recorder.count, 0)
+
+        self.customer("Quartz Row")
+        self.assertEqual(cache.get(api_autocomplete.version_key('customer', self.business_id)), version + 1)
+        self.assertEqual(self.suggest('customer', "q"), ["Quartz Row", "Quince Lane"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            customer.delete()
+        self.assertEqual(self.suggest('customer', "q"), ["Quartz Row"])
+
+        # Other kinds are versioned apart
+        with self.captureOnCommitCallbacks(execute=True):
+            api_models.Product.objects.create(owner_id=self.business_id, name="Cider", price=1)
+        self.assertEqual(cache.get(api_autocomplete.version_key('customer', self.business_id)), version + 2)
+        self.assertEqual(self.suggest('product', "ci"), ["Cider"])
+
+    def test_index_is_rebuilt_when_too_old(self):
+        self.customer("Quince Lane")
+        self.assertEqual(self.suggest('customer', "q"), ["Quince Lane"])
+        # A write whose bump never reached this process
+        with use_database(placement(self.business_id).database):
+            api_models.Customer.objects.filter(full_name="Quince Lane").update(full_name="Quartz Row")
+        self.assertEqual(self.suggest('customer', "q"), ["Quince Lane"])
+
+        later = time.monotonic() + api_autocomplete.INDEX_MAX_AGE
+        with mock.patch('api.autocomplete.time.monotonic', return_value=later):
+            self.assertEqual(self.suggest('customer', "q"), ["Quartz Row"])
+
+    def test_rejects_unknown_types_and_limits(self):
+        url = f'{API_PREFIX}dashboard/autocomplete/{self.business_id}/'
+        self.assertEqual(self.client.get(url, {'type': 'invoice', 'q': "a"}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'type': 'customer', 'limit': "x"}).status_code, 400)
+
+
+class PublicBusinessTests(TenantTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Seeded slugs are not derived from the name
+        cls.business.slug = cls.business.unique_slug()
+        cls.business.save()
+        cls.url = f'{API_PREFIX}auth/business/public/{cls.business.slug}/'
+
+    def setUp(self):
+        super().setUp()
+        # Anonymous visitors
+        self.client = Client()
+
+    def test_slugs_are_unique(self):
+        business = api_models.Business.objects.create(owner=self.business.owner, name=self.business.name, country="NG", state="Lagos", city="Ikeja")
+        self.assertEqual(business.slug, f"{self.business.slug}-2")
+
+    def test_etag_answers_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['slug'], self.business.slug)
+        self.assertNotIn('owner', response.json()['data'])
+        self.assertIn('public', response['Cache-Control'])
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(recorder.count, 0)
+
+        by_name = self.client.get(f'{API_PREFIX}auth/business-get-by-name/', {'name': self.business.name})
+        self.assertEqual(by_name['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(f'{API_PREFIX}auth/business-get-by-name/').status_code, 400)
+
+    def test_saves_drop_the_cached_profile(self):
+        etag = self.client.get(self.url)['ETag']
+        self.business.description = "Open on Sundays"
+        self.business.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['description'], "Open on Sundays")
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_misses_are_cached(self):
+        url = f'{API_PREFIX}auth/business/public/no-such-business/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(recorder.count, 0)
+
+
+class ProfilingTests(TenantTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.url = f'{API_PREFIX}dashboard/admin/{cls.business_id}/'
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def test_only_staff_are_profiled(self):
+        for request in ({'HTTP_X_PROFILE': '1'}, {'data': {'profile': '1'}}):
+            with self.subTest(request=request):
+                response = self.client.get(self.url, **request)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(Client().get(self.url, HTTP_X_PROFILE='1').status_code, 401)
+        self.assertFalse(api_models.RequestProfile.objects.exists())
+
+    def test_staff_requests_are_stored(self):
+        User.objects.filter(id=self.business.owner_id).update(is_staff=True)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url))
+
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile = api_models.RequestProfile.objects.get(id=response['X-Profile-Id'])
+        self.assertEqual((profile.user_id, profile.business_id), (self.business.owner_id, self.business.id))
+        self.assertEqual((profile.method, profile.path, profile.status_code), ('GET', self.url, 200))
+        self.assertEqual(profile.route, API_PREFIX.lstrip('/') + 'dashboard/admin/<int:business_id>/')
+        self.assertEqual(profile.query_count, len(profile.queries))
+        self.assertGreater(profile.query_count, 0)
+        with profile.stats.open('rb') as stats:
+            self.assertTrue(marshal.load(stats))
+
+
+class SlowQueryLogTests(TestCase):
+    def setUp(self):
+        slowlog._explained.clear()
+        # Record on this thread, and keep the test transaction's connection open
+        self.enterContext(mock.patch.object(slowlog, '_executor', mock.Mock(submit=lambda function, *args: function(*args))))
+        self.enterContext(mock.patch.object(slowlog.connections, 'close_all'))
+        self.explain = self.enterContext(mock.patch.object(slowlog, 'explain', wraps=slowlog.explain))
+
+    def run_queries(self, *names):
+        for name in names:
+            list(api_models.Business.objects.filter(name=name))
+
+    def test_one_row_and_one_explain_per_fingerprint(self):
+        with override_settings(SLOW_QUERY_MS=0.0001), self.assertLogs('api.slowlog', 'WARNING') as logs:
+            self.run_queries("First Shop", "Second Shop", "Third Shop")
+        self.assertEqual(len(logs.records), 3)
+
+        [slow_query] = api_models.SlowQuery.objects.all()
+        self.assertEqual(slow_query.count, 3)
+        self.assertIn('"api_business"."name" = %s', slow_query.sql)
+        self.assertTrue(slow_query.plan)
+        self.assertGreaterEqual(slow_query.total_ms, slow_query.max_ms)
+        self.assertEqual(self.explain.call_count, 1)
+        self.assertTrue(slow_query.view.startswith("command: "))
+
+    def test_disabled_by_zero_threshold(self):
+        with override_settings(SLOW_QUERY_MS=0):
+            self.run_queries("First Shop")
+        self.assertFalse(api_models.SlowQuery.objects.exists())
+        self.explain.assert_not_called()
+
+
+class AsyncViewTests(TenantTestCase):
+    # Unknown invoices are looked for on every shard
+    databases = '__all__'
+    seed = dict(businesses=2, invoices=3, items_per_invoice=2, customers=2, products=2, notifications=2)
+
+    def paths(self, tenant):
+        business_id = tenant.business.id
+        return [
+            *dashboard_paths(tenant),
+            f'dashboard/customers/{business_id}/',
+            f'dashboard/products/{business_id}/',
+            f'dashboard/invoice/{tenant.invoice.Uid}/',
+        ]
+
+    def test_answers_like_the_sync_views(self):
+        for path in self.paths(self.tenant):
+            with self.subTest(path=path):
+                expected = self.client.get(API_PREFIX + path)
+                response = self.client.get(API_PREFIX + 'async/' + path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_token_required(self):
+        path = f'{API_PREFIX}async/dashboard/admin/{self.tenant.business.id}/'
+        self.assertEqual(Client().get(path).status_code, 401)
+        self.assertEqual(Client(HTTP_AUTHORIZATION="Token nope").get(path).status_code, 401)
+        self.assertEqual(Client(HTTP_AUTHORIZATION=f"Bearer {self.tenant.token}").get(path).status_code, 401)
+        self.assertEqual(self.client.post(path).status_code, 405)
+
+    def test_unknown_and_foreign_businesses_are_not_found(self):
+        missing = api_models.Business.objects.order_by('-id').values_list('id', flat=True).first() + 1
+        for path in [f'dashboard/admin/{missing}/', 'dashboard/notifications/?business_id=x', *self.paths(self.tenants[1])]:
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(API_PREFIX + 'async/' + path).status_code, 404)
+        self.assertEqual(self.client.get(f'{API_PREFIX}dashboard/invoice/{self.tenants[1].invoice.Uid}/').status_code, 404)
+        self.assertEqual(self.client.get(f'{API_PREFIX}async/dashboard/invoice/{uuid.uuid4()}/').status_code, 404)
+        self.assertEqual(self.client.get(f'{API_PREFIX}async/dashboard/notifications/').status_code, 400)
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_routes_and_serializers_are_built_without_the_database(self):
+        with mock.patch.object(warmup, 'open_connections') as open_connections, self.assertLogs('api.warmup', 'INFO') as logs:
+            warmup.warm_up(connect=False)
+        open_connections.assert_not_called()
+        self.assertIn("Warmed up", logs.output[0])
+
+        api_routes = warmup.resolve_routes(get_resolver('api.urls'))
+        self.assertEqual(api_routes, len(get_resolver('api.urls').url_patterns))
+        self.assertGreater(warmup.resolve_routes(), api_routes)
+        self.assertGreater(warmup.build_serializers(), 0)
+
+    def test_unreachable_databases_do_not_stop_the_worker(self):
+        broken, working = mock.Mock(), mock.Mock()
+        broken.ensure_connection.side_effect = DatabaseError("down")
+        databases = {'default': working, 'replica': broken}
+        with mock.patch.object(warmup, 'connections', databases), mock.patch.object(warmup, 'cache') as warm_cache, \
+                self.assertLogs('api.warmup', 'WARNING') as logs:
+            warmup.open_connections()
+        working.ensure_connection.assert_called_once_with()
+        warm_cache.get.assert_called_once_with('warm_up')
+        self.assertIn("Could not connect to replica", logs.output[0])
+
+
+class InvoiceRefreshTests(TenantTestCase):
+    seed = dict(items_per_invoice=2, products=2)
+
+    def invoice(self):
+        with use_database(self.database):
+            return api_models.Invoice.objects.get(id=self.tenant.invoice.id)
+
+    def test_reads_do_not_undo_newer_writes(self):
+        stale = self.invoice()
+        paid_total = stale.total + 1
+        with use_database(self.database):
+            api_models.Invoice.objects.filter(pk=stale.pk).update(status='paid', total=paid_total)
+            stale.items_total = stale.total + 5
+            changed = refresh_invoices([stale])
+            self.assertEqual([invoice for invoice, _ in changed], [stale])
+            save_refreshed(changed)
+        current = self.invoice()
+        self.assertEqual((current.status, current.total), ('paid', paid_total))
+
+    def test_reads_refresh_only_the_computed_fields(self):
+        for path in (f'dashboard/invoice/{self.tenant.invoice.Uid}/', f'dashboard/invoice-items/{self.tenant.invoice.Uid}/'):
+            with self.subTest(path=path):
+                with use_database(self.database):
+                    api_models.Invoice.objects.filter(pk=self.tenant.invoice.pk).update(total=0, grand_total=0, title="Kept Title")
+                self.assertEqual(self.client.get(API_PREFIX + path).status_code, 200)
+                invoice = self.invoice()
+                self.assertGreater(invoice.total, 0)
+                self.assertEqual(invoice.grand_total, invoice.total - invoice.discount)
+                self.assertEqual(invoice.title, "Kept Title")
+
+
+class CacheConfigTests(SimpleTestCase):
+    def test_backend_from_the_url(self):
+        self.assertEqual(cache_config(None), {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'})
+        with mock.patch.dict(os.environ, {'CACHE_KEY_PREFIX': 'sv'}):
+            self.assertEqual(cache_config('redis://cache:6379/1'), {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/1', 'KEY_PREFIX': 'sv',
+            })
+        self.assertEqual(cache_config('memcached://one:11211,two:11211')['LOCATION'], ['one:11211', 'two:11211'])
+        with self.assertRaises(ImproperlyConfigured):
+            cache_config('mongodb://cache')
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}}
+
+    def test_several_workers_need_a_shared_cache(self):
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            [error] = check_shared_cache(None)
+            self.assertEqual(error.id, 'api.E001')
+            with override_settings(CACHES=self.redis):
+                self.assertEqual(check_shared_cache(None), [])
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '1'}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_workers_refuse_to_boot(self):
+        require_bootable(1)
+        with self.assertRaises(ImproperlyConfigured):
+            require_bootable(2)
+        with override_settings(CACHES=self.redis):
+            require_bootable(2)
+
+
+class ShardVendorCheckTests(SimpleTestCase):
+    def test_shards_on_other_backends_fail_at_boot(self):
+        self.assertEqual(check_shard_vendors(None), [])
+        with override_settings(DATABASE_SHARDS=['shard_1']), \
+                mock.patch('api.checks.connections', {'shard_1': mock.Mock(vendor='oracle')}):
+            [error] = check_shard_vendors(None)
+            self.assertEqual(error.id, 'api.E002')
+            with self.assertRaisesMessage(ImproperlyConfigured, "Shard shard_1 is on oracle"):
+                require_bootable(1)
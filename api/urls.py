@@ -1,4 +1,5 @@
 from api import views as api_views
+from api import async_views as api_async_views
 from django.urls import path # type:ignore
 from rest_framework_simplejwt.views import TokenRefreshView # type:ignore
 
@@ -13,6 +14,7 @@ urlpatterns = [
     path('auth/token-login/', api_views.TokenLoginAPIView.as_view(), name='token_login'),
     path('auth/verify-invoice-token/', api_views.VerifyInvoiceTokenView.as_view(), name='verify_invoice_token'),
     path('auth/business-get-by-name/', api_views.BusinessGetByNameView.as_view(), name='business_get_by_name'),
+    path('auth/business/public/<slug:slug>/', api_views.PublicBusinessView.as_view(), name='business_public'),
     
     # Business endpoints
     path('auth/business/list/', api_views.UserBusinessListView.as_view(), name='user-businesses'),
@@ -51,6 +53,7 @@ urlpatterns = [
     path('dashboard/admin/<int:business_id>/', api_views.AdminView.as_view()),
     path('dashboard/admin/stats/<int:business_id>/', api_views.DashboardStatsView.as_view()),
     path('dashboard/invoice/admin/stats/<int:business_id>/', api_views.InvoiceStatsView.as_view(), name='dashboard_stats'),
+    path('dashboard/overview/', api_views.OwnerOverviewView.as_view(), name='owner_overview'),
 
     ###########  Receipts ###########
     path('dashboard/receipts/<int:business_id>/', api_views.ReceiptListView.as_view()),
@@ -60,4 +63,21 @@ urlpatterns = [
     ###########  Notifications ###########
     path('dashboard/notifications/', api_views.NotificationListView.as_view()),
     path('dashboard/notifications/read/', api_views.NotificationMarkAllReadAPIView.as_view()),
+
+    ###########  Search ###########
+    path('dashboard/search/<int:business_id>/', api_views.SearchView.as_view(), name='search'),
+    path('dashboard/autocomplete/<int:business_id>/', api_views.AutocompleteView.as_view(), name='autocomplete'),
+
+    ###########  Batch ###########
+    path('batch/', api_views.BatchView.as_view(), name='batch'),
+
+    ###########  Async reads (ASGI) ###########
+    path('async/dashboard/invoices/<int:business_id>/', api_async_views.invoice_list, name='async_invoices_list'),
+    path('async/dashboard/invoice/<Uid>/', api_async_views.invoice_detail, name='async_invoice_detail'),
+    path('async/dashboard/products/<int:business_id>/', api_async_views.product_list, name='async_products_list'),
+    path('async/dashboard/customers/<int:business_id>/', api_async_views.customer_list, name='async_customers_list'),
+    path('async/dashboard/notifications/', api_async_views.notification_list, name='async_notifications_list'),
+    path('async/dashboard/admin/<int:business_id>/', api_async_views.admin_counters, name='async_admin_counters'),
+    path('async/dashboard/admin/stats/<int:business_id>/', api_async_views.dashboard_stats, name='async_dashboard_stats'),
+    path('async/dashboard/invoice/admin/stats/<int:business_id>/', api_async_views.invoice_stats, name='async_invoice_stats'),
 ]
\ No newline at end of file
@@ -3,25 +3,50 @@ from api import serializer as api_serializer
 from rest_framework.decorators import APIView
 from rest_framework import generics
 from api import models as api_models
+from api.mixins import BusinessMixin, public_business_cache_key, resolve_business
+from api.shards import activate, locate, placement
+from api.search import search, SEARCH_KINDS
+from api.autocomplete import autocomplete, AUTOCOMPLETE_SOURCES
+from api.batch import BATCH_MAX_REQUESTS, run_batch
+from api.overview import bump_overview, owner_overview
+from api.metrics import cache_lookup, render as render_metrics
 from userauth.models import User
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework import status
 from rest_framework.response import Response
 from django.db.models.functions import ExtractMonth
-from django.db.models import Count, Sum, Q
+from django.db.models import Case, Count, F, Sum, Q, OuterRef, Subquery, Value, When
+from django.db import transaction
+from django.utils.timezone import is_naive, make_aware
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import NotFound, ValidationError, APIException
 
-from drf_yasg import openapi
-from drf_yasg.utils import swagger_auto_schema
+from api.docs import openapi, swagger_auto_schema
 
-import secrets
 import os
+import json
+import hashlib
+import hmac
+from functools import reduce
+from operator import or_
 import environ
+from django.conf import settings
 from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.text import slugify
 
 env = environ.Env()
 
+# Nested owners (depth=1) serialize their groups and permissions. Users
+# live on `default` and tenant rows may not (api.shards), so owners are
+# prefetched along with them rather than joined.
+OWNER_PREFETCH = ('owner__groups', 'owner__user_permissions')
+
+PUBLIC_BUSINESS_MAX_AGE = 60
+PUBLIC_BUSINESS_CACHE_TIMEOUT = 60 * 5
+PUBLIC_BUSINESS_MISS_TIMEOUT = 30
+
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = api_serializer.MyTokenObtainPairSerializer
     permission_classes = [AllowAny]
@@ -58,11 +83,8 @@ class GenerateLoginTokenAPIView(APIView):
             # Find user by email
             user = User.objects.get(email=email)
 
-            # Generate a secure token
-            token = secrets.token_urlsafe(32)
-
-            # Save the token to the database
-            api_models.LoginToken.objects.create(user=user, token=token)
+            # Generate a secure token, only its hash is saved to the database
+            token = api_models.LoginToken.create_token(user)
 
             return Response({"token": token}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
@@ -164,7 +186,7 @@ class TokenLoginAPIView(APIView):
 
             # Optionally delete the one-time login token after successful login
             try:
-                api_models.LoginToken.objects.filter(token=request.data.get("token")).delete()
+                api_models.LoginToken.objects.filter(pk=serializer.login_token.pk).delete()
             except Exception as e:
                 return Response({"warning": f"Error deleting login token: {e}"}, status=status.HTTP_200_OK) #Non-critical error
 
@@ -184,14 +206,18 @@ class TokenLoginAPIView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class BusinessGetView(generics.RetrieveUpdateDestroyAPIView):
+class BusinessGetView(BusinessMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = api_serializer.BusinessSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
         try:
-            business_id = self.kwargs['business_id']
-            return api_models.Business.objects.get(id=business_id)
+            business = self.get_business()
+            if self.request.method not in SAFE_METHODS:
+                # The resolved copy may come from the cache, saving it
+                # would revert what was written since
+                business.refresh_from_db()
+            return business
         except api_models.Business.DoesNotExist:
             raise NotFound("Business not found")
         except Exception as e:
@@ -209,8 +235,11 @@ class BusinessGetView(generics.RetrieveUpdateDestroyAPIView):
             city = request.data.get('city')
             image = request.data.get('image', None)
 
-            if name:
+            previous_slug = business_instance.slug
+            if name and name != business_instance.name:
                 business_instance.name = name
+                # Regenerated from the new name on save
+                business_instance.slug = ""
             if description:
                 business_instance.description = description
             if country:
@@ -225,6 +254,7 @@ class BusinessGetView(generics.RetrieveUpdateDestroyAPIView):
                 business_instance.image = image
 
             business_instance.save()
+            cache.delete(public_business_cache_key(previous_slug))
 
             # Create notification for business update
             api_models.Notification.objects.create(
@@ -276,41 +306,38 @@ class BusinessCreateView(APIView):
             user = User.objects.get(id=user_id)
 
             # Check user's product plan
-            if user.product_type == os.environ.get('BASIC_PLAN') and api_models.Business.objects.filter(owner=user).exists():
-                latest_business = api_models.Business.objects.filter(owner=user).latest('id')
-                api_models.Notification.objects.create(
-                    business=latest_business,
-                    title="New business creation failed",
-                    description="Your attempt to create a new business has failed because of the current plan you are subscribed to, please upgrade your plan to create a new business.",
-                    type="business_created"
-                )
-
+            if user.product_type == os.environ.get('BASIC_PLAN'):
+                business_limit = api_models.BASIC_PLAN_BUSINESS_LIMIT
+            elif user.product_type == os.environ.get('PREMIUM_PLAN'):
+                business_limit = None
+            else:
+                # Handle unknown or unrecognized plan
                 return Response(
-                    {"error": "Basic plan users can only create one business. Please upgrade your plan."}, 
+                    {"error": "Unknown subscription plan. Please contact support."}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            elif user.product_type == os.environ.get('PREMIUM_PLAN'):
-                business = api_models.Business.objects.create(
-                    owner=user,
-                    name=name,
-                    country=country,
-                    state=state,
-                    city=city,
-                    currency=currency,
-                    active=True,
-                )
 
-                business.save()
+            with transaction.atomic():
+                # Checks the limit and counts the new business in one UPDATE
+                reserved = api_models.PlanUsage.reserve(user, "businesses", business_limit)
+                if not reserved and api_models.PlanUsage.recount(user):
+                    # The counter had drifted from the businesses the user has
+                    reserved = api_models.PlanUsage.reserve(user, "businesses", business_limit)
+                if not reserved:
+                    latest_business = api_models.Business.objects.filter(owner=user).order_by('-id').first()
+                    if latest_business is not None:
+                        api_models.Notification.objects.create(
+                            business=latest_business,
+                            title="New business creation failed",
+                            description="Your attempt to create a new business has failed because of the current plan you are subscribed to, please upgrade your plan to create a new business.",
+                            type="business_created"
+                        )
+
+                    return Response(
+                        {"error": "Basic plan users can only create one business. Please upgrade your plan."}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
-                api_models.Notification.objects.create(
-                    business=business,
-                    title="New business created",
-                    description="A new business has been created",
-                    type="business_created"
-                )
-                
-                return Response({"message": "Business created successfully", "id": business.id}, status=status.HTTP_201_CREATED)
-            elif user.product_type == os.environ.get('BASIC_PLAN') and not api_models.Business.objects.filter(owner=user).exists():
                 business = api_models.Business.objects.create(
                     owner=user,
                     name=name,
@@ -321,8 +348,6 @@ class BusinessCreateView(APIView):
                     active=True,
                 )
 
-                business.save()
-
                 api_models.Notification.objects.create(
                     business=business,
                     title="New business created",
@@ -330,50 +355,92 @@ class BusinessCreateView(APIView):
                     type="business_created"
                 )
                 
-                return Response({"message": "Business created successfully", "id": business.id}, status=status.HTTP_201_CREATED)
-            else:
-                # Handle unknown or unrecognized plan
-                return Response(
-                    {"error": "Unknown subscription plan. Please contact support."}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            return Response({"message": "Business created successfully", "id": business.id}, status=status.HTTP_201_CREATED)
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": f"Error creating business: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-class InvoiceListView(generics.ListAPIView):
+def invoice_list_queryset(business):
+    """Invoices of a business with their item totals and nested rows loaded."""
+    item_totals = (
+        api_models.Invoice_item.objects.filter(invoice=OuterRef('pk'))
+        .values('invoice')
+        .annotate(total=Sum('quantity') * Sum('product__price'))
+        .values('total')
+    )
+    return (
+        business.business
+        .select_related('customer', 'signature', 'recurring_parent')
+        .prefetch_related(*OWNER_PREFETCH)
+        .annotate(items_total=Subquery(item_totals))
+    )
+
+INVOICE_REFRESH_FIELDS = ['total', 'grand_total', 'status']
+# What refresh_invoices() reads, loaded whatever ?fields= asks for
+INVOICE_LIST_FIELDS = [*INVOICE_REFRESH_FIELDS, 'discount', 'date_due']
+REFRESH_BATCH_SIZE = 100
+
+def refresh_invoices(invoices):
+    """
+    Bring the totals and status of loaded invoices up to date and return
+    the ones that changed, with what they held before, so only those are
+    written back (see refreshed_updates).
+    """
+    changed = []
+    for invoice in invoices:
+        before = {field: getattr(invoice, field) for field in INVOICE_REFRESH_FIELDS}
+        invoice.set_unpaid()
+        invoice.total = invoice.items_total or 0
+        invoice.grand_total = invoice.total - invoice.discount
+
+        if any(getattr(invoice, field) != value for field, value in before.items()):
+            changed.append((invoice, before))
+    return changed
+
+def refreshed_updates(changed):
+    """
+    (rows, values) UPDATEs writing back the invoices refresh_invoices()
+    changed, one per REFRESH_BATCH_SIZE of them. An invoice only matches
+    while it still holds what was read, so a GET that read it from a
+    lagging replica, or raced another request, can't overwrite a newer
+    write (marking it paid, say).
+    """
+    for start in range(0, len(changed), REFRESH_BATCH_SIZE):
+        batch = changed[start:start + REFRESH_BATCH_SIZE]
+        rows = api_models.Invoice.objects.filter(reduce(or_, (Q(pk=invoice.pk, **before) for invoice, before in batch)))
+        values = {
+            field: Case(
+                *(When(pk=invoice.pk, then=Value(getattr(invoice, field), output_field=api_models.Invoice._meta.get_field(field))) for invoice, _ in batch),
+                default=F(field),
+            )
+            for field in INVOICE_REFRESH_FIELDS
+        }
+        yield rows, values
+
+def save_refreshed(changed):
+    for rows, values in refreshed_updates(changed):
+        rows.update(**values)
+
+class InvoiceListView(BusinessMixin, generics.ListAPIView):
     serializer_class = api_serializer.InvoiceSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
+        business = self.get_business()
         try:
-            business_id = self.kwargs['business_id']
-            business = api_models.Business.objects.get(id=business_id)
-
-            # Use prefetch_related to fetch related invoice items in one query
-            invoices = api_models.Invoice.objects.filter(business=business).prefetch_related('invoice_item_set')
-
-            # Calculate totals in a single query using aggregate
-            for invoice in invoices:
-                total_price = api_models.Invoice_item.objects.filter(invoice=invoice).aggregate(
-                    total=Sum('quantity') * Sum('product__price')
-                )['total'] or 0
-                
-                if invoice.total != total_price:
-                    invoice.total = total_price
-
-                invoice.set_unpaid()
-                invoice.save()
+            invoices = self.serializer_class.narrow_queryset(invoice_list_queryset(business), self.request, keep=INVOICE_LIST_FIELDS)
+            changed = refresh_invoices(invoices)
+            if changed:
+                save_refreshed(changed)
+                bump_overview(business.owner_id)
 
             return invoices
-        except api_models.Business.DoesNotExist:
-            return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": f"Error retrieving invoices: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class InvoiceCreateView(APIView):
+class InvoiceCreateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -413,8 +480,8 @@ class InvoiceCreateView(APIView):
             # Get related objects
             try:
                 user = User.objects.get(id=user_id)
-                business = api_models.Business.objects.get(id=business_id)
-                customer = api_models.Customer.objects.get(full_name=customer_name, business=business)
+                business = self.get_business()
+                customer = business.customer_set.get(full_name=customer_name)
             except User.DoesNotExist:
                 return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
             except api_models.Business.DoesNotExist:
@@ -423,39 +490,40 @@ class InvoiceCreateView(APIView):
                 return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
 
             # Check invoice limit for basic plan
-            invoices_count = api_models.Invoice.objects.filter(owner=user).count()
-            INVOICE_LIMIT = 15
-            
-            if invoices_count >= INVOICE_LIMIT and user.product_type == os.environ.get('BASIC_PLAN'):
-                api_models.Notification.objects.create(
+            invoice_limit = api_models.PlanUsage.invoice_limit(user)
+
+            with transaction.atomic():
+                # Checks the limit and counts the new invoice in one UPDATE
+                if not api_models.PlanUsage.reserve(user, "invoices", invoice_limit):
+                    api_models.Notification.objects.create(
+                        business=business,
+                        title="New invoice creation failed",
+                        description=f'Invoice creation for customer "{customer.full_name}" has failed due to your current plan, please upgrade your plan to create more invoices.',
+                        type="invoice_creation_failed"
+                    )
+                    return Response(
+                        {"error": "Maximum invoice limit reached for basic plan"}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                # Create invoice
+                invoice = api_models.Invoice(
+                    owner=user,
                     business=business,
-                    title="New invoice creation failed",
-                    description=f'Invoice creation for customer "{customer.full_name}" has failed due to your current plan, please upgrade your plan to create more invoices.',
-                    type="invoice_creation_failed"
+                    title=title,
+                    description=description,
+                    customer=customer,
+                    date_due=date_due,
                 )
-                return Response(
-                    {"error": "Maximum invoice limit reached for basic plan"}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Create invoice
-            invoice = api_models.Invoice(
-                owner=user,
-                business=business,
-                title=title,
-                description=description,
-                customer=customer,
-                date_due=date_due,
-            )
-            invoice.save()
+                invoice.save()
 
-            # Create notification
-            api_models.Notification.objects.create(
-                business=business,
-                title="New invoice created",
-                description=f'A new invoice has been created for customer "{customer.full_name}"',
-                type="invoice_created"
-            )
+                # Create notification
+                api_models.Notification.objects.create(
+                    business=business,
+                    title="New invoice created",
+                    description=f'A new invoice has been created for customer "{customer.full_name}"',
+                    type="invoice_created"
+                )
 
             return Response(
                 {
@@ -477,17 +545,20 @@ class InvoiceView(generics.RetrieveAPIView):
     def get_object(self):
         try:
             invoice_id = self.kwargs['Uid']
-            invoice = api_models.Invoice.objects.get(Uid=invoice_id)
+            invoice = locate(api_models.Invoice.objects, Uid=invoice_id)
+            try:
+                resolve_business(self.request, invoice.business_id)
+            except api_models.Business.DoesNotExist:
+                # Invoices of other users are not found either
+                raise api_models.Invoice.DoesNotExist()
 
-            total_price = api_models.Invoice_item.objects.filter(invoice=invoice).aggregate(
+            invoice.items_total = api_models.Invoice_item.objects.filter(invoice=invoice).aggregate(
                 total=Sum('quantity') * Sum('product__price')
-            )['total'] or 0
-                
-            if invoice.total != total_price:
-                invoice.total = total_price
-
-            invoice.set_unpaid()
-            invoice.save()
+            )['total']
+            changed = refresh_invoices([invoice])
+            if changed:
+                save_refreshed(changed)
+                bump_overview(invoice.owner_id)
 
             return invoice
         except api_models.Invoice.DoesNotExist:
@@ -500,16 +571,15 @@ class InvoiceView(generics.RetrieveAPIView):
         serializer = self.get_serializer(invoice_instance)
         return Response(serializer.data)
 
-class InvoiceDeleteView(generics.DestroyAPIView):
+class InvoiceDeleteView(BusinessMixin, generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = api_serializer.InvoiceSerializer  # Assuming you have a serializer
 
     def get_object(self):
         invoice_id = self.kwargs.get('Uid')
-        business_id = self.kwargs.get('business_id')
 
-        business = api_models.Business.objects.get(id=business_id)
-        invoice = api_models.Invoice.objects.get(Uid=invoice_id, business=business)
+        business = self.get_business()
+        invoice = business.business.get(Uid=invoice_id)
         return invoice
 
     def perform_destroy(self, instance):
@@ -519,15 +589,25 @@ class InvoiceDeleteView(generics.DestroyAPIView):
         except Exception as e:
             return Response({"error": f"Error deleting invoice: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-class InvoiceUpdateView(APIView):
+def stored_datetime(model, field_name, value):
+    """
+    `value` as the DateTimeField `field_name` of `model` saves it: parsed
+    from a date or datetime string, and aware in the current timezone.
+    """
+    value = model._meta.get_field(field_name).to_python(value)
+    if value is not None and is_naive(value):
+        value = make_aware(value)
+    return value
+
+class InvoiceUpdateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
+    legacy_business_body_field = 'user_id'
 
     def put(self, request):
         try:
             Uid = request.data["Uid"]
-            invoice_instance = api_models.Invoice.objects.get(Uid=Uid)
+            invoice_instance = locate(api_models.Invoice.objects, Uid=Uid)
 
-            user_id = request.data["user_id"]
             title = request.data["title"]
             description = request.data["description"]
             customer_name = request.data["customer"]
@@ -536,13 +616,17 @@ class InvoiceUpdateView(APIView):
             is_recurring = request.data["is_recurring"]
             _status = request.data["status"]
 
-            business = api_models.Business.objects.get(id=user_id)
+            business = self.get_business()
             
-            customer = api_models.Customer.objects.get(full_name=customer_name, business=business)
+            customer = business.customer_set.get(full_name=customer_name)
 
             invoice_instance.title = title
             invoice_instance.description = description
             invoice_instance.customer = customer
+            date_due = stored_datetime(api_models.Invoice, 'date_due', date_due)
+            if invoice_instance.date_due != date_due:
+                # A new due date can become overdue again
+                invoice_instance.overdue_notified_at = None
             invoice_instance.date_due = date_due
             invoice_instance.discount = discount
             invoice_instance.is_recurring = is_recurring
@@ -558,14 +642,14 @@ class InvoiceUpdateView(APIView):
             return Response({"error": f"Error updating invoice: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
     
-class CategoryListView(APIView):
+class CategoryListView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, business_id):
         try:
-            business = api_models.Business.objects.get(id=business_id)
-            categories = api_models.Category.objects.filter(business=business)
-            serializer = api_serializer.CategorySerializer(categories, many=True)
+            business = self.get_business()
+            categories = api_serializer.CategorySerializer.narrow_queryset(business.category_set.all(), request)
+            serializer = api_serializer.CategorySerializer(categories, many=True, context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
         except (api_models.Business.DoesNotExist, api_models.Business.DoesNotExist):
             return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -581,6 +665,7 @@ class CategoryView(generics.RetrieveUpdateDestroyAPIView):
             user_id = self.kwargs['business_id']
             user = User.objects.get(id=user_id)
             business = api_models.Business.objects.get(owner=user, active=True)
+            activate(business.id)
             category_name = self.kwargs['name']
             category = api_models.Category.objects.get(name=category_name, business=business)
             return category
@@ -599,30 +684,25 @@ class CategoryView(generics.RetrieveUpdateDestroyAPIView):
         except Exception as e:
             return Response({"error": f"Error updating category: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-class CustomerListView(generics.ListAPIView):
+class CustomerListView(BusinessMixin, generics.ListAPIView):
     serializer_class = api_serializer.CustomerSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        try:
-            user_id = self.kwargs['business_id']
-            business = api_models.Business.objects.get(id=user_id)
-            customers = api_models.Customer.objects.filter(business=business)
-            return customers
-        except (User.DoesNotExist, api_models.Business.DoesNotExist):
-            return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": f"Error retrieving customers: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        business = self.get_business()
+        return self.serializer_class.narrow_queryset(business.customer_set.all(), self.request)
 
-class CustomerCreateView(APIView):
+class CustomerCreateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
+    legacy_business_body_field = 'user_id'
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
-            required=['user_id', 'full_name', 'email', 'phone_number'],
+            required=['business_id', 'full_name', 'email', 'phone_number'],
             properties={
-                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+                'business_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID'),
+                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID (deprecated, use business_id)'),
                 'full_name': openapi.Schema(type=openapi.TYPE_STRING, description='Customer full name'),
                 'email': openapi.Schema(type=openapi.TYPE_STRING, description='Customer email'),
                 'phone_number': openapi.Schema(type=openapi.TYPE_STRING, description='Customer phone number'),
@@ -636,8 +716,7 @@ class CustomerCreateView(APIView):
             full_name = request.data["full_name"]
             email = request.data["email"]
             phone_number = request.data["phone_number"]
-            user_id = request.data["user_id"]
-            business = api_models.Business.objects.get(id=user_id)
+            business = self.get_business()
 
             customer = api_models.Customer.objects.create(
                 full_name=full_name, 
@@ -670,7 +749,7 @@ class CustomerView(generics.RetrieveUpdateDestroyAPIView):
     def get_object(self):
         try:
             customer_id = self.kwargs['id']
-            customer = api_models.Customer.objects.get(id=customer_id)
+            customer = locate(api_models.Customer.objects, id=customer_id)
             return customer
         except api_models.Customer.DoesNotExist:
             return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
@@ -694,30 +773,25 @@ class CustomerView(generics.RetrieveUpdateDestroyAPIView):
         except Exception as e:
             return Response({"error": f"Error updating customer: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(BusinessMixin, generics.ListAPIView):
     serializer_class = api_serializer.ProductSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        try:
-            user_id = self.kwargs['business_id']
-            business = api_models.Business.objects.get(id=user_id)
-            products = api_models.Product.objects.filter(owner=business)
-            return products
-        except (User.DoesNotExist, api_models.Business.DoesNotExist):
-            return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": f"Error retrieving products: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        business = self.get_business()
+        return self.serializer_class.narrow_queryset(business.product_set.select_related('category'), self.request)
 
-class ProductCreateView(APIView):
+class ProductCreateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
+    legacy_business_body_field = 'user_id'
 
     @swagger_auto_schema(   
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
-            required=['user_id', 'name', 'category', 'price',],
+            required=['business_id', 'name', 'category', 'price',],
             properties={
-                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+                'business_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID'),
+                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID (deprecated, use business_id)'),
                 'name': openapi.Schema(type=openapi.TYPE_STRING, description='Product name'),
                 'category': openapi.Schema(type=openapi.TYPE_STRING, description='Product category'),
                 'price': openapi.Schema(type=openapi.TYPE_NUMBER, description='Product price'),
@@ -732,11 +806,10 @@ class ProductCreateView(APIView):
             name = request.data["name"]
             category = request.data["category"]
             price = request.data["price"]
-            user_id = request.data["user_id"]
             image = request.data.get("image", None)  # Changed to use get for optional image
 
-            business = api_models.Business.objects.get(id=user_id)
-            category = api_models.Category.objects.get(name=category, business=business)
+            business = self.get_business()
+            category = business.category_set.get(name=category)
 
             product = api_models.Product.objects.create(name=name, category=category, price=price, owner=business)
 
@@ -759,16 +832,15 @@ class ProductCreateView(APIView):
             print(e)
             return Response({"error": f"Error creating product: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-class ProductView(generics.RetrieveUpdateDestroyAPIView):
+class ProductView(BusinessMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = api_serializer.ProductSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
         try:
-            user_id = self.kwargs['business_id']
             product_id = self.kwargs['id']
-            business = api_models.Business.objects.get(id=user_id)
-            product = api_models.Product.objects.get(id=product_id, owner=business)
+            business = self.get_business()
+            product = business.product_set.get(id=product_id)
             return product
         except (User.DoesNotExist, api_models.Business.DoesNotExist, api_models.Product.DoesNotExist):
             raise NotFound({"error": "Product not found"})
@@ -817,16 +889,16 @@ class InvoiceItemListView(generics.ListAPIView):
     def get_queryset(self):
         try:
             invoice_id = self.kwargs['invoice_id']
-            invoice = api_models.Invoice.objects.get(Uid=invoice_id)
-            invoice_items = api_models.Invoice_item.objects.filter(invoice=invoice)
+            invoice = locate(api_models.Invoice.objects, Uid=invoice_id)
+            invoice_items = self.serializer_class.narrow_queryset(invoice.invoice_item_set.select_related('product'), self.request)
 
-            total_price = api_models.Invoice_item.objects.filter(invoice=invoice).aggregate(
+            invoice.items_total = api_models.Invoice_item.objects.filter(invoice=invoice).aggregate(
                 total=Sum('quantity') * Sum('product__price')
-            )['total'] or 0
-
-            if invoice.total != total_price:
-                invoice.total = total_price
-                invoice.save()
+            )['total']
+            changed = refresh_invoices([invoice])
+            if changed:
+                save_refreshed(changed)
+                bump_overview(invoice.owner_id)
 
             return invoice_items
         except api_models.Invoice.DoesNotExist:
@@ -834,15 +906,17 @@ class InvoiceItemListView(generics.ListAPIView):
         except Exception as e:
             return Response({"error": f"Error retrieving invoice items: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-class InvoiceItemCreateView(APIView):
+class InvoiceItemCreateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
+    legacy_business_body_field = 'user_id'
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
-            required=['user_id', 'invoice_Uid', 'product_id', 'quantity'],
+            required=['business_id', 'invoice_Uid', 'product_id', 'quantity'],
             properties={
-                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='User ID'),
+                'business_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID'),
+                'user_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Business ID (deprecated, use business_id)'),
                 'invoice_Uid': openapi.Schema(type=openapi.TYPE_STRING, description='Invoice UID'),
                 'product_id': openapi.Schema(type=openapi.TYPE_INTEGER, description='Product ID'),
                 'quantity': openapi.Schema(type=openapi.TYPE_INTEGER, description='Quantity'),
@@ -853,14 +927,13 @@ class InvoiceItemCreateView(APIView):
 
     def post(self, request, *args, **kwargs):
         try:
-            user_id = request.data["user_id"]
             invoice_Uid = request.data["invoice_Uid"]
             product_id = request.data["product_id"]
             quantity = request.data["quantity"]
 
-            business = api_models.Business.objects.get(id=user_id)
-            invoice = api_models.Invoice.objects.get(Uid=invoice_Uid)  # Using Uid field instead of id
-            product = api_models.Product.objects.get(id=product_id, owner=business)
+            business = self.get_business()
+            invoice = business.business.get(Uid=invoice_Uid)
+            product = business.product_set.get(id=product_id)
 
             api_models.Invoice_item.objects.create(
                 invoice=invoice,
@@ -886,7 +959,7 @@ class InvoiceItemView(generics.RetrieveUpdateDestroyAPIView):
         try:
             invoice_item_id = self.kwargs['id']
             invoice_id = self.kwargs['invoice_id']
-            invoice = api_models.Invoice.objects.get(Uid=invoice_id)
+            invoice = locate(api_models.Invoice.objects, Uid=invoice_id)
             invoice_item = api_models.Invoice_item.objects.get(id=invoice_item_id, invoice=invoice)
             return invoice_item
         except api_models.Invoice_item.DoesNotExist:
@@ -937,34 +1010,25 @@ class InvoiceItemView(generics.RetrieveUpdateDestroyAPIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class AdminView(generics.ListAPIView):
+class AdminView(BusinessMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = api_serializer.InvoiceAdminSerializer
 
     def get_queryset(self):
-        user_id = self.kwargs['business_id']
-        business = api_models.Business.objects.get(id=user_id)
-
-        invoices = api_models.Invoice.objects.filter(business=business)
-        customers = api_models.Customer.objects.filter(business=business)
-        products = api_models.Product.objects.filter(owner=business)
-
-        for invoice in invoices:
-            invoice.set_unpaid()
-
-        unpaid_invoices = api_models.Invoice.objects.filter(business=business, status="unpaid")
-        draft_invoices = api_models.Invoice.objects.filter(business=business, status="draft")
-        paid_invoices = api_models.Invoice.objects.filter(business=business, status="paid")
-        pending_invoices = api_models.Invoice.objects.filter(business=business, status="pending")
+        business = self.get_business()
+
+        invoice_counts = business.business.aggregate(
+            invoices=Count('id'),
+            draft_invoices=Count('id', filter=Q(status="draft")),
+            paid_invoices=Count('id', filter=Q(status="paid")),
+            unpaid_invoices=Count('id', filter=Q(status="unpaid")),
+            pending_invoices=Count('id', filter=Q(status="pending")),
+        )
 
         return [{
-            "invoices": invoices.count(),
-            "draft_invoices": draft_invoices.count(),
-            "paid_invoices": paid_invoices.count(),
-            "unpaid_invoices": unpaid_invoices.count(),
-            "pending_invoices": pending_invoices.count(),
-            "customers": customers.count(),
-            "products": products.count(),
+            **invoice_counts,
+            "customers": business.customer_set.count(),
+            "products": business.product_set.count(),
         }]
     
     def list(self, request, *args, **kwargs):
@@ -973,28 +1037,40 @@ class AdminView(generics.ListAPIView):
 
         return Response(serializer.data, status=status.HTTP_200_OK)
     
-class DashboardStatsView(generics.ListAPIView):
+class OwnerOverviewView(APIView):
+    """
+    API to total invoices, amounts, customers and products across all the businesses of the user
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        responses={200: api_serializer.OwnerOverviewSerializer()},
+        operation_description="Totals of each business of the user and of each currency they use"
+    )
+    def get(self, request):
+        overview = owner_overview(request.user.id)
+        return Response(api_serializer.OwnerOverviewSerializer(overview).data, status=status.HTTP_200_OK)
+
+class DashboardStatsView(BusinessMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = api_serializer.DashboardStatsSerializer
 
     def get_queryset(self):
-        user_id = self.kwargs["business_id"]
-        business = api_models.Business.objects.get(id=user_id)
+        business = self.get_business()
 
-        invoiceData = api_models.Invoice.objects.filter(business=business).annotate(month=ExtractMonth("date_created")).values("month").annotate(invoices=Count("id")).values("month", "invoices")
+        invoiceData = business.business.annotate(month=ExtractMonth("date_created")).values("month").annotate(invoices=Count("id")).values("month", "invoices")
 
         return invoiceData
 
-class InvoiceStatsView(generics.ListAPIView):
+class InvoiceStatsView(BusinessMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = api_serializer.InvoiceStatsSerializer
 
     def get_queryset(self):
-        user_id = self.kwargs["business_id"]
-        business = api_models.Business.objects.get(id=user_id)
+        business = self.get_business()
 
         invoiceData = (
-            api_models.Invoice.objects.filter(business=business).annotate(month=ExtractMonth("date_created")).values("month")
+            business.business.annotate(month=ExtractMonth("date_created")).values("month")
             .annotate(
                 invoices=Count("id"),
                 paid=Count('id', filter=Q(status='paid'))
@@ -1004,47 +1080,44 @@ class InvoiceStatsView(generics.ListAPIView):
 
         return invoiceData
     
-class ReceiptListView(generics.ListAPIView):
+class ReceiptListView(BusinessMixin, generics.ListAPIView):
     serializer_class = api_serializer.ReceiptSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        user_id = self.kwargs['business_id']
-        business = api_models.Business.objects.get(id=user_id)
-        receipts = api_models.Receipt.objects.filter(business=business)
-        return receipts
+        business = self.get_business()
+        receipts = business.business_receipt.select_related('customer', 'signature', 'invoice').prefetch_related(*OWNER_PREFETCH)
+        return self.serializer_class.narrow_queryset(receipts, self.request)
 
-class ReceiptGetView(generics.RetrieveAPIView):
+class ReceiptGetView(BusinessMixin, generics.RetrieveAPIView):
     serializer_class = api_serializer.ReceiptSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        user_id = self.kwargs['business_id']
         Uid = self.kwargs['Uid']
 
         try:
-            business = api_models.Business.objects.get(id=user_id)
-            receipt = api_models.Receipt.objects.get(business=business, Uid=Uid)
+            business = self.get_business()
+            receipt = business.business_receipt.get(Uid=Uid)
             return receipt
         except (User.DoesNotExist, api_models.Business.DoesNotExist, api_models.Receipt.DoesNotExist):
             return Response({"error": "Receipt not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": f"Error retrieving receipt: {e}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class ReceiptCreateView(APIView):
+class ReceiptCreateView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
         try:
             user_id = request.data['user_id']
-            business_id = request.data['business_id']
             customer_id = request.data['customer_id']
             uid = request.data['uid']
 
             user = User.objects.get(id=user_id)
-            business = api_models.Business.objects.get(id=business_id)
-            customer = api_models.Customer.objects.get(id=customer_id)
-            invoice = api_models.Invoice.objects.get(Uid=uid, business=business)
+            business = self.get_business()
+            customer = business.customer_set.get(id=customer_id)
+            invoice = business.business.get(Uid=uid)
                 
             receipt = api_models.Receipt.objects.create(
                 owner=user,
@@ -1102,7 +1175,7 @@ class CategoryCreateView(generics.CreateAPIView):
 
         return Response({"message": "Category created successfully"}, status=status.HTTP_201_CREATED)
     
-class NotificationListView(generics.ListAPIView):
+class NotificationListView(BusinessMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -1122,16 +1195,16 @@ class NotificationListView(generics.ListAPIView):
         
         if business_id:
             try:
-                business = api_models.Business.objects.get(id=business_id)
-                notifications = api_models.Notification.objects.filter(business=business)
-                serializer = api_serializer.NotificationSerializer(notifications, many=True)
+                business = self.get_business()
+                notifications = api_serializer.NotificationSerializer.narrow_queryset(business.noti_business.all(), request)
+                serializer = api_serializer.NotificationSerializer(notifications, many=True, context={'request': request})
                 return Response(serializer.data, status=status.HTTP_200_OK)
             except api_models.Business.DoesNotExist:
                 return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
         else:
             return Response({"error": "Business ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-class NotificationMarkAllReadAPIView(APIView):
+class NotificationMarkAllReadAPIView(BusinessMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -1151,8 +1224,8 @@ class NotificationMarkAllReadAPIView(APIView):
 
         if business_id:
             try:
-                business = api_models.Business.objects.get(id=business_id)
-                notifications = api_models.Notification.objects.filter(business=business)
+                business = self.get_business()
+                notifications = business.noti_business.all()
                 notifications.update(seen=True)
                 return Response({"message": "Notifications marked as read successfully"}, status=status.HTTP_200_OK)
             except api_models.Business.DoesNotExist:
@@ -1179,24 +1252,13 @@ class InvoiceAccessTokenCreateView(APIView):
         try:
             email = request.data["email"]
             invoice_id = request.data["Uid"]
-            invoice = api_models.Invoice.objects.get(Uid=invoice_id)
+            invoice = locate(api_models.Invoice.objects, Uid=invoice_id)
 
             if invoice.customer.email != email:
                 return Response({"error": "No invoice found with the provided email"}, status=status.HTTP_400_BAD_REQUEST)
 
-            existing_token = api_models.InvoiceAccessToken.objects.filter(
-                invoice=invoice,
-            ).first()
-
-            if existing_token and existing_token.is_valid():
-                return Response({
-                    "token": existing_token.token,
-                    "message": "Using existing valid token"
-                }, status=status.HTTP_200_OK)
-
-            # Create new token and delete the old one if no valid one exists
-            if existing_token:
-                existing_token.delete()
+            # Only token hashes are stored, so an existing token can't be handed
+            # out again. The new token replaces the earlier ones of the invoice.
             token = api_models.InvoiceAccessToken.create_token(invoice)
             return Response({"token": token}, status=status.HTTP_201_CREATED)
 
@@ -1272,7 +1334,50 @@ class VerifyInvoiceTokenView(APIView):
                 "details": str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+def get_public_business(slug):
+    """
+    Return the public payload and ETag of a business, or None.
+
+    Both hits and misses are cached, so repeated anonymous lookups of the
+    same slug don't reach the database. The entry is dropped when the
+    business is saved or deleted.
+    """
+    key = public_business_cache_key(slug)
+    cached = cache.get(key)
+    cache_lookup('public_business', cached is not None)
+    if cached is not None:
+        return cached or None
+
+    try:
+        business = api_models.Business.objects.get(slug=slug)
+    except api_models.Business.DoesNotExist:
+        cache.set(key, (), timeout=PUBLIC_BUSINESS_MISS_TIMEOUT)
+        return None
+
+    data = api_serializer.PublicBusinessSerializer(business).data
+    etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+    cache.set(key, (data, etag), timeout=PUBLIC_BUSINESS_CACHE_TIMEOUT)
+    return data, etag
+
+def public_business_response(request, slug):
+    public_business = get_public_business(slug)
+    if public_business is None:
+        return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    data, etag = public_business
+    if etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({"data": data}, status=status.HTTP_200_OK)
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=PUBLIC_BUSINESS_MAX_AGE, stale_while_revalidate=PUBLIC_BUSINESS_CACHE_TIMEOUT)
+    return response
+
 class BusinessGetByNameView(APIView):
+    """
+    API to retrieve the public profile of a business by name or slug
+    """
     permission_classes = [AllowAny]
 
     @swagger_auto_schema(
@@ -1282,37 +1387,42 @@ class BusinessGetByNameView(APIView):
                 openapi.IN_QUERY,
                 description="Business name to search for",
                 type=openapi.TYPE_STRING,
-                required=True
+            ),
+            openapi.Parameter(
+                'slug',
+                openapi.IN_QUERY,
+                description="Business slug",
+                type=openapi.TYPE_STRING,
             )
         ],
         responses={
-            200: openapi.Response('Success', api_serializer.BusinessSerializer),
+            200: openapi.Response('Success', api_serializer.PublicBusinessSerializer),
+            304: 'Not Modified',
             400: 'Bad Request',
             404: 'Business not found'
         }
     )
     def get(self, request):
-        name = request.query_params.get('name')
-        if not name:
+        slug = request.query_params.get('slug') or slugify(request.query_params.get('name', ''))
+        if not slug:
             return Response({"error": "Name parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            business = api_models.Business.objects.get(name=name)
-            serializer = api_serializer.BusinessSerializer(business)
+        return public_business_response(request, slug)
 
-            # Create notification for business search
-            api_models.Notification.objects.create(
-                business=business,
-                title="Business searched",
-                description=f'Business "{business.name}" was searched',
-                type="business_searched"
-            )
+class PublicBusinessView(APIView):
+    """
+    API to retrieve the public profile of a business by slug
+    """
+    permission_classes = [AllowAny]
 
-            return Response({"data": serializer.data}, status=status.HTTP_200_OK)
-        except api_models.Business.DoesNotExist:
-            return Response({"error": "Business not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": f"Error retrieving business: {str(e)}"}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    @swagger_auto_schema(
+        responses={
+            200: openapi.Response('Success', api_serializer.PublicBusinessSerializer),
+            304: 'Not Modified',
+            404: 'Business not found'
+        }
+    )
+    def get(self, request, slug):
+        return public_business_response(request, slug)
         
 class UserBusinessListView(APIView):
     """
@@ -1348,13 +1458,15 @@ class UserBusinessListView(APIView):
 
             cache_key = f'user_businesses_{user_id}'
             businesses = cache.get(cache_key)
+            cache_lookup('user_businesses', businesses is not None)
 
             if businesses is None:
                 user = User.objects.get(id=user_id)
-                businesses = api_models.Business.objects.filter(owner=user)
+                businesses = api_models.Business.objects.filter(owner=user).select_related('owner').prefetch_related(*OWNER_PREFETCH)
                 cache.set(cache_key, businesses, timeout=60 * 15)  # Cache for 15 minutes
 
-            serializer = api_serializer.BusinessSerializer(businesses, many=True)
+            # Cached whole, so ?fields= and ?expand= only shape the output
+            serializer = api_serializer.BusinessSerializer(businesses, many=True, context={'request': request})
             return Response({
                 "data": serializer.data,
                 "message": "Businesses retrieved successfully"
@@ -1371,4 +1483,112 @@ class UserBusinessListView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class SearchView(BusinessMixin, APIView):
+    """
+    API to search a business's invoices, customers and products
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Search text", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('type', openapi.IN_QUERY, description="Comma separated kinds: invoice, customer, product", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('page_size', openapi.IN_QUERY, description="Results per page (max 100)", type=openapi.TYPE_INTEGER),
+        ],
+        operation_description="Ranked search across invoices, customers and products of a business"
+    )
+    def get(self, request, business_id):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Search query is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+        except ValueError:
+            return Response({"error": "page and page_size must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = request.query_params.get('type')
+        kinds = kinds.split(',') if kinds else SEARCH_KINDS
+
+        business = self.get_business()
+
+        # Fetch one extra row to know whether there is a next page without a COUNT
+        results = search(
+            business.id, query, kinds, limit=page_size + 1, offset=(page - 1) * page_size,
+            using=placement(business.id).database,
+        )
+
+        return Response({
+            "results": results[:page_size],
+            "page": page,
+            "has_next": len(results) > page_size,
+        }, status=status.HTTP_200_OK)
+
+class AutocompleteView(BusinessMixin, APIView):
+    """
+    API to suggest customers, products or categories of a business by name prefix
+    """
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('type', openapi.IN_QUERY, description="customer, product or category", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('q', openapi.IN_QUERY, description="Name prefix", type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, description="Maximum matches (max 50)", type=openapi.TYPE_INTEGER),
+        ],
+        operation_description="Top matches for a name prefix within a business"
+    )
+    def get(self, request, business_id):
+        kind = request.query_params.get('type')
+        if kind not in AUTOCOMPLETE_SOURCES:
+            return Response({"error": f"type must be one of: {', '.join(AUTOCOMPLETE_SOURCES)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        business = self.get_business()
+        matches = autocomplete(kind, business.id, request.query_params.get('q', ''), limit)
+        return Response(matches, status=status.HTTP_200_OK)
+
+class BatchView(APIView):
+    """
+    API to run several GETs of the API in one round trip
+    """
+    permission_classes = [IsAuthenticated]
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('path', openapi.IN_QUERY, description="API path relative to the API root, URL encoded, repeated for each request", type=openapi.TYPE_ARRAY, items=openapi.Items(type=openapi.TYPE_STRING), collection_format='multi', required=True),
+            openapi.Parameter('concurrent', openapi.IN_QUERY, description="1 to run the requests concurrently", type=openapi.TYPE_BOOLEAN),
+        ],
+        operation_description="Responses of several GET requests, in the order of their paths"
+    )
+    def get(self, request):
+        paths = request.query_params.getlist('path')
+        if not paths:
+            return Response({"error": "At least one path is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(paths) > BATCH_MAX_REQUESTS:
+            return Response({"error": f"At most {BATCH_MAX_REQUESTS} paths per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        concurrent = request.query_params.get('concurrent', '').lower() in ('1', 'true', 'yes')
+        responses = run_batch(
+            request, request.path.removesuffix('batch/'), paths, concurrent=concurrent, exclude={request.resolver_match.func},
+        )
+        return Response({"responses": responses}, status=status.HTTP_200_OK)
+
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint. The scraper sends METRICS_TOKEN as a
+    bearer token, or scrapes from one of METRICS_ALLOWED_IPS.
+    """
+    token = settings.METRICS_TOKEN
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+    if not authorized and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
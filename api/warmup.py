@@ -0,0 +1,87 @@
+"""
+Worker warm-up.
+
+Without it the first requests of a new worker pay for compiling the URL
+patterns, building serializer fields (and the model metadata they
+introspect), loading translations and password hashers, and connecting
+to the databases and the cache. gunicorn.conf.py runs warm_up() at boot:
+in the master when the app is preloaded, so the workers inherit the
+result copy-on-write and only open their own connections.
+"""
+import logging
+import time
+
+from django.conf import settings # type:ignore
+from django.contrib.auth.hashers import get_hashers # type:ignore
+from django.core.cache import cache # type:ignore
+from django.db import DatabaseError, connections # type:ignore
+from django.urls import URLResolver, get_resolver # type:ignore
+from django.utils import translation # type:ignore
+from rest_framework.serializers import BaseSerializer, ListSerializer # type:ignore
+from api import serializer as api_serializer
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_routes(resolver=None):
+    """Compile the pattern of every route, returns how many there are."""
+    resolver = resolver or get_resolver()
+    # Fills the reverse() lookups of the resolver and the ones it includes
+    resolver.reverse_dict
+    routes = 0
+    for pattern in resolver.url_patterns:
+        pattern.pattern.regex
+        routes += resolve_routes(pattern) if isinstance(pattern, URLResolver) else 1
+    return routes
+
+def _build_fields(serializer):
+    for field in serializer.fields.values():
+        if isinstance(field, ListSerializer):
+            field = field.child
+        if isinstance(field, BaseSerializer):
+            _build_fields(field)
+
+def build_serializers():
+    """
+    Build the fields of every serializer of api.serializer, nested ones
+    included. DRF builds them again for every instance, but the model
+    metadata and field mappings it looks up on the way are cached.
+    """
+    serializers = [
+        value for value in vars(api_serializer).values()
+        if isinstance(value, type) and issubclass(value, BaseSerializer) and value.__module__ == api_serializer.__name__
+    ]
+    for serializer in serializers:
+        _build_fields(serializer())
+    return len(serializers)
+
+def load_process_caches():
+    """Load what Django caches per process on first use."""
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext("Not found.")
+    get_hashers()
+
+def open_connections():
+    """
+    Connect to every database and to the cache. Workers must do this
+    themselves: connections opened in the master would be shared by
+    every worker it forks.
+    """
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            logger.warning("Could not connect to %s during warm-up: %s", alias, error)
+    cache.get('warm_up')
+
+def warm_up(connect=True):
+    started = time.perf_counter()
+    routes = resolve_routes()
+    serializers = build_serializers()
+    load_process_caches()
+    if connect:
+        open_connections()
+    logger.info(
+        "Warmed up %d routes and %d serializers in %.0fms",
+        routes, serializers, (time.perf_counter() - started) * 1000,
+    )
@@ -0,0 +1,47 @@
+"""
+gunicorn settings, read from the working directory:
+
+    gunicorn speedvoice_backend.wsgi
+
+Bind address and worker count keep gunicorn's own defaults ($PORT,
+$WEB_CONCURRENCY, GUNICORN_CMD_ARGS). With GUNICORN_PRELOAD (the
+default) the app is imported and warmed up (api.warmup) once in the
+master and shared copy-on-write by the workers, which then only open
+their connections. Without it every worker warms itself up.
+
+Workers refuse to boot on settings api.checks rejects, such as several
+workers without a cache they all share. A worker flushes its metrics
+and tenant usage when it exits, and the master then folds its metrics
+into the totals of the exited workers (api.metrics).
+"""
+from speedvoice_backend.database import env_flag
+
+preload_app = env_flag('GUNICORN_PRELOAD', True)
+
+
+def when_ready(server):
+    if preload_app:
+        from api.warmup import warm_up
+        warm_up(connect=False)
+
+def post_worker_init(worker):
+    from api.checks import require_bootable
+    from api.warmup import open_connections, warm_up
+    # Fails the boot, which stops gunicorn, rather than serve stale data
+    require_bootable(worker.cfg.workers)
+    if preload_app:
+        open_connections()
+    else:
+        warm_up()
+
+def worker_exit(server, worker):
+    from api.accounting import meter
+    from api.metrics import registry
+    registry.flush(force=True)
+    meter.flush(force=True)
+
+def child_exit(server, worker):
+    # Runs in the master, which has only loaded the app if it was preloaded
+    import speedvoice_backend.wsgi # noqa: F401
+    from api.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
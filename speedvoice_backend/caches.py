@@ -0,0 +1,47 @@
+"""
+The CACHES setting, read from the environment.
+
+The autocomplete indexes (api.autocomplete), owner overviews
+(api.overview), public business profiles, cached businesses and the
+replica pins (api.replicas) are shared, and invalidated, through the
+cache. With more than one worker it has to be a server they all reach:
+
+CACHE_URL      redis://host:6379/0 (or rediss://) for Redis, needs the
+               `redis` package. memcached://host:11211 for Memcached,
+               several servers separated by commas, needs `pymemcache`.
+               Unset, or locmem://, keeps a cache in each process,
+               which is only right for a single process (runserver,
+               the tests).
+CACHE_KEY_PREFIX
+               Prepended to every key, for several deployments sharing
+               one server.
+"""
+import os
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ImproperlyConfigured # type:ignore
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'rediss': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'locmem': LOCMEM_CACHE,
+}
+
+
+def cache_config(url):
+    """The `default` CACHES entry for a CACHE_URL url."""
+    if not url:
+        return {'BACKEND': LOCMEM_CACHE}
+    scheme = urlsplit(url).scheme
+    if scheme not in BACKENDS:
+        raise ImproperlyConfigured(f"CACHE_URL scheme must be one of {', '.join(BACKENDS)}, not {scheme!r}")
+
+    config = {'BACKEND': BACKENDS[scheme], 'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', '')}
+    if scheme == 'memcached':
+        config['LOCATION'] = url.split('://', 1)[1].strip('/').split(',')
+    elif scheme != 'locmem':
+        config['LOCATION'] = url
+    return config
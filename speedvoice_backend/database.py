@@ -0,0 +1,100 @@
+"""
+Connection management for the DATABASES setting.
+
+Every option is read from the environment so one image can run against
+PostgreSQL directly, through PgBouncer, or with an in-process pool:
+
+DB_CONN_MAX_AGE        Seconds a connection is kept between requests. 0
+                       closes it after every request, "none" keeps it
+                       for the life of the worker. Default 60.
+DB_CONN_HEALTH_CHECKS  Check a reused connection is alive before the
+                       first query of a request. Default on.
+DB_POOL                Use psycopg 3's connection pool, sized "min:max"
+                       (e.g. "2:10"). PostgreSQL only, needs
+                       `psycopg[binary,pool]`, and replaces
+                       DB_CONN_MAX_AGE.
+DB_PGBOUNCER           CONNECTION_STRING points at PgBouncer in
+                       transaction mode, where a session can change
+                       server between transactions: server side cursors
+                       and prepared statements are turned off.
+REPLICA_CONNECTION_STRINGS
+                       Comma separated urls of read replicas, added to
+                       DATABASES as replica_0, replica_1, ... and used
+                       by api.replicas.ReplicaRouter. They take the same
+                       options as `default`. Two SQLite files work
+                       locally, after `manage.py migrate --database
+                       replica_0`.
+SHARD_CONNECTION_STRINGS
+                       Comma separated urls of the databases businesses
+                       can be moved to with `manage.py move_business`,
+                       added as shard_1, shard_2, ... (api.shards).
+                       Migrate each with `--database shard_N`.
+"""
+import os
+
+import dj_database_url
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def conn_max_age():
+    value = os.environ.get('DB_CONN_MAX_AGE', '60').strip().lower()
+    return None if value in ('none', 'persistent') else int(value)
+
+def uses_psycopg3():
+    try:
+        import psycopg  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def database_config(url):
+    """The `default` DATABASES entry for a CONNECTION_STRING url."""
+    pgbouncer = env_flag('DB_PGBOUNCER')
+    config = dj_database_url.parse(
+        url,
+        conn_max_age=conn_max_age(),
+        conn_health_checks=env_flag('DB_CONN_HEALTH_CHECKS', True),
+        disable_server_side_cursors=pgbouncer,
+    )
+    if 'postgresql' not in config['ENGINE']:
+        return config
+
+    options = config.setdefault('OPTIONS', {})
+    if pgbouncer and uses_psycopg3():
+        # psycopg 3 prepares statements it sees often, which breaks when
+        # PgBouncer hands the next transaction to another server
+        options['prepare_threshold'] = None
+
+    pool = os.environ.get('DB_POOL')
+    if pool:
+        min_size, _, max_size = pool.partition(':')
+        options['pool'] = {
+            'min_size': int(min_size),
+            'max_size': int(max_size or min_size),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+        # The pool owns connection lifetime, Django refuses both at once
+        config['CONN_MAX_AGE'] = 0
+    return config
+
+def split_urls(urls):
+    return [url.strip() for url in (urls or '').split(',') if url.strip()]
+
+def replica_configs(urls):
+    """DATABASES entries for the comma separated replica `urls`."""
+    replicas = {}
+    for index, url in enumerate(split_urls(urls)):
+        config = database_config(url)
+        # Tests run against `default` only, a replica there is an alias of it
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{index}'] = config
+    return replicas
+
+def shard_configs(urls):
+    """DATABASES entries for the comma separated shard `urls`, numbered from 1."""
+    return {f'shard_{index}': database_config(url) for index, url in enumerate(split_urls(urls), start=1)}
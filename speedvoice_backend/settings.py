@@ -12,8 +12,10 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+from importlib.util import find_spec
 import environ
-import dj_database_url
+from speedvoice_backend.caches import cache_config
+from speedvoice_backend.database import database_config, env_flag, replica_configs, shard_configs
 
 env = environ.Env()
 
@@ -62,15 +64,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
+    'api.middleware.ShardRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'speedvoice_backend.urls'
@@ -102,7 +108,30 @@ DATABASES = {
     #     'ENGINE': 'django.db.backends.sqlite3',
     #     'NAME': BASE_DIR / 'db.sqlite3',
     # }
-    "default": dj_database_url.parse(os.environ.get('CONNECTION_STRING'))
+    "default": database_config(os.environ.get('CONNECTION_STRING')),
+    **replica_configs(os.environ.get('REPLICA_CONNECTION_STRINGS')),
+    **shard_configs(os.environ.get('SHARD_CONNECTION_STRINGS')),
+}
+
+# Read replicas (api.replicas). Clients that wrote in the last
+# REPLICA_STICKY_SECONDS read from `default`, and replicas more than
+# REPLICA_MAX_LAG seconds behind are skipped.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['api.shards.ShardRouter', 'api.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 5))
+
+# Business shards (api.shards). New businesses are spread over
+# SHARD_NEW_BUSINESSES, `default` included only if listed. Workers cache
+# where a business lives for SHARD_DIRECTORY_CACHE_TIMEOUT seconds.
+DATABASE_SHARDS = [alias for alias in DATABASES if alias.startswith('shard_')]
+SHARD_NEW_BUSINESSES = [alias.strip() for alias in os.environ.get('SHARD_NEW_BUSINESSES', '').split(',') if alias.strip()]
+SHARD_DIRECTORY_CACHE_TIMEOUT = float(os.environ.get('SHARD_DIRECTORY_CACHE_TIMEOUT', 60))
+
+# Shared by every worker, see speedvoice_backend.caches
+CACHES = {
+    'default': cache_config(os.environ.get('CACHE_URL')),
 }
 
 
@@ -150,10 +179,25 @@ STORAGES = {
     }
 }
 
+# JSON is rendered and parsed with orjson (api.renderers). Clients can also
+# send and accept application/msgpack once the msgpack package is installed.
+MSGPACK = find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.ORJSONRenderer",
+        *(["api.renderers.MessagePackRenderer"] if MSGPACK else []),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.renderers.ORJSONParser",
+        *(["api.renderers.MessagePackParser"] if MSGPACK else []),
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -169,3 +213,46 @@ CORS_ORIGIN_ALLOW_ALL = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'userauth.User'
+
+# Recurring invoices are cloned this many days after the previous occurrence
+RECURRING_INVOICE_INTERVAL_DAYS = int(os.environ.get('RECURRING_INVOICE_INTERVAL_DAYS', 30))
+
+# Per-request SQL instrumentation (api.middleware.QueryInstrumentationMiddleware).
+# QUERY_BUDGETS maps a URL name or route pattern to the most queries it may run.
+QUERY_BUDGETS = {}
+QUERY_BUDGET_DEFAULT = int(os.environ.get('QUERY_BUDGET_DEFAULT', 50))
+# Raise QueryBudgetExceeded instead of logging (on in speedvoice_backend.settings_test)
+QUERY_BUDGET_RAISE = env_flag('QUERY_BUDGET_RAISE')
+
+# Prometheus metrics (api.metrics). Every process flushes its counters to
+# METRICS_DIR, which must be shared by all gunicorn workers of a host.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# /metrics answers scrapers sending METRICS_TOKEN as a bearer token and,
+# without it, only the addresses of METRICS_ALLOWED_IPS
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+# How long the job lag gauges reuse the due dates they looked up
+METRICS_JOB_LAG_INTERVAL = float(os.environ.get('METRICS_JOB_LAG_INTERVAL', 30))
+
+# Per-business usage is added to the hourly TenantUsage rollup this often
+TENANT_USAGE_FLUSH_INTERVAL = float(os.environ.get('TENANT_USAGE_FLUSH_INTERVAL', 60))
+
+# Queries slower than this are logged with their EXPLAIN plan to SlowQuery (0 disables)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': os.environ.get('API_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
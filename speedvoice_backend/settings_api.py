@@ -0,0 +1,66 @@
+"""
+Settings for API-only workers.
+
+Same as speedvoice_backend.settings without the admin (jazzmin), the
+API docs (drf_yasg), CKEditor, anymail and the session, CSRF and
+messages stack. The API authenticates with tokens only, so none of
+them is used by /api/v1/ and /metrics, the only routes these workers
+serve (speedvoice_backend.urls_api).
+
+Run the API workers with DJANGO_SETTINGS_MODULE=speedvoice_backend.settings_api
+and keep at least one worker on speedvoice_backend.settings for /admin/,
+static files and migrations. `manage.py bench_startup` compares both.
+"""
+from speedvoice_backend.settings import * # noqa: F401,F403
+
+# Apps only the admin, the docs or the HTML pages need
+ADMIN_APPS = {
+    'whitenoise.runserver_nostatic',
+    'jazzmin',
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'drf_yasg',
+    'anymail',
+    'django_ckeditor_5',
+}
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ADMIN_APPS]
+
+# Token authenticated requests carry no session or CSRF cookie and get
+# JSON back, so the session, CSRF, auth, messages and frame middleware
+# have nothing to do. Static files are served by the full workers.
+ADMIN_MIDDLEWARE = {
+    'api.staticfiles.StaticFilesMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in ADMIN_MIDDLEWARE]
+
+ROOT_URLCONF = 'speedvoice_backend.urls_api'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+            ],
+        },
+    },
+]
+
+# The browsable API needs the static files and templates dropped above
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': [
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+}
@@ -0,0 +1,17 @@
+"""
+Settings for the test suite.
+
+Same as speedvoice_backend.settings, except that a request over its
+query budget fails the test that made it instead of logging a warning,
+and the api logger only reports warnings. Run the tests with
+
+    python manage.py test --settings=speedvoice_backend.settings_test
+
+or DJANGO_SETTINGS_MODULE=speedvoice_backend.settings_test under pytest.
+QUERY_BUDGET_RAISE=1 turns the budgets on with any settings.
+"""
+from speedvoice_backend.settings import * # noqa: F401,F403
+
+QUERY_BUDGET_RAISE = True
+
+LOGGING['loggers']['api']['level'] = os.environ.get('API_LOG_LEVEL', 'WARNING') # noqa: F405
@@ -14,32 +14,44 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from functools import cache
+
 from django.contrib import admin # type:ignore
 from django.urls import path, include # type:ignore
 from django.conf import settings # type:ignore
 from django.conf.urls.static import static # type:ignore
 
-from rest_framework import permissions # type:ignore
-from drf_yasg.views import get_schema_view # type:ignore
-from drf_yasg import openapi # type:ignore
-
-schema_view = get_schema_view(
-    openapi.Info(
-        title="SpeedVoice API",
-        default_version='v1',
-        description="This is the documentation for the Backend APIs",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="isiaqabdullah100@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from api.views import metrics
+
+
+@cache
+def schema_view():
+    """
+    The drf_yasg schema view, built on first use: drf_yasg and its YAML
+    and OpenAPI dependencies are only imported when the docs are served.
+    """
+    from rest_framework import permissions # type:ignore
+    from drf_yasg.views import get_schema_view # type:ignore
+    from drf_yasg import openapi # type:ignore
+
+    return get_schema_view(
+        openapi.Info(
+            title="SpeedVoice API",
+            default_version='v1',
+            description="This is the documentation for the Backend APIs",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="isiaqabdullah100@gmail.com"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
 
 urlpatterns = [
-    # path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    # path('', schema_view().with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
-    path('api/v1/', include('api.urls'))
+    path('api/v1/', include('api.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -0,0 +1,14 @@
+"""
+URL configuration of the API-only workers (speedvoice_backend.settings_api).
+
+Only the API and the metrics endpoint: the admin, the docs and static
+files are served by workers running speedvoice_backend.settings.
+"""
+from django.urls import path, include # type:ignore
+
+from api.views import metrics
+
+urlpatterns = [
+    path('api/v1/', include('api.urls')),
+    path('metrics', metrics, name='metrics'),
+]